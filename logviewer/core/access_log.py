@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Optional, Tuple, Type
+from urllib.parse import quote
+
+from aiohttp.abc import AbstractAccessLogger
+from core.models import getLogger
+
+from .admission import AdmissionController
+
+if TYPE_CHECKING:
+    from aiohttp.web import BaseRequest, StreamResponse
+    from aiohttp.web_urldispatcher import UrlMappingMatchInfo
+
+
+logger = getLogger(__name__)
+
+# Seconds between writes of the queued records.
+ACCESS_LOG_FLUSH_INTERVAL = 1.0
+
+# Records written in one log entry. A full batch is written right away.
+ACCESS_LOG_BATCH_SIZE = 200
+
+# Records waiting to be written. Past this, new ones are dropped and counted.
+ACCESS_LOG_QUEUE_SIZE = 10000
+
+# Asset responses, which are only sampled like 304s.
+SAMPLED_PREFIXES = ("/static/", "/media/")
+
+# time, client, method, path, status, bytes, duration, route, key, cache, user ID, sample rate
+AccessRecord = Tuple[
+    float, str, str, str, int, int, float, str, Optional[str], str, Optional[str], Optional[float]
+]
+
+
+class AccessLog:
+    """
+    Structured access log that stays off the request path. Each response only
+    queues a tuple of its fields, a background task formats and writes them in
+    batches. Asset and 304 responses are logged at `sample_rate`, errors and
+    everything else always.
+    """
+
+    def __init__(
+        self,
+        *,
+        sample_rate: float,
+        flush_interval: float = ACCESS_LOG_FLUSH_INTERVAL,
+        batch_size: int = ACCESS_LOG_BATCH_SIZE,
+        queue_size: int = ACCESS_LOG_QUEUE_SIZE,
+    ):
+        self.sample_rate: float = sample_rate
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+        self.queue_size: int = queue_size
+        self.records: Deque[AccessRecord] = deque()
+        self.written: int = 0
+        self.skipped: int = 0
+        self.dropped: int = 0
+        self._reported_drops: int = 0
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, request: BaseRequest, response: StreamResponse, duration: float) -> None:
+        status = response.status
+        sampled = status < 400 and (status == 304 or request.path.startswith(SAMPLED_PREFIXES))
+        if sampled and random.random() >= self.sample_rate:
+            self.skipped += 1
+            return
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return
+
+        match_info = _match_info(request)
+        resource = getattr(match_info.route, "resource", None) if match_info is not None else None
+        cache = request.get("cache") or ("revalidated" if status == 304 else "-")
+        self.records.append(
+            (
+                time.time(),
+                AdmissionController.client_address(request),
+                request.method,
+                request.rel_url.raw_path,
+                status,
+                response.body_length,
+                duration,
+                resource.canonical if resource is not None else "-",
+                match_info.get("key") if match_info is not None else None,
+                cache,
+                request.get("user_id"),
+                self.sample_rate if sampled else None,
+            )
+        )
+        if len(self.records) >= self.batch_size:
+            self._wakeup.set()
+
+    @staticmethod
+    def format(record: AccessRecord) -> str:
+        at, client, method, path, status, size, duration, route, key, cache, user_id, sample_rate = record
+        line = (
+            f"[{client}] {method} {path} {status} "
+            f"at={time.strftime('%H:%M:%S', time.localtime(at))}.{int(at % 1 * 1000):03d} "
+            f"ms={duration * 1000:.1f} bytes={size} route={route} cache={cache}"
+        )
+        if key is not None:
+            # Keys come decoded from the URL, keep the line splittable on spaces.
+            line += f" key={quote(key, safe='')}"
+        if user_id is not None:
+            line += f" user={user_id}"
+        if sample_rate is not None:
+            line += f" sampled={sample_rate:g}"
+        return line
+
+    def flush(self) -> None:
+        """Writes up to `batch_size` queued records as one log entry."""
+        if self.dropped != self._reported_drops:
+            logger.warning(f"Access log queue full, dropped {self.dropped - self._reported_drops} records.")
+            self._reported_drops = self.dropped
+        if not self.records:
+            return
+        count = min(len(self.records), self.batch_size)
+        lines = [self.format(self.records.popleft()) for _ in range(count)]
+        logger.info("\n".join(lines))
+        self.written += count
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        """Stops the writer and writes whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        while self.records:
+            self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self.records:
+                    self.flush()
+                    # Lets requests run between batches of a backlog.
+                    await asyncio.sleep(0)
+            except Exception:
+                logger.error("Failed to write the access log.", exc_info=True)
+
+
+def _match_info(request: BaseRequest) -> Optional[UrlMappingMatchInfo]:
+    try:
+        return request.match_info
+    except AssertionError:
+        # Requests aiohttp couldn't parse never reach the router.
+        return None
+
+
+class QueuedAccessLogger(AbstractAccessLogger):
+    """
+    Access logger given to aiohttp, which makes one per connection. It hands
+    every response to `access_log`, set on the subclass `bind` makes for each
+    server: requests aiohttp rejects before routing have no app to look it up on.
+    """
+
+    access_log: AccessLog
+
+    @classmethod
+    def bind(cls, access_log: AccessLog) -> Type[QueuedAccessLogger]:
+        return type(cls.__name__, (cls,), {"access_log": access_log})
+
+    def log(self, request: BaseRequest, response: StreamResponse, time: float) -> None:
+        self.access_log.record(request, response, time)
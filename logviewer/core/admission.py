@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+from aiohttp.web import Response
+from core.models import getLogger
+
+from .health import HEALTH_PATHS
+
+if TYPE_CHECKING:
+    from aiohttp.web import Request
+
+
+logger = getLogger(__name__)
+
+# Paths that are cheap to serve and never count against the render limit.
+LIGHT_PREFIXES = ("/static/", "/media/", "/login", "/callback", "/logout", "/export") + HEALTH_PATHS
+# Paths that are not rate limited: static files and health probes.
+UNLIMITED_PREFIXES = ("/static/",) + HEALTH_PATHS
+# Proxied avatars and emojis have a bucket of their own, this many times
+# larger than the one of pages, as a single log can show dozens of them.
+MEDIA_PREFIX = "/media/"
+MEDIA_RATE_FACTOR = 10
+
+
+class TokenBucket:
+    """
+    Per-client token buckets, refilled at `rate` tokens per second up to `burst`.
+    Only the most recently seen `max_clients` clients are tracked.
+    """
+
+    def __init__(self, rate: float, burst: int, *, max_clients: int = 10000):
+        self.rate: float = rate
+        self.burst: int = burst
+        self.max_clients: int = max_clients
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+
+    def consume(self, client: str) -> float:
+        """
+        Takes a token for `client`. Returns `0` if one was available,
+        otherwise the number of seconds until the next one is.
+        """
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            self._buckets[client] = (tokens - 1, now)
+            retry_after = 0.0
+        else:
+            self._buckets[client] = (tokens, now)
+            retry_after = (1 - tokens) / self.rate
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class NegativeCache:
+    """
+    Remembers log keys that don't exist for `ttl` seconds, so repeated bad
+    links and key guessing don't each cost a database lookup.
+    """
+
+    def __init__(self, ttl: float, *, max_size: int = 10000):
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self._keys: OrderedDict[str, float] = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self._keys.get(key)
+        if expires_at is None:
+            return False
+        if time.monotonic() >= expires_at:
+            del self._keys[key]
+            return False
+        return True
+
+    def add(self, key: str) -> None:
+        if self.ttl <= 0:
+            return
+        self._keys[key] = time.monotonic() + self.ttl
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._keys.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class AdmissionController:
+    """
+    Caps concurrent heavy requests (log renders, lists, API calls).
+
+    Up to `max_concurrent` run at once and up to `queue_size` more wait for
+    at most `queue_timeout` seconds; anything beyond that is turned away
+    with a 503 so a burst can't starve the bot's event loop. A
+    `max_concurrent` of 0 disables the cap.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int,
+        queue_size: int,
+        queue_timeout: float,
+        rate_limit: int,
+        rate_burst: int,
+        negative_ttl: float,
+    ):
+        self.max_concurrent: int = max_concurrent
+        self.queue_size: int = queue_size
+        self.queue_timeout: float = queue_timeout
+        self.buckets: Optional[TokenBucket] = (
+            TokenBucket(rate_limit / 60, rate_burst) if rate_limit > 0 else None
+        )
+        self.media_buckets: Optional[TokenBucket] = (
+            TokenBucket(rate_limit * MEDIA_RATE_FACTOR / 60, rate_burst * MEDIA_RATE_FACTOR)
+            if rate_limit > 0
+            else None
+        )
+        self.missing_keys: NegativeCache = NegativeCache(negative_ttl)
+        self.active: int = 0
+        self.in_flight: int = 0
+        self.waiting: int = 0
+        self.rejected: Dict[int, int] = {429: 0, 503: 0}
+        self._semaphore = asyncio.Semaphore(max(max_concurrent, 1))
+
+    @staticmethod
+    def client_address(request: Request) -> str:
+        remote = request.remote or ""
+        # Behind a local reverse proxy every request comes from loopback, so
+        # use the address the proxy appended instead.
+        if remote in ("127.0.0.1", "::1"):
+            forwarded = request.headers.get("X-Forwarded-For")
+            if forwarded:
+                return forwarded.rsplit(",", 1)[-1].strip()
+        return remote
+
+    @staticmethod
+    def is_heavy(request: Request) -> bool:
+        # Live streams stay open for as long as the page does, they must not hold a render slot.
+        return (
+            request.method == "GET"
+            and not request.path.startswith(LIGHT_PREFIXES)
+            and not request.path.endswith("/live")
+        )
+
+    def reject(self, status: int, retry_after: float, reason: str) -> Response:
+        self.rejected[status] += 1
+        return Response(
+            status=status,
+            text=reason,
+            content_type="text/plain",
+            charset="utf-8",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def handle(self, request: Request, handler: Callable) -> web.StreamResponse:
+        self.active += 1
+        try:
+            return await self._handle(request, handler)
+        finally:
+            self.active -= 1
+
+    async def _handle(self, request: Request, handler: Callable) -> web.StreamResponse:
+        buckets = self.media_buckets if request.path.startswith(MEDIA_PREFIX) else self.buckets
+        if buckets is not None and not request.path.startswith(UNLIMITED_PREFIXES):
+            retry_after = buckets.consume(self.client_address(request))
+            if retry_after:
+                return self.reject(429, retry_after, "Too many requests, slow down.")
+
+        if self.max_concurrent <= 0 or not self.is_heavy(request):
+            return await handler(request)
+
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            return self.reject(503, self.queue_timeout, "Logviewer is busy, try again shortly.")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            return self.reject(503, self.queue_timeout, "Logviewer is busy, try again shortly.")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+@web.middleware
+async def admission_middleware(request: Request, handler: Callable) -> web.StreamResponse:
+    admission: AdmissionController = request.app["server"].admission
+    return await admission.handle(request, handler)
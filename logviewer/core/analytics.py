@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import statistics
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from core.models import getLogger
+from pymongo.errors import DuplicateKeyError
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+    from .types_ext import RawPayload
+
+
+logger = getLogger(__name__)
+
+DAY_PREFIX = "analytics_day_"
+BACKFILL_ID = "analytics_backfill"
+
+# Messages exchanged with the recipient. Notes and system messages don't count.
+CONVERSATION_TYPES = ("thread_message", "anonymous")
+
+ANALYTICS_PROJECTION: Dict[str, int] = {
+    "_id": 0,
+    "key": 1,
+    "created_at": 1,
+    "messages.timestamp": 1,
+    "messages.type": 1,
+    "messages.author.id": 1,
+    "messages.author.name": 1,
+    "messages.author.mod": 1,
+}
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        # Modmail stores `str(datetime)`, which `fromisoformat` reads, so dateutil is rarely needed.
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        import dateutil.parser
+
+        try:
+            parsed = dateutil.parser.parse(value)
+        except (ValueError, OverflowError):
+            return None
+    # Log dates are naive UTC while message timestamps carry an offset.
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def summarize(document: RawPayload) -> Optional[Dict[str, Any]]:
+    """
+    Reduces a closed log to what the daily rollups need. Threads are
+    bucketed by the UTC day they were created on.
+    """
+    created_at = _parse_date(document.get("created_at"))
+    if created_at is None:
+        return None
+
+    messages = 0
+    first_response: Optional[float] = None
+    moderators: Counter = Counter()
+    names: Dict[str, str] = {}
+    for message in document.get("messages") or []:
+        if message.get("type", "thread_message") not in CONVERSATION_TYPES:
+            continue
+        messages += 1
+        author = message.get("author") or {}
+        if not author.get("mod"):
+            continue
+        author_id = str(author.get("id"))
+        moderators[author_id] += 1
+        names[author_id] = author.get("name") or author_id
+        if first_response is None:
+            sent_at = _parse_date(message.get("timestamp"))
+            if sent_at is not None:
+                first_response = max(0.0, (sent_at - created_at).total_seconds())
+
+    return {
+        "key": document["key"],
+        "day": created_at.date().isoformat(),
+        "messages": messages,
+        "first_response": first_response,
+        "moderators": moderators,
+        "names": names,
+    }
+
+
+class AnalyticsStore:
+    """
+    Daily thread rollups, kept as one document per day in the plugin's collection.
+
+    Each closed thread is added to the bucket of the day it was created on,
+    exactly once: buckets remember the keys they've counted, so the close
+    listener and the backfill can overlap safely.
+    """
+
+    def __init__(self, db: AsyncIOMotorCollection):
+        self.db: AsyncIOMotorCollection = db
+
+    async def record(self, document: RawPayload) -> bool:
+        """
+        Adds a closed log to its daily bucket. Returns `False` if it was already counted or unusable.
+        """
+        summary = summarize(document)
+        if summary is None:
+            return False
+        update: Dict[str, Any] = {
+            "$set": {"analytics_day": summary["day"]},
+            "$inc": {"threads": 1, "messages": summary["messages"]},
+            "$push": {"keys": summary["key"]},
+        }
+        if summary["first_response"] is not None:
+            update["$push"]["response_times"] = summary["first_response"]
+        for author_id, count in summary["moderators"].items():
+            update["$inc"][f"moderators.{author_id}"] = count
+            update["$set"][f"moderator_names.{author_id}"] = summary["names"][author_id]
+        try:
+            # When the key was already counted the filter matches nothing,
+            # the upsert collides with the existing bucket and is rejected.
+            await self.db.update_one(
+                {"_id": DAY_PREFIX + summary["day"], "keys": {"$ne": summary["key"]}},
+                update,
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def backfill(
+        self, logs: AsyncIOMotorCollection, bot_id: int, *, batch_size: int = 100, limit: int = 0
+    ) -> int:
+        """
+        Rolls up closed logs, newest first, in batches of `batch_size`.
+
+        Progress is saved after every batch, so an interrupted backfill picks
+        up where it stopped. Returns the number of logs newly counted.
+        """
+        # Not imported at module level, `api` pulls in `aiohttp.web`.
+        from .api import decode_cursor, encode_cursor, keyset_filter
+
+        state = await self.db.find_one({"_id": BACKFILL_ID}) or {}
+        if state.get("done"):
+            return 0
+        filter_: RawPayload = {"bot_id": str(bot_id), "open": False}
+        cursor: Optional[str] = state.get("cursor")
+
+        count = 0
+        while True:
+            position = decode_cursor(cursor) if cursor else None
+            batch_filter = {**filter_, **keyset_filter(position)} if position else filter_
+            batch = await logs.find(
+                batch_filter,
+                projection=ANALYTICS_PROJECTION,
+                sort=[("created_at", -1), ("key", -1)],
+                limit=batch_size,
+            ).to_list(length=batch_size)
+            for document in batch:
+                if await self.record(document):
+                    count += 1
+            if batch:
+                cursor = encode_cursor(batch[-1])
+            done = len(batch) < batch_size
+            await self.db.update_one(
+                {"_id": BACKFILL_ID},
+                {"$set": {"cursor": cursor, "done": done}},
+                upsert=True,
+            )
+            if done or (limit and count >= limit):
+                break
+        logger.info(f"Rolled up {count} logs into logviewer analytics.")
+        return count
+
+    async def reset(self) -> None:
+        """
+        Deletes every rollup and the backfill progress.
+        """
+        await self.db.delete_many({"_id": {"$regex": f"^{DAY_PREFIX}"}})
+        await self.db.delete_one({"_id": BACKFILL_ID})
+
+    async def progress(self) -> RawPayload:
+        return await self.db.find_one({"_id": BACKFILL_ID}) or {}
+
+    async def days(self, start: date, end: date) -> List[RawPayload]:
+        """
+        Returns the buckets from `start` to `end` inclusive, oldest first, without their key lists.
+        """
+        cursor = self.db.find(
+            {"_id": {"$gte": DAY_PREFIX + start.isoformat(), "$lte": DAY_PREFIX + end.isoformat()}},
+            projection={"keys": 0},
+            sort=[("_id", 1)],
+        )
+        return await cursor.to_list(length=None)
+
+    async def report(self, days: int, *, top: int = 10) -> Dict[str, Any]:
+        """
+        Builds the dashboard data for the last `days` days, filling days without threads with zeros.
+        """
+        end = datetime.utcnow().date()
+        start = end - timedelta(days=days - 1)
+        buckets = {bucket["analytics_day"]: bucket for bucket in await self.days(start, end)}
+
+        series = []
+        response_times: List[float] = []
+        moderators: Counter = Counter()
+        names: Dict[str, str] = {}
+        threads = messages = 0
+        for offset in range(days):
+            day = (start + timedelta(days=offset)).isoformat()
+            bucket = buckets.get(day, {})
+            times = bucket.get("response_times", [])
+            series.append(
+                {
+                    "day": day,
+                    "threads": bucket.get("threads", 0),
+                    "messages": bucket.get("messages", 0),
+                    "median_response": statistics.median(times) if times else None,
+                }
+            )
+            threads += bucket.get("threads", 0)
+            messages += bucket.get("messages", 0)
+            response_times.extend(times)
+            moderators.update(bucket.get("moderators", {}))
+            names.update(bucket.get("moderator_names", {}))
+
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "threads": threads,
+            "messages_per_thread": round(messages / threads, 1) if threads else 0,
+            "median_response": statistics.median(response_times) if response_times else None,
+            "series": series,
+            "moderators": [
+                {"id": author_id, "name": names.get(author_id, author_id), "messages": count}
+                for author_id, count in moderators.most_common(top)
+            ],
+        }
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h"
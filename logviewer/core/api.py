@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from aiohttp.web import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+if TYPE_CHECKING:
+    from .types_ext import RawPayload
+
+
+API_VERSION = 1
+
+# Fields of a log document exposed by the JSON API. Messages are served
+# separately through the paged messages endpoint.
+LOG_FIELDS = (
+    "key",
+    "open",
+    "created_at",
+    "closed_at",
+    "channel_id",
+    "guild_id",
+    "creator",
+    "recipient",
+    "closer",
+    "close_message",
+    "title",
+    "nsfw",
+)
+
+LOG_PROJECTION = {field: 1 for field in LOG_FIELDS}
+LOG_PROJECTION.update({"_id": 0, "message_count": {"$size": "$messages"}})
+
+LOGLIST_PROJECTION = {
+    "_id": 0,
+    "key": 1,
+    "open": 1,
+    "created_at": 1,
+    "closed_at": 1,
+    "recipient": 1,
+    "creator": 1,
+    "title": 1,
+    "nsfw": 1,
+    "last_message": {"$arrayElemAt": ["$messages", -1]},
+    "message_count": {"$size": "$messages"},
+}
+
+SUGGEST_PROJECTION = {
+    "_id": 0,
+    "key": 1,
+    "open": 1,
+    "created_at": 1,
+    "closed_at": 1,
+    "recipient": 1,
+    "title": 1,
+    "nsfw": 1,
+}
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializes `obj` to JSON bytes, using `orjson` when it is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_response(data: Any, *, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Returns a JSON response with the API version header attached.
+    """
+    response = Response(
+        status=status,
+        body=dumps(data),
+        content_type="application/json",
+        charset="utf-8",
+        headers=headers,
+    )
+    response.headers["X-Logviewer-API-Version"] = str(API_VERSION)
+    return response
+
+
+def json_error(message: str, *, status: int) -> Response:
+    return json_response({"error": {"status": status, "message": message}}, status=status)
+
+
+def encode_cursor(document: RawPayload) -> str:
+    """
+    Encodes the sort key of `document` into an opaque keyset cursor.
+    """
+    raw = dumps([document.get("created_at"), document.get("key")])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, str]]:
+    """
+    Decodes a cursor produced by `encode_cursor`. Returns `None` if the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, key = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(created_at, str) or not isinstance(key, str):
+        return None
+    return created_at, key
+
+
+def keyset_filter(cursor: Tuple[str, str]) -> RawPayload:
+    """
+    Returns a filter matching documents that sort after `cursor` in
+    `(created_at, key)` descending order.
+    """
+    created_at, key = cursor
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "key": {"$lt": key}},
+        ]
+    }
+
+
+def parse_int(value: Optional[str], *, default: int, minimum: int = 0, maximum: Optional[int] = None) -> int:
+    try:
+        result = int(value) if value is not None else default
+    except ValueError:
+        result = default
+    result = max(result, minimum)
+    if maximum is not None:
+        result = min(result, maximum)
+    return result
+
+
+def serialize_log(document: RawPayload) -> RawPayload:
+    """
+    Picks the public fields of a raw log document.
+    """
+    data = {field: document.get(field) for field in LOG_FIELDS if field in document}
+    if "message_count" in document:
+        data["message_count"] = document["message_count"]
+    if "last_message" in document:
+        data["last_message"] = document["last_message"]
+    return data
@@ -2,6 +2,7 @@ import os
 from urllib.parse import urlencode
 
 import aiohttp
+import discord
 from aiohttp_session import get_session, log as aiohttp_session_logger
 from core.models import getLogger
 
@@ -32,6 +33,7 @@ def authentication(func):
             raise aiohttp.web.HTTPFound("/login")
 
         user = session.get("user")
+        request["user_id"] = user["id"]
 
         whitelist = self.bot.config.get("oauth_whitelist")
 
@@ -56,6 +58,41 @@ def authentication(func):
     return wrapper
 
 
+def owner_only(func):
+    async def wrapper(self, request, key=None, **kwargs):
+        if not self.config.using_oauth:
+            return await self.render_template(
+                "unauthorized",
+                request,
+                message="OAuth must be enabled to verify the bot owner.",
+            )
+
+        session = await get_session(request)
+        if not session.get("user"):
+            session["last_visit"] = str(request.url)
+            raise aiohttp.web.HTTPFound("/login")
+
+        user = session.get("user")
+        request["user_id"] = user["id"]
+
+        if await self.bot.is_owner(discord.Object(id=int(user["id"]))):
+            kwargs["using_oauth"] = True
+            kwargs["session"] = session
+            kwargs["user"] = user
+            kwargs["logged_in"] = True
+            result = await func(self, request, key=key or None, **kwargs)
+            return result
+
+        result = await self.render_template(
+            "unauthorized",
+            request,
+            message="Only the bot owner can access this page.",
+        )
+        return result
+
+    return wrapper
+
+
 async def get_user_info(token):
     headers = {"Authorization": f"Bearer {token}"}
     async with aiohttp.ClientSession() as session:
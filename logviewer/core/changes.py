@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import dateutil.parser
+from core.models import getLogger
+
+if TYPE_CHECKING:
+    from aiohttp.web import Request
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+
+logger = getLogger(__name__)
+
+# The log list shows relative times ("5 minutes ago"), so even without any
+# change a cached copy is only reused within this window.
+FRESHNESS_WINDOW = 60
+
+SCOPES = ("all", "closed")
+
+
+class ChangeTracker:
+    """
+    Tracks when the bot's logs last changed, for conditional GETs.
+
+    The `all` scope is touched by thread creates, replies and closes. The
+    `closed` scope ignores replies: they can't change a list of closed
+    threads, while creates still change its total thread count.
+    """
+
+    def __init__(self):
+        self.modified_at: Dict[str, float] = {scope: 0.0 for scope in SCOPES}
+        # Bumped on every touch, as timestamps alone can't tell apart two changes in the same second.
+        self.versions: Dict[str, int] = {scope: 0 for scope in SCOPES}
+
+    def touch(self, *, reply: bool = False) -> None:
+        now = time.time()
+        for scope in SCOPES if not reply else ("all",):
+            self.modified_at[scope] = now
+            self.versions[scope] += 1
+
+    async def load(self, logs: AsyncIOMotorCollection, bot_id: int) -> None:
+        """
+        Seeds the markers from the newest `created_at` and `closed_at`, to
+        account for changes made while the server wasn't running.
+        """
+        filter_ = {"bot_id": str(bot_id)}
+        try:
+            newest = await logs.find_one(filter_, projection={"created_at": 1}, sort=[("created_at", -1)])
+            closed = await logs.find_one(
+                {**filter_, "open": False}, projection={"closed_at": 1}, sort=[("closed_at", -1)]
+            )
+        except Exception:
+            logger.warning("Failed to load logviewer change markers.", exc_info=True)
+            self.touch()
+            return
+        # Messages can arrive in open threads without moving either date, so
+        # start from now for `all` and only trust the database for `closed`.
+        closed_at = _timestamp(closed.get("closed_at")) if closed else 0.0
+        created_at = _timestamp(newest.get("created_at")) if newest else 0.0
+        self.modified_at["all"] = max(time.time(), created_at, closed_at)
+        self.modified_at["closed"] = max(self.modified_at["closed"], created_at, closed_at)
+
+    def validators(self, scope: str, *parts: object) -> Tuple[str, datetime]:
+        """
+        Returns the `ETag` and `Last-Modified` for a page of `scope`. `parts`
+        are whatever else the page depends on, e.g. the query string and the viewer.
+        """
+        bucket = int(time.time() // FRESHNESS_WINDOW) * FRESHNESS_WINDOW
+        modified = max(int(self.modified_at[scope]), bucket)
+        digest = hashlib.sha1(
+            repr((scope, modified, self.versions[scope], parts)).encode("utf-8")
+        ).hexdigest()[:20]
+        return f'W/"{digest}"', datetime.fromtimestamp(modified, tz=timezone.utc)
+
+    @staticmethod
+    def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since: Optional[datetime] = request.if_modified_since
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def _timestamp(value: Optional[str]) -> float:
+    if not value:
+        return 0.0
+    try:
+        date = dateutil.parser.parse(value)
+    except (ValueError, OverflowError):
+        return 0.0
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
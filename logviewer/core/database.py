@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Dict
+
+from core.models import getLogger
+from pymongo.monitoring import ConnectionPoolListener
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+
+
+logger = getLogger(__name__)
+
+# Server side time limits (`maxTimeMS`) of each kind of web query. Mongo
+# aborts a query running longer with `ExecutionTimeout`, so a slow query
+# gives its connection back instead of holding up everyone behind it.
+QUERY_BUDGETS: Dict[str, int] = {
+    "log": 5000,  # one log with its messages
+    "list": 3000,  # log list pages and their counts
+    "api": 3000,
+    "suggest": 500,
+    "live": 1000,
+}
+
+# Seconds a query waits for a free connection before failing.
+WAIT_QUEUE_TIMEOUT = 5
+
+
+class PoolStats(ConnectionPoolListener):
+    """
+    Counts connection pool events. Pymongo calls listeners from the threads
+    Motor runs queries on, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open: int = 0
+        self.in_use: int = 0
+        self.waiting: int = 0
+        self.peak_waiting: int = 0
+        self.checkouts: int = 0
+        self.wait_timeouts: int = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "peak_waiting": self.peak_waiting,
+                "checkouts": self.checkouts,
+                "wait_timeouts": self.wait_timeouts,
+            }
+
+    def connection_created(self, event: Any) -> None:
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event: Any) -> None:
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event: Any) -> None:
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def connection_checked_out(self, event: Any) -> None:
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+            self.checkouts += 1
+
+    def connection_check_out_failed(self, event: Any) -> None:
+        with self._lock:
+            self.waiting -= 1
+            if event.reason == "timeout":
+                self.wait_timeouts += 1
+
+    def connection_checked_in(self, event: Any) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+    def pool_created(self, event: Any) -> None:
+        pass
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: Any) -> None:
+        pass
+
+    def pool_closed(self, event: Any) -> None:
+        pass
+
+    def connection_ready(self, event: Any) -> None:
+        pass
+
+
+class ReadClient:
+    """
+    A Motor client of the web server's own, so bursts of page views and
+    searches queue on its pool rather than on the one the bot writes
+    thread messages through. Reads prefer secondaries when there are any.
+    """
+
+    def __init__(self, uri: str, database: str, *, pool_size: int):
+        # Motor is already loaded by the bot, it's only imported here to keep this module light.
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.pool_size: int = pool_size
+        self.stats: PoolStats = PoolStats()
+        self.client: AsyncIOMotorClient = AsyncIOMotorClient(
+            uri,
+            appname="logviewer",
+            maxPoolSize=pool_size,
+            readPreference="secondaryPreferred",
+            waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT * 1000,
+            event_listeners=[self.stats],
+        )
+        self.logs: AsyncIOMotorCollection = self.client[database].logs
+
+    def close(self) -> None:
+        self.client.close()
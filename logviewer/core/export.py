@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import zipfile
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional
+
+from .api import dumps
+from .loaders import RAW_VIEW_PROJECTION, stored_date
+from .models import LogEntry
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCursor
+
+    from .types_ext import RawPayload
+
+
+EXPORT_FORMATS = ("ndjson", "zip")
+
+# Size of the chunks handed to the transport. Small NDJSON lines are
+# buffered up to this size so we don't issue one write per document.
+CHUNK_SIZE = 64 * 1024
+
+
+class _ZipStream:
+    """
+    Write-only, non-seekable file object for `zipfile.ZipFile`.
+
+    Since it has no `seek` or `tell`, `ZipFile` falls back to writing data
+    descriptors after each member, which lets the archive be streamed out
+    as it is built instead of held in memory.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def export_filter(
+    bot_id: int,
+    *,
+    recipient: Optional[int] = None,
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+) -> RawPayload:
+    """
+    Builds the Mongo filter for an export. Dates are compared against the
+    `created_at` strings Modmail stores, see `stored_date`.
+    """
+    filter_ = {"bot_id": str(bot_id)}
+    if recipient is not None:
+        filter_["recipient.id"] = str(recipient)
+    created_at = {}
+    if after is not None:
+        created_at["$gte"] = stored_date(after)
+    if before is not None:
+        created_at["$lt"] = stored_date(before)
+    if created_at:
+        filter_["created_at"] = created_at
+    return filter_
+
+
+def export_projection(fmt: str) -> Dict[str, int]:
+    """
+    NDJSON exports carry the full documents, zip exports only what plain text transcripts use.
+    """
+    if fmt == "zip":
+        return RAW_VIEW_PROJECTION
+    return {"_id": 0}
+
+
+def export_filename(fmt: str) -> str:
+    return f"logs-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+
+
+async def iter_ndjson(cursor: AsyncIOMotorCursor) -> AsyncIterator[bytes]:
+    """
+    Yields the documents of `cursor` as newline delimited JSON, in chunks of about `CHUNK_SIZE` bytes.
+    """
+    chunk = bytearray()
+    async for document in cursor:
+        chunk += dumps(document)
+        chunk += b"\n"
+        if len(chunk) >= CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+async def iter_zip(cursor: AsyncIOMotorCursor) -> AsyncIterator[bytes]:
+    """
+    Yields a zip archive of plain text transcripts, one member per log, as it is being built.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for document in cursor:
+            log_entry = LogEntry(document)
+            archive.writestr(f"{log_entry.key}.txt", log_entry.plain_text())
+            data = stream.drain()
+            if data:
+                yield data
+    # Central directory is written on close.
+    data = stream.drain()
+    if data:
+        yield data
+
+
+def iter_export(cursor: AsyncIOMotorCursor, fmt: str) -> AsyncIterator[bytes]:
+    if fmt == "zip":
+        return iter_zip(cursor)
+    return iter_ndjson(cursor)
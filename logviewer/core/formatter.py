@@ -1,9 +1,128 @@
 import base64
 import html
 import re
+import time
+from typing import Tuple
+
+from core.models import getLogger
+
+from .media import emoji_url
+
+logger = getLogger(__name__)
+
+# Seconds one message may spend being formatted before it's shown as plain text instead.
+FORMAT_TIME_BUDGET = 0.05
+
+# Characters of URLs that may be anywhere in them, and those a URL may end with.
+URL_CHARS = r"-a-zA-Z0-9+&@#/%?=~_|!:,.\[\];"
+URL_END_CHARS = frozenset("-+&@#/%=~_|$") | frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+
+
+class FormatBudgetExceeded(Exception):
+    pass
 
 
 def format_content_html(content: str, allow_links: bool = False) -> str:
+    """
+    Renders Discord markdown as HTML.
+
+    Every pattern runs in linear time, and formatting stops once it has used
+    up `FORMAT_TIME_BUDGET`. A message that can't be formatted in time, or at
+    all, is shown as escaped plain text.
+    """
+    return format_content_html_timed(content, allow_links)[0]
+
+
+def format_content_html_timed(content: str, allow_links: bool = False) -> Tuple[str, bool]:
+    """
+    Like `format_content_html`, but also returns whether the message ran out
+    of time. That fallback depends on how busy the event loop was, so it must
+    not be cached.
+    """
+    deadline = time.perf_counter() + FORMAT_TIME_BUDGET
+    try:
+        return _format_content_html(content, allow_links, deadline), False
+    except FormatBudgetExceeded:
+        logger.warning(
+            f"Formatting a message of {len(content)} characters took too long, showing plain text."
+        )
+        return html.escape(content).replace("\n", "<br>"), True
+    except Exception:
+        # E.g. messages containing our own placeholder characters.
+        logger.debug("Failed to format a message, showing plain text.", exc_info=True)
+        return html.escape(content).replace("\n", "<br>"), False
+
+
+def emphasis(content: str, delimiters: tuple, tag: str) -> str:
+    r"""
+    Wraps text between a pair of the same `delimiters` in `tag`, like
+    `(D)(?=\S)(.+?)(?<=\S)\1` but in linear time: closing delimiters are
+    looked up once per line, instead of from every opening one.
+    """
+    if not any(d in content for d in delimiters):
+        return content
+    return "\n".join(_emphasis_line(line, delimiters, tag) for line in content.split("\n"))
+
+
+def _emphasis_line(line: str, delimiters: tuple, tag: str) -> str:
+    size = len(delimiters[0])
+    found = {d: list(_find_all(line, d)) for d in delimiters}
+    if not any(found.values()):
+        return line
+    # Closing candidates of each delimiter, and how far into them the scan is.
+    closers = {d: [j for j in found[d] if j > 0 and not line[j - 1].isspace()] for d in delimiters}
+    cursors = dict.fromkeys(delimiters, 0)
+    out, copied = [], 0
+    for i, delimiter in sorted((i, d) for d, indexes in found.items() for i in indexes):
+        if i < copied or i + size >= len(line) or line[i + size].isspace():
+            continue
+        candidates, cursor = closers[delimiter], cursors[delimiter]
+        while cursor < len(candidates) and candidates[cursor] < i + size + 1:
+            cursor += 1
+        cursors[delimiter] = cursor
+        if cursor == len(candidates):
+            continue
+        end = candidates[cursor]
+        if delimiter == "**":
+            end = _extend_bold(line, i, end)
+        out.append(line[copied:i])
+        out.append(f"<{tag}>{line[i + size : end]}</{tag}>")
+        copied = end + size
+    out.append(line[copied:])
+    return "".join(out)
+
+
+def _extend_bold(line: str, start: int, end: int) -> int:
+    """
+    The bold pattern ends its text with `[*_]*`, so a closing `**` followed
+    by more asterisks or underscores moves to the last `**` of that run.
+    """
+    run_start = end
+    while run_start > start + 3 and line[run_start - 1] in "*_":
+        run_start -= 1
+    run_end = run_start
+    while run_end < len(line) and line[run_end] in "*_":
+        run_end += 1
+    last = line.rfind("**", run_start, run_end)
+    return max(end, last)
+
+
+def _find_all(line: str, delimiter: str):
+    index = line.find(delimiter)
+    while index != -1:
+        yield index
+        index = line.find(delimiter, index + 1)
+
+
+def _format_content_html(content: str, allow_links: bool, deadline: float) -> str:
+    def check():
+        if time.perf_counter() > deadline:
+            raise FormatBudgetExceeded
+
+    def sub(pattern, repl, string, **kwargs):
+        check()
+        return re.sub(pattern, repl, string, **kwargs)
+
     # HTML-encode content
 
     def encode_codeblock(m):
@@ -11,7 +130,8 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
         return "\x1AM" + encoded + "\x1AM"
 
     # Encode multiline codeblocks (```text```)
-    content = re.sub(r"```+((?:[^`]*?\n)?(?:[^`]+))\n?```+", encode_codeblock, content)
+    # Only tried where a run of backticks starts, a run without a closing one is skipped in one go.
+    content = sub(r"(?<!`)```+([^`]+)```+", encode_codeblock, content)
 
     content = html.escape(content)
 
@@ -20,11 +140,11 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
         return "\x1AI" + encoded + "\x1AI"
 
     # Encode inline codeblocks (`text`)
-    content = re.sub(r"`([^`]+)`", encode_inline_codeblock, content)
+    content = sub(r"`([^`]+)`", encode_inline_codeblock, content)
 
     # Encode inline blockquotes (> test)
     # Multiline blockquotes (>>> test) are saved as single in Mongo (> test)
-    content = re.sub(
+    content = sub(
         r"^(?:(?:&gt;){1,3})(.*)",
         r"<blockquote>\1</blockquote>",
         content,
@@ -32,13 +152,13 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
     )
 
     # Markdown heading level 1
-    content = re.sub(r"^#\s+(.+)$", r"<h1>\1</h1>", content, flags=re.MULTILINE)
+    content = sub(r"^#\s+(.+)$", r"<h1>\1</h1>", content, flags=re.MULTILINE)
 
     # Markdown heading level 2
-    content = re.sub(r"^##\s+(.+)$", r"<h2>\1</h2>", content, flags=re.MULTILINE)
+    content = sub(r"^##\s+(.+)$", r"<h2>\1</h2>", content, flags=re.MULTILINE)
 
     # Markdown heading level 3
-    content = re.sub(r"^###\s+(.+)$", r"<h3>\1</h3>", content, flags=re.MULTILINE)
+    content = sub(r"^###\s+(.+)$", r"<h3>\1</h3>", content, flags=re.MULTILINE)
 
     # Encode links
     if allow_links:
@@ -48,40 +168,50 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
             encoded_2 = base64.b64encode(m.group(2).encode()).decode()
             return "\x1AL" + encoded_1 + "|" + encoded_2 + "\x1AL"
 
-        content = re.sub(r"\[(.*?)\]\((.*?)\)", encode_link, content)
+        # Neither part spans a `[`, so a failed match never scans past the next
+        # link's start, which would make runs like `[a](` quadratic.
+        content = sub(r"\[([^\[\]\n]*)\]\(([^\[)\n]*)\)", encode_link, content)
 
     def encode_url(m):
-        encoded = base64.b64encode(m.group(1).encode()).decode()
-        return "\x1AU" + encoded + "\x1AU"
+        url = m.group(1)
+        # Trailing punctuation isn't part of the URL. Backtracking the pattern
+        # to find where it ends is quadratic, so it's trimmed here instead.
+        scheme, end = len(m.group(2)), len(url)
+        if not url.endswith("$"):
+            while end > scheme and url[end - 1] != ")" and url[end - 1].lower() not in URL_END_CHARS:
+                end -= 1
+            if end == scheme:
+                return url
+        encoded = base64.b64encode(url[:end].encode()).decode()
+        return "\x1AU" + encoded + "\x1AU" + url[end:]
 
     # Encode URLs
-    content = re.sub(
-        r"(\b(?:(?:https?|ftp|file)://|www\.|ftp\.)(?:\([-a-zA-Z0"
-        r"-9+&@#/%?=~_|!:,\.\[\];]*\)|[-a-zA-Z0-9+&@#/%?=~_|!:,\."
-        r"\[\];])*(?:\([-a-zA-Z0-9+&@#/%?=~_|!:,\.\[\];]*\)|[-a-z"
-        r"A-Z0-9+&@#/%=~_|$]))",
+    content = sub(
+        rf"(\b((?:https?|ftp|file)://|www\.|ftp\.)(?:\([{URL_CHARS}]*\)|[{URL_CHARS}])*\$?)",
         encode_url,
         content,
     )
 
+    check()
+
     # Process bold (**text**)
-    content = re.sub(r"(\*\*)(?=\S)(.+?[*_]*)(?<=\S)\1", r"<b>\2</b>", content)
+    content = emphasis(content, ("**",), "b")
 
     # Process underline (__text__)
-    content = re.sub(r"(__)(?=\S)(.+?)(?<=\S)\1", r"<u>\2</u>", content)
+    content = emphasis(content, ("__",), "u")
 
     # Process italic (*text* or _text_)
-    content = re.sub(r"(\*|_)(?=\S)(.+?)(?<=\S)\1", r"<i>\2</i>", content)
+    content = emphasis(content, ("*", "_"), "i")
 
     # Process strike through (~~text~~)
-    content = re.sub(r"(~~)(?=\S)(.+?)(?<=\S)\1", r"<s>\2</s>", content)
+    content = emphasis(content, ("~~",), "s")
 
     def decode_inline_codeblock(m):
         decoded = base64.b64decode(m.group(1).encode()).decode()
         return '<span class="pre pre--inline">' + decoded + "</span>"
 
     # Decode and process inline codeblocks
-    content = re.sub("\x1AI(.*?)\x1AI", decode_inline_codeblock, content)
+    content = sub("\x1AI(.*?)\x1AI", decode_inline_codeblock, content)
 
     # Decode and process links
     if allow_links:
@@ -92,14 +222,14 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
             return '<a href="' + encoded_2 + '">' + encoded_1 + "</a>"
 
         # Potential bug, may need to change to: '\x1AL(.*?)\|(.*?)\x1AL'
-        content = re.sub("\x1AL(.*?)\\|(.*?)\x1AL", decode_link, content)
+        content = sub("\x1AL(.*?)\\|(.*?)\x1AL", decode_link, content)
 
     def decode_url(m):
         decoded = base64.b64decode(m.group(1).encode()).decode()
         return '<a href="' + decoded + '">' + decoded + "</a>"
 
     # Decode and process URLs
-    content = re.sub("\x1AU(.*?)\x1AU", decode_url, content)
+    content = sub("\x1AU(.*?)\x1AU", decode_url, content)
 
     # Process new lines
     content = content.replace("\n", "<br>")
@@ -117,7 +247,7 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
         return f'<div class="pre pre--multiline {lang}">{result}' "</div>"
 
     # Decode and process multiline codeblocks
-    content = re.sub("\x1AM(.*?)\x1AM", decode_codeblock, content)
+    content = sub("\x1AM(.*?)\x1AM", decode_codeblock, content)
 
     # Meta mentions (@everyone)
     content = content.replace("@everyone", '<span class="mention">@everyone</span>')
@@ -126,36 +256,29 @@ def format_content_html(content: str, allow_links: bool = False) -> str:
     content = content.replace("@here", '<span class="mention">@here</span>')
 
     # User mentions (<@id> and <@!id>)
-    content = re.sub(r"(&lt;@!?(\d+)&gt;)", r'<span class="mention" title="\2">\1</span>', content)
+    content = sub(r"(&lt;@!?(\d+)&gt;)", r'<span class="mention" title="\2">\1</span>', content)
 
     # Channel mentions (<#id>)
-    content = re.sub(r"(&lt;#\d+&gt;)", r'<span class="mention">\1</span>', content)
+    content = sub(r"(&lt;#\d+&gt;)", r'<span class="mention">\1</span>', content)
 
     # Role mentions (<@&id>)
-    content = re.sub(r"(&lt;@&amp;(\d+)&gt;)", r'<span class="mention">\1</span>', content)
+    content = sub(r"(&lt;@&amp;(\d+)&gt;)", r'<span class="mention">\1</span>', content)
+
+    def emoji_tag(emoji_class, ext):
+        def replace(m):
+            src = emoji_url(m.group(2), ext)
+            return f'<img class="{emoji_class}" title="{m.group(1)}" src="{src}" alt="{m.group(1)}">'
+
+        return replace
 
     # Custom emojis (<:name:id>)
-    is_jumboable = not re.sub(r"&lt;(:.*?:)(\d*)&gt;", "", content)
+    is_jumboable = not sub(r"&lt;(:[^:\n]*:)(\d*)&gt;", "", content)
     emoji_class = "emoji emoji--large" if is_jumboable else "emoji"
-    content = re.sub(
-        r"&lt;(:.*?:)(\d*)&gt;",
-        r'<img class="'
-        + emoji_class
-        + r'" title="\1" src="https://cdn.discordapp.com/'
-        + r'emojis/\2.png" alt="\1">',
-        content,
-    )
+    content = sub(r"&lt;(:[^:\n]*:)(\d*)&gt;", emoji_tag(emoji_class, "png"), content)
 
     # Custom animated emojis (<a:name:id>)
-    is_jumboable_animated = not re.sub(r"&lt;(a:.*?:)(\d*)&gt;", "", content)
+    is_jumboable_animated = not sub(r"&lt;(a:[^:\n]*:)(\d*)&gt;", "", content)
     emoji_class_animated = "emoji emoji--large" if is_jumboable_animated else "emoji"
-    content = re.sub(
-        r"&lt;(a:.*?:)(\d*)&gt;",
-        r'<img class="'
-        + emoji_class_animated
-        + r'" title="\1" src="https://cdn.discordapp.com/'
-        + r'emojis/\2.gif" alt="\1">',
-        content,
-    )
+    content = sub(r"&lt;(a:[^:\n]*:)(\d*)&gt;", emoji_tag(emoji_class_animated, "gif"), content)
 
     return content
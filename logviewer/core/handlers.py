@@ -6,8 +6,11 @@ from typing import TYPE_CHECKING, Callable
 from aiohttp import web
 from aiohttp.web import Response
 from core.models import getLogger
+from pymongo.errors import ExecutionTimeout
 
+from . import api
 from .auth import login, logout, oauth_callback
+from .health import HEALTH_PATHS
 
 if TYPE_CHECKING:
     from aiohttp.web import Request
@@ -28,6 +31,14 @@ async def aiohttp_error_handler(
     server = request.app["server"]
     try:
         return await handler(request)
+    except ExecutionTimeout:
+        # A query ran past its `maxTimeMS` budget.
+        logger.warning(f"Logviewer query timed out: {request.path}")
+        if request.path.startswith("/api/"):
+            return api.json_error("The database took too long to answer.", status=504)
+        response = await server.render_template("error", request)
+        response.set_status(504)
+        return response
     except web.HTTPException as exc:
         status = exc.status
         if status < 400:
@@ -91,6 +102,24 @@ class AIOHTTPMethodHandler(web.View):
         if path == "/":
             return await server.render_template("index", self.request)
 
+        if path in HEALTH_PATHS:
+            return await server.render_health(self.request, ready=path == "/readyz")
+
+        if path.startswith("/media/"):
+            return await server.process_media(self.request, path=path)
+
+        if path == "/analytics":
+            return await server.render_analytics(self.request)
+
+        if path == "/memory":
+            return await server.render_memory(self.request)
+
+        if path == "/export":
+            return await server.render_export(self.request)
+
+        if path.startswith("/api/"):
+            return await server.process_api(self.request, path=path)
+
         if key:
             return await server.process_logs(self.request, path=self.request.path, key=key)
 
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Optional
+
+from core.models import getLogger
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+
+logger = getLogger(__name__)
+
+# Paths of the health endpoints, which are never rate limited or queued.
+HEALTH_PATHS = ("/healthz", "/readyz")
+
+PING_TIMEOUT = 2  # seconds
+
+# Seconds a ping result is reused. `/readyz` is public and not rate limited,
+# so this keeps polling it from turning into a stream of database commands.
+PING_CACHE_TTL = 5
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag by sleeping for `interval` seconds and recording
+    how late the wake-up was. A render or anything else blocking the loop
+    shows up here directly. The last `window` samples are kept.
+    """
+
+    def __init__(self, *, interval: float = 0.5, window: int = 120):
+        self.interval: float = interval
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def current(self) -> float:
+        """Lag of the latest sample, in seconds."""
+        return self.samples[-1] if self.samples else 0.0
+
+    @property
+    def peak(self) -> float:
+        """Highest lag within the window, in seconds."""
+        return max(self.samples, default=0.0)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def ping_database(logs: AsyncIOMotorCollection) -> Optional[float]:
+    """
+    Pings the database holding `logs`. Returns the round trip in seconds, or
+    `None` if it failed or took longer than `PING_TIMEOUT`.
+    """
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(logs.database.command("ping"), timeout=PING_TIMEOUT)
+    except Exception as e:
+        logger.debug(f"Logviewer database ping failed: {type(e).__name__}: {e}")
+        return None
+    return time.perf_counter() - started
+
+
+class DatabasePing:
+    """
+    Pings the database at most once every `ttl` seconds. Callers within that
+    time get the last result, and concurrent callers share the ping in flight.
+    """
+
+    def __init__(self, *, ttl: float = PING_CACHE_TTL):
+        self.ttl: float = ttl
+        self.latency: Optional[float] = None
+        self._pinged_at: float = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    async def __call__(self, logs: AsyncIOMotorCollection) -> Optional[float]:
+        """Returns the round trip in seconds, or `None` if the database is unreachable."""
+        if time.monotonic() - self._pinged_at < self.ttl:
+            return self.latency
+        if self._task is None:
+            self._task = asyncio.create_task(self._ping(logs))
+        # Shielded so a client hanging up doesn't cancel the ping for the others.
+        return await asyncio.shield(self._task)
+
+    async def _ping(self, logs: AsyncIOMotorCollection) -> Optional[float]:
+        try:
+            self.latency = await ping_database(logs)
+            self._pinged_at = time.monotonic()
+        finally:
+            self._task = None
+        return self.latency
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from core.models import getLogger
+
+logger = getLogger(__name__)
+
+# Seconds between keep-alive comments, so proxies don't time out idle streams.
+HEARTBEAT_INTERVAL = 15
+HEARTBEAT = b": ping\n\n"
+
+# How many of the newest messages are fetched when looking for new ones.
+LIVE_TAIL = 25
+
+
+def format_event(event: str, data: str = "", *, event_id: Optional[str] = None) -> bytes:
+    """
+    Encodes a Server-Sent Event. Multi-line `data` is split into one `data:` field per line.
+    """
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class LiveHub:
+    """
+    Fans out updates of open logs to the viewers streaming them.
+
+    Every event is encoded once and the same bytes are queued for each
+    subscriber. A viewer that falls `queue_size` events behind is dropped;
+    its page reloads and catches up from the database instead.
+    """
+
+    def __init__(self, *, queue_size: int = 64):
+        self.queue_size: int = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # Log key of each channel being watched, so replies in unwatched threads cost nothing.
+        self.channels: Dict[int, str] = {}
+        # ID of the newest message pushed for each watched log.
+        self.last_message: Dict[str, str] = {}
+        # Lock of each log being read or pushed, with how many hold or wait for it.
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
+
+    @asynccontextmanager
+    async def lock(self, key: str) -> AsyncIterator[None]:
+        """
+        Holds the lock of the log `key`, so reading a log and pushing its new
+        messages happen one at a time without holding up other logs.
+        """
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def subscribe(self, key: str, channel_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(key, set()).add(queue)
+        self.channels[channel_id] = key
+        return queue
+
+    def unsubscribe(self, key: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[key]
+            self.last_message.pop(key, None)
+            for channel_id in [c for c, k in self.channels.items() if k == key]:
+                del self.channels[channel_id]
+
+    def publish(self, key: str, frame: Optional[bytes]) -> None:
+        """
+        Queues an encoded event for every subscriber of `key`. `None` ends their streams.
+        """
+        for queue in list(self.subscribers.get(key, ())):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Too far behind, make room for the end-of-stream marker.
+                self.unsubscribe(key, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(format_event("reload"))
+                queue.put_nowait(None)
+
+    def close(self, key: str) -> None:
+        self.publish(key, format_event("close"))
+        self.publish(key, None)
+
+    def close_channel(self, channel_id: int) -> None:
+        """
+        Ends the streams of the log of a thread channel, e.g. when the thread is closed.
+        """
+        key = self.channels.get(channel_id)
+        if key is not None:
+            self.close(key)
+
+    def close_all(self) -> None:
+        for key in list(self.subscribers):
+            self.publish(key, None)
+
+    @staticmethod
+    def new_messages(messages: List[dict], after: Optional[str]) -> Optional[List[dict]]:
+        """
+        Returns the messages that follow the message `after` in `messages`, the
+        newest messages of a log, or all of them if `after` is `None`. Returns
+        `None` if `after` is too old to be among them, in which case the viewer
+        has to reload.
+        """
+        if after is None:
+            return messages
+        for index, message in enumerate(messages):
+            if message.get("message_id") == after:
+                return messages[index + 1 :]
+        return None
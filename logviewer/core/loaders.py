@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Optional
+
+import bson
+from core.models import getLogger
+
+from .database import QUERY_BUDGETS
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+    from .types_ext import LogEntryPayload, RawLogEntryPayload, RawPayload
+
+
+logger = getLogger(__name__)
+
+AUTHOR_FIELDS = ("id", "name", "discriminator", "avatar_url", "mod")
+RAW_AUTHOR_FIELDS = ("id", "name", "discriminator", "mod")
+
+
+def stored_date(date: datetime) -> str:
+    """
+    Formats `date` like the `created_at` strings Modmail stores, `str()` of a
+    UTC datetime such as `2025-01-05 00:00:00+00:00`, so comparing the strings
+    compares the dates. Naive dates are taken as UTC. The bound leaves out the
+    offset, which sorts after it, so `$gte` includes the exact instant and
+    `$lt` excludes it.
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return str(date)
+
+
+def _fields(prefix: str, fields) -> Dict[str, int]:
+    return {f"{prefix}.{field}": 1 for field in fields}
+
+
+# Everything `LogEntry` and `logbase.html` use. Attachments are fetched
+# whole since refreshed attachments are written back to the database.
+LOG_VIEW_PROJECTION: Dict[str, int] = {
+    "_id": 0,
+    "key": 1,
+    "open": 1,
+    "created_at": 1,
+    "closed_at": 1,
+    "channel_id": 1,
+    "guild_id": 1,
+    "close_message": 1,
+    **_fields("creator", AUTHOR_FIELDS),
+    **_fields("recipient", AUTHOR_FIELDS),
+    **_fields("closer", AUTHOR_FIELDS),
+    **_fields("messages", ("message_id", "timestamp", "content", "attachments", "type", "edited")),
+    **_fields("messages.author", AUTHOR_FIELDS),
+}
+
+# `LOG_VIEW_PROJECTION` without the messages, for when they are fetched separately.
+LOG_HEADER_PROJECTION: Dict[str, int] = {
+    field: value for field, value in LOG_VIEW_PROJECTION.items() if not field.startswith("messages")
+}
+
+# Most messages `load_log_tail` returns at once.
+TAIL_LIMIT = 10000
+
+# Everything `LogEntry.plain_text` uses: no avatars or message types. Attachments
+# are fetched whole, as projecting their fields drops legacy ones stored as
+# bare URL strings.
+RAW_VIEW_PROJECTION: Dict[str, int] = {
+    "_id": 0,
+    "key": 1,
+    "open": 1,
+    "created_at": 1,
+    "closed_at": 1,
+    "channel_id": 1,
+    "guild_id": 1,
+    **_fields("creator", RAW_AUTHOR_FIELDS),
+    **_fields("recipient", RAW_AUTHOR_FIELDS),
+    **_fields("closer", RAW_AUTHOR_FIELDS),
+    **_fields("messages", ("message_id", "timestamp", "content", "attachments")),
+    **_fields("messages.author", RAW_AUTHOR_FIELDS),
+}
+
+
+async def _load(
+    logs: AsyncIOMotorCollection, key: str, projection: Dict[str, int], max_time_ms: int
+) -> Optional[RawPayload]:
+    measure = logger.isEnabledFor(logging.DEBUG)
+    if measure:
+        # Computed server side, so only the number crosses the wire.
+        projection = {**projection, "_full_size": {"$bsonSize": "$$ROOT"}}
+    document = await logs.find_one({"key": key}, projection=projection, max_time_ms=max_time_ms)
+    if document and measure:
+        full_size = document.pop("_full_size", 0)
+        size = len(bson.encode(document))
+        logger.debug(
+            f"Loaded log entry '{key}': {size} of {full_size} bytes, saved {full_size - size} bytes."
+        )
+    return document
+
+
+async def load_log_view(
+    logs: AsyncIOMotorCollection, key: str, *, max_time_ms: int = QUERY_BUDGETS["log"]
+) -> Optional[LogEntryPayload]:
+    """Loads a log entry with the fields needed to render it as HTML."""
+    return await _load(logs, key, LOG_VIEW_PROJECTION, max_time_ms)
+
+
+async def load_log_tail(
+    logs: AsyncIOMotorCollection, key: str, skip: int, *, max_time_ms: int = QUERY_BUDGETS["log"]
+) -> Optional[LogEntryPayload]:
+    """
+    Loads a log entry with only the messages after the first `skip`. The
+    total number of messages is returned as `message_count`.
+    """
+    projection = {
+        **LOG_HEADER_PROJECTION,
+        "messages": {"$slice": [skip, TAIL_LIMIT]},
+        "message_count": {"$size": "$messages"},
+    }
+    return await logs.find_one({"key": key}, projection=projection, max_time_ms=max_time_ms)
+
+
+async def load_raw_view(
+    logs: AsyncIOMotorCollection, key: str, *, max_time_ms: int = QUERY_BUDGETS["log"]
+) -> Optional[RawLogEntryPayload]:
+    """Loads a log entry with the fields needed to render it as plain text."""
+    return await _load(logs, key, RAW_VIEW_PROJECTION, max_time_ms)
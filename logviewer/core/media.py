@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+from core.models import getLogger
+
+from .admission import TokenBucket
+
+if TYPE_CHECKING:
+    from bot import ModmailBot
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+
+logger = getLogger(__name__)
+
+# Toggled by the server, so models and the formatter emit proxied URLs only
+# while the proxy is actually being served.
+MEDIA_PROXY_ENABLED = False
+DISCORD_CDN_URL = "https://cdn.discordapp.com"
+
+AVATAR_MAX_AGE = 86400  # avatars can change, revalidate daily
+EMOJI_MAX_AGE = 365 * 86400  # emoji IDs are immutable
+
+EMOJI_EXTENSIONS = ("png", "gif", "webp")
+
+# Users with no avatar to be found are remembered for an hour, up to this many.
+UNKNOWN_USERS_SIZE = 1024
+UNKNOWN_USER_TTL = 3600
+
+# Upstream fetches a client can cause, per second and in a burst. Anything
+# not cached yet is a miss, so this keeps the proxy from being used to fill
+# the cache or hammer the CDN. Hits are never limited.
+MISS_RATE = 1
+MISS_BURST = 100
+
+# Emoji fetches all clients together can cause, per second and in a burst.
+# Any numeric ID makes a valid emoji URL, so without this many clients
+# could still fill the cache with emojis no log shows and evict real
+# entries. Avatars don't need it, they are only served for users in the logs.
+EMOJI_MISS_RATE = 2
+EMOJI_MISS_BURST = 200
+
+# Time limit of the lookup of a stored avatar URL, in milliseconds.
+AVATAR_LOOKUP_MAX_TIME_MS = 500
+
+
+def avatar_url(user_id: int, fallback: str) -> str:
+    if not MEDIA_PROXY_ENABLED:
+        return fallback
+    return f"/media/avatar/{user_id}"
+
+
+def emoji_url(emoji_id: str, ext: str) -> str:
+    if not MEDIA_PROXY_ENABLED:
+        return f"{DISCORD_CDN_URL}/emojis/{emoji_id}.{ext}"
+    return f"/media/emoji/{emoji_id}.{ext}"
+
+
+class CachedMedia:
+    """
+    Metadata of a cached file. The body lives next to the `.json` sidecar.
+    """
+
+    __slots__ = ("name", "source", "content_type", "etag", "last_modified", "fetched_at", "size", "used_at")
+
+    def __init__(self, name: str, **data):
+        self.name: str = name
+        self.source: str = data.get("source", "")
+        self.content_type: str = data.get("content_type") or "application/octet-stream"
+        self.etag: Optional[str] = data.get("etag")
+        self.last_modified: Optional[str] = data.get("last_modified")
+        self.fetched_at: float = data.get("fetched_at", 0)
+        self.size: int = data.get("size", 0)
+        self.used_at: float = data.get("used_at", self.fetched_at)
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__ if k not in ("name", "used_at")}
+
+
+class MediaProxy:
+    """
+    Caching proxy for Discord avatars and custom emojis.
+
+    Files are kept in an on-disk LRU bounded by `max_bytes`. Concurrent
+    misses for the same file share a single upstream request, and stale
+    entries are revalidated upstream with conditional requests.
+    """
+
+    def __init__(
+        self,
+        bot: ModmailBot,
+        logs: AsyncIOMotorCollection,
+        path: Path,
+        *,
+        max_bytes: int,
+        cdn_url: str = DISCORD_CDN_URL,
+    ):
+        self.bot: ModmailBot = bot
+        self.logs: AsyncIOMotorCollection = logs
+        self.path: Path = path
+        self.max_bytes: int = max_bytes
+        self.cdn_url: str = cdn_url.rstrip("/")
+        self.entries: Dict[str, CachedMedia] = {}
+        self.misses: TokenBucket = TokenBucket(MISS_RATE, MISS_BURST)
+        self.emoji_misses: TokenBucket = TokenBucket(EMOJI_MISS_RATE, EMOJI_MISS_BURST, max_clients=1)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._unknown_users: OrderedDict[int, float] = OrderedDict()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def size(self) -> int:
+        return sum(e.size for e in self.entries.values())
+
+    def load(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        for meta in self.path.glob("*.json"):
+            body = meta.with_suffix("")
+            try:
+                with open(meta, encoding="utf-8") as f:
+                    entry = CachedMedia(body.name, **json.load(f))
+            except (OSError, ValueError):
+                meta.unlink(missing_ok=True)
+                continue
+            if not body.is_file():
+                meta.unlink(missing_ok=True)
+                continue
+            entry.used_at = body.stat().st_atime
+            self.entries[entry.name] = entry
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        return self._session
+
+    def cached(self, name: str, max_age: int) -> Optional[CachedMedia]:
+        """Returns the cache entry `name` if it is fresh, without going upstream."""
+        entry = self.entries.get(name)
+        if entry is None or time.time() - entry.fetched_at >= max_age:
+            return None
+        entry.used_at = time.time()
+        return entry
+
+    def consume_miss(self, kind: str, client: str) -> float:
+        """
+        Takes a miss from the budget of `client` and, for emojis, from the
+        budget shared by all clients. Returns `0` if the fetch may go ahead,
+        otherwise the number of seconds to wait.
+        """
+        retry_after = self.misses.consume(client)
+        if not retry_after and kind == "emoji":
+            retry_after = self.emoji_misses.consume("")
+        return retry_after
+
+    async def avatar_source(self, user_id: int) -> Optional[str]:
+        """
+        Resolves the current avatar URL of a user who wrote in a stored log, so
+        the proxy keeps working after avatars rotate. The bot's user cache is
+        tried first, then the avatar URL stored in the logs. Users are never
+        fetched from Discord, so requests for arbitrary IDs can't spend the
+        bot's API rate limit.
+        """
+        failed_at = self._unknown_users.get(user_id)
+        if failed_at is not None:
+            if time.monotonic() - failed_at < UNKNOWN_USER_TTL:
+                return None
+            del self._unknown_users[user_id]
+
+        url = await self._stored_avatar(user_id)
+        if url is not None:
+            user = self.bot.get_user(user_id)
+            if user is not None:
+                url = str(user.display_avatar.replace(size=128, static_format="png"))
+        # Stored URLs are only followed to Discord's CDN.
+        if url is None or not url.startswith(DISCORD_CDN_URL + "/"):
+            self._unknown_users[user_id] = time.monotonic()
+            while len(self._unknown_users) > UNKNOWN_USERS_SIZE:
+                self._unknown_users.popitem(last=False)
+            return None
+        if self.cdn_url != DISCORD_CDN_URL:
+            url = url.replace(DISCORD_CDN_URL, self.cdn_url, 1)
+        return url
+
+    async def _stored_avatar(self, user_id: int) -> Optional[str]:
+        """
+        Looks up the avatar URL stored for `user_id` as the recipient of a log,
+        newest first, or as the author of a message. Both are indexed. Returns
+        `None` for users who appear in no log.
+        """
+        user = str(user_id)
+        try:
+            document = await self.logs.find_one(
+                {"recipient.id": user},
+                projection={"_id": 0, "recipient.avatar_url": 1},
+                sort=[("created_at", -1)],
+                max_time_ms=AVATAR_LOOKUP_MAX_TIME_MS,
+            )
+            if document is not None:
+                return document["recipient"].get("avatar_url") or ""
+            document = await self.logs.find_one(
+                {"messages.author.id": user},
+                projection={"_id": 0, "messages.$": 1},
+                max_time_ms=AVATAR_LOOKUP_MAX_TIME_MS,
+            )
+        except Exception as e:
+            logger.debug(f"Failed to look up the avatar of user {user_id}: {e}")
+            return None
+        if document is None or not document.get("messages"):
+            return None
+        return document["messages"][0]["author"].get("avatar_url") or ""
+
+    def emoji_source(self, emoji_id: str, ext: str) -> str:
+        return f"{self.cdn_url}/emojis/{emoji_id}.{ext}"
+
+    async def get(self, name: str, source: str, max_age: int) -> Optional[CachedMedia]:
+        """
+        Returns the cache entry `name`, fetching or revalidating it from `source` as needed.
+        """
+        entry = self.entries.get(name)
+        if entry is not None and entry.source == source and time.time() - entry.fetched_at < max_age:
+            entry.used_at = time.time()
+            return entry
+
+        future = self._inflight.get(name)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            result = await self._fetch(name, source, entry if entry and entry.source == source else None)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            logger.debug(f"Failed to fetch media '{source}': {e}")
+            # Serve a stale copy rather than nothing.
+            result = entry
+        finally:
+            del self._inflight[name]
+        future.set_result(result)
+        return result
+
+    async def _fetch(self, name: str, source: str, entry: Optional[CachedMedia]) -> Optional[CachedMedia]:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        async with self.session.get(source, headers=headers) as resp:
+            if resp.status == 304 and entry is not None:
+                entry.fetched_at = entry.used_at = time.time()
+                await self._run(self._write_meta, entry)
+                return entry
+            if resp.status != 200:
+                return None
+            body = await resp.read()
+            entry = CachedMedia(
+                name,
+                source=source,
+                content_type=resp.headers.get("Content-Type"),
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+                fetched_at=time.time(),
+                size=len(body),
+            )
+
+        await self._run(self._write, entry, body)
+        self.entries[name] = entry
+        self._evict()
+        return entry
+
+    @staticmethod
+    async def _run(func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _write_meta(self, entry: CachedMedia) -> None:
+        meta = self.path / f"{entry.name}.json"
+        tmp = meta.with_name(meta.name + ".tmp")
+        tmp.write_text(json.dumps(entry.to_dict()), encoding="utf-8")
+        tmp.replace(meta)
+
+    def _write(self, entry: CachedMedia, body: bytes) -> None:
+        tmp = self.path / f"{entry.name}.tmp"
+        tmp.write_bytes(body)
+        tmp.replace(self.path / entry.name)
+        self._write_meta(entry)
+
+    def _evict(self) -> None:
+        total = self.size
+        if total <= self.max_bytes:
+            return
+        for entry in sorted(self.entries.values(), key=lambda e: e.used_at):
+            if total <= self.max_bytes:
+                break
+            (self.path / entry.name).unlink(missing_ok=True)
+            (self.path / f"{entry.name}.json").unlink(missing_ok=True)
+            del self.entries[entry.name]
+            total -= entry.size
+
+    def response(self, entry: CachedMedia, max_age: int) -> web.FileResponse:
+        """
+        Builds the response for a cached file. `FileResponse` answers
+        conditional requests with 304 based on the file's mtime, which only
+        changes when the upstream file does.
+        """
+        cache_control = f"public, max-age={max_age}"
+        if max_age >= EMOJI_MAX_AGE:
+            cache_control += ", immutable"
+        return web.FileResponse(
+            self.path / entry.name,
+            headers={"Cache-Control": cache_control, "Content-Type": entry.content_type},
+        )
+
+
+def parse_media_path(path: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Parses `/media/avatar/<id>` and `/media/emoji/<id>[.<ext>]` into `(kind, id, ext)`.
+    """
+    parts = path.strip("/").split("/")
+    if len(parts) != 3 or parts[0] != "media":
+        return None
+    kind, name = parts[1], parts[2]
+    media_id, _, ext = name.partition(".")
+    if not media_id.isdigit():
+        return None
+    if kind == "avatar" and not ext:
+        return kind, media_id, ""
+    if kind == "emoji" and (ext or "png") in EMOJI_EXTENSIONS:
+        return kind, media_id, ext or "png"
+    return None
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.models import getLogger
+
+logger = getLogger(__name__)
+
+# Frames kept per allocation, enough to reach the logviewer code behind
+# allocations made inside aiohttp, jinja2 or motor.
+TRACEMALLOC_FRAMES = 25
+
+# Rows in each table of a report.
+REPORT_TOP = 10
+
+PLUGIN_DIR = Path(__file__).parent.parent.resolve()
+
+# Objects of the plugin's own classes are walked by `approx_size`.
+_PACKAGE = __name__.rsplit(".", 2)[0]
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Sizes and counts, by allocation site or line.
+Totals = Dict[str, Tuple[int, int]]
+
+
+@lru_cache(maxsize=None)
+def source_name(filename: str) -> Tuple[bool, str]:
+    """
+    Shortens the file name of a frame. Files of the plugin, templates included,
+    become `logviewer/...`, others are made relative to their `sys.path`
+    entry, like `aiohttp/streams.py`. Also tells whether the file is the plugin's.
+    """
+    path = os.path.realpath(filename)
+    if path.startswith(str(PLUGIN_DIR) + os.sep):
+        return True, "logviewer/" + Path(path).relative_to(PLUGIN_DIR).as_posix()
+    for entry in sorted((p for p in sys.path if p), key=len, reverse=True):
+        entry = os.path.realpath(entry) + os.sep
+        if path.startswith(entry):
+            return False, Path(path[len(entry) :]).as_posix()
+    return False, Path(filename).name
+
+
+def allocation_site(traceback: tracemalloc.Traceback) -> str:
+    """
+    Names what an allocation is charged to: the innermost logviewer module in
+    its traceback, so a buffer aiohttp allocates for the export shows up under
+    `logviewer/core/servers.py`, else the package it was allocated in.
+    """
+    for frame in reversed(traceback):
+        plugin, name = source_name(frame.filename)
+        if plugin:
+            return name
+    _, name = source_name(traceback[-1].filename)
+    return Path(name.split("/", 1)[0]).stem
+
+
+class MemoryProfiler:
+    """
+    Takes tracemalloc snapshots on demand and sums them by allocation site and
+    by line, next to the change since the previous report. Tracing slows down
+    every allocation, so it only runs between `start` and `stop`.
+    """
+
+    def __init__(self, *, frames: int = TRACEMALLOC_FRAMES):
+        self.frames: int = frames
+        self.started_at: Optional[float] = None
+        self._previous: Optional[Tuple[float, Totals, Totals]] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> bool:
+        """Starts tracing. Returns `False` if it already was."""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(self.frames)
+        self.started_at = time.time()
+        self._previous = None
+        logger.info("Started tracing logviewer memory allocations.")
+        return True
+
+    def stop(self) -> None:
+        # Tracing started some other way, like with `PYTHONTRACEMALLOC`, is left alone.
+        if self.started_at is not None and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Stopped tracing logviewer memory allocations.")
+        self.started_at = None
+        self._previous = None
+
+    def snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        """Takes a snapshot of the traced allocations, `None` when not tracing."""
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def report(self, snapshot: tracemalloc.Snapshot, *, top: int = REPORT_TOP) -> Dict[str, Any]:
+        """
+        Sums `snapshot` by allocation site and by line and compares it to the
+        snapshot of the previous report. Only reads the snapshot, so it can run
+        in an executor. Sizes are in bytes.
+        """
+        sites: Dict[str, List[int]] = {}
+        lines: Dict[str, List[int]] = {}
+        for stat in snapshot.statistics("traceback"):
+            frame = stat.traceback[-1]
+            for totals, name in (
+                (sites, allocation_site(stat.traceback)),
+                (lines, f"{source_name(frame.filename)[1]}:{frame.lineno}"),
+            ):
+                total = totals.setdefault(name, [0, 0])
+                total[0] += stat.size
+                total[1] += stat.count
+
+        now = time.time()
+        previous = self._previous
+        self._previous = (
+            now,
+            {k: tuple(v) for k, v in sites.items()},
+            {k: tuple(v) for k, v in lines.items()},
+        )
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing_since": self.started_at,
+            "traced": traced,
+            "peak": peak,
+            "overhead": tracemalloc.get_tracemalloc_memory(),
+            "interval": round(now - previous[0], 1) if previous else None,
+            "sites": _top_totals(sites, previous[1] if previous else None, top, by_growth=False),
+            # What grew is what matters once there is something to compare with.
+            "lines": _top_totals(lines, previous[2] if previous else None, top, by_growth=True),
+        }
+
+
+def _top_totals(
+    current: Dict[str, List[int]], previous: Optional[Totals], top: int, *, by_growth: bool
+) -> List[Dict[str, Any]]:
+    rows = []
+    for name, (size, count) in current.items():
+        row: Dict[str, Any] = {"name": name, "size": size, "count": count}
+        if previous is not None:
+            old_size, old_count = previous.get(name, (0, 0))
+            row["size_diff"] = size - old_size
+            row["count_diff"] = count - old_count
+        rows.append(row)
+    key = "size_diff" if by_growth and previous is not None else "size"
+    rows.sort(key=lambda r: r[key], reverse=True)
+    return rows[:top]
+
+
+def approx_size(obj: Any) -> int:
+    """
+    Approximates the memory held by `obj`: its own size and everything it
+    holds through builtin containers and objects of the plugin's classes.
+    Anything else, like discord models or asyncio queues, only counts its own
+    size, so walking a cache never wanders off into the rest of the bot.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        else:
+            module = type(item).__module__
+            if module != _PACKAGE and not module.startswith(_PACKAGE + "."):
+                continue
+            if hasattr(item, "__dict__"):
+                stack.append(vars(item))
+            for slot in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot):
+                    stack.append(getattr(item, slot))
+    return size
+
+
+def count_instances(*classes: type) -> Dict[str, int]:
+    """
+    Counts live instances of each of `classes`, subclasses excluded, in a
+    single pass over the objects tracked by the garbage collector.
+    """
+    names = {cls: cls.__name__ for cls in classes}
+    counts = dict.fromkeys(names.values(), 0)
+    for item in gc.get_objects():
+        name = names.get(type(item))
+        if name is not None:
+            counts[name] += 1
+    return counts
+
+
+def process_rss() -> Optional[int]:
+    """Resident set size of the process in bytes, where `/proc` has it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
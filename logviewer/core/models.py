@@ -1,21 +1,24 @@
 from __future__ import annotations
 
 from datetime import datetime
+from functools import cached_property
 from time import time
 from typing import TYPE_CHECKING, List, Optional, Union
 from urllib.parse import parse_qs, urlparse
 
 import dateutil.parser
-from bot import ModmailBot
 from core.models import getLogger
-from discord import DMChannel
 from natural.date import duration
 
-from .formatter import format_content_html
+from . import media
+from .formatter import format_content_html_timed
 
 logger = getLogger(__name__)
 
 if TYPE_CHECKING:
+    from bot import ModmailBot
+    from discord import DMChannel
+
     from .types_ext import (
         AttachmentPayload,
         AuthorPayload,
@@ -27,7 +30,7 @@ cache = {"users": {}, "dm_channels": {}}
 
 
 class LogEntry:
-    def __init__(self, data: LogEntryPayload, bot: ModmailBot):
+    def __init__(self, data: LogEntryPayload, bot: ModmailBot = None):
         self.key: str = data["key"]
         self.open: bool = data["open"]
 
@@ -47,12 +50,19 @@ class LogEntry:
         self.creator: Author = Author(data["creator"])
         self.recipient: Author = Author(data["recipient"])
         self.closer: Author = Author(data["closer"]) if not self.open else None
-        self.close_message: str = format_content_html(data.get("close_message") or "")
+        self.close_message, self.close_message_degraded = format_content_html_timed(
+            data.get("close_message") or ""
+        )
         self.messages: List[Message] = [Message(m, bot) for m in data["messages"]]
         self.internal_messages: List[Message] = [m for m in self.messages if m.type == "internal"]
         self.thread_messages: List[Message] = [
             m for m in self.messages if m.type not in ("internal", "system")
         ]
+        # Counted separately, as a log rendered from a cached prefix only holds its newest messages.
+        self.thread_message_count: int = len(self.thread_messages)
+        self.internal_message_count: int = len(self.internal_messages)
+        # Pre-rendered message groups, set when rendered through the render cache.
+        self.chatlog: Optional[str] = None
 
     @property
     def system_avatar_url(self) -> str:
@@ -63,26 +73,22 @@ class LogEntry:
         return duration(self.closed_at, now=datetime.utcnow())
 
     @property
-    def message_groups(self) -> List[MessageGroup]:
-        groups = []
-
-        if not self.messages:
-            return groups
-
-        curr = MessageGroup(self.messages[0].author)
-
-        for index, message in enumerate(self.messages):
-            next_index = index + 1 if index + 1 < len(self.messages) else index
-            next_message = self.messages[next_index]
-
-            curr.messages.append(message)
+    def attachments_expire_at(self) -> Optional[int]:
+        """Returns the earliest expiry of the attachment URLs in this log."""
+        expiries = [a.expires_at for m in self.messages for a in m.attachments if a.expires_at]
+        return min(expiries) if expiries else None
 
-            if message.is_different_from(next_message):
-                groups.append(curr)
-                curr = MessageGroup(next_message.author)
+    @property
+    def degraded(self) -> bool:
+        """
+        Whether any formatted message fell back to plain text for running out
+        of time. Such a render shouldn't be cached.
+        """
+        return self.close_message_degraded or any(m.degraded for m in self.messages)
 
-        groups.append(curr)
-        return groups
+    @property
+    def message_groups(self) -> List[MessageGroup]:
+        return group_messages(self.messages)
 
     def plain_text(self) -> str:
         messages = self.messages
@@ -181,7 +187,9 @@ class Author:
         self.id: int = int(data.get("id"))
         self.name: str = data["name"]
         self.discriminator: str = data["discriminator"]
-        self.avatar_url: str = data["avatar_url"].split("?")[0] or data["avatar_url"]
+        # Views that don't show avatars load authors without them.
+        avatar_url = data.get("avatar_url") or ""
+        self.avatar_url: str = media.avatar_url(self.id, avatar_url.split("?")[0] or avatar_url)
         self.mod: bool = data["mod"]
 
     @property
@@ -195,6 +203,28 @@ class Author:
         return self.id == other.id and self.mod is other.mod
 
 
+def group_messages(messages: List[Message]) -> List[MessageGroup]:
+    groups = []
+
+    if not messages:
+        return groups
+
+    curr = MessageGroup(messages[0].author)
+
+    for index, message in enumerate(messages):
+        next_index = index + 1 if index + 1 < len(messages) else index
+        next_message = messages[next_index]
+
+        curr.messages.append(message)
+
+        if message.is_different_from(next_message):
+            groups.append(curr)
+            curr = MessageGroup(next_message.author)
+
+    groups.append(curr)
+    return groups
+
+
 class MessageGroup:
     def __init__(self, author: Author):
         self.author: Author = author
@@ -226,11 +256,25 @@ class Attachment:
             # content_type only exist on our forks
             self.content_type: Optional[str] = data.get("content_type")
 
+    def __str__(self) -> str:
+        return self.url
+
     @property
-    def is_attachment_expired(self) -> bool:
+    def expires_at(self) -> Optional[int]:
+        """Unix timestamp at which the signed CDN URL expires, if it has one."""
         parsed_url = urlparse(self.url)
         query_params = parse_qs(parsed_url.query)
-        expiry = int(query_params.get("ex", [None])[0], 16)
+        expiry = query_params.get("ex", [None])[0]
+        try:
+            return int(expiry, 16) if expiry else None
+        except ValueError:
+            return None
+
+    @property
+    def is_attachment_expired(self) -> bool:
+        expiry = self.expires_at
+        if expiry is None:
+            return False
         current_time = time()
         return current_time > expiry
 
@@ -244,11 +288,18 @@ class Message:
         self.attachments: List[Attachment] = [Attachment(a) for a in data["attachments"]]
         self.human_created_at: str = duration(self.created_at, now=datetime.utcnow())
         self.raw_content: str = data["content"]
-        self.content: str = self.format_html_content(self.raw_content)
         self.author: Author = Author(data["author"])
         self.bot = bot
         self.type: str = data.get("type", "thread_message")
         self.edited: bool = data.get("edited", False)
+        # Set once `content` is formatted, if it ran out of time and is plain text.
+        self.degraded: bool = False
+
+    @cached_property
+    def content(self) -> str:
+        # Formatted on first use, so the plain text view never pays for it.
+        content, self.degraded = format_content_html_timed(self.raw_content)
+        return content
 
     def is_different_from(self, other: Message) -> bool:
         return (
@@ -294,4 +345,4 @@ class Message:
 
     @staticmethod
     def format_html_content(content: str) -> str:
-        return format_content_html(content)
+        return format_content_html_timed(content)[0]
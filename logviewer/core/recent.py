@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List
+
+from core.models import getLogger
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+
+logger = getLogger(__name__)
+
+RECENT_VIEWS_ID = "recent_views"
+RECENT_VIEWS_SIZE = 50
+
+# Seconds between saves of the recently viewed keys.
+RECENT_VIEWS_FLUSH_INTERVAL = 300
+
+
+class RecentViews:
+    """
+    Keys of the logs viewed last, so the caches can be warmed with them
+    after a restart. Kept in memory and saved to the plugin's collection
+    from time to time.
+    """
+
+    def __init__(self, *, size: int = RECENT_VIEWS_SIZE):
+        self.size: int = size
+        self.dirty: bool = False
+        self._keys: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def touch(self, key: str) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.size:
+            self._keys.popitem(last=False)
+        self.dirty = True
+
+    def newest(self) -> List[str]:
+        return list(reversed(self._keys))
+
+    async def load(self, db: AsyncIOMotorCollection) -> None:
+        document = await db.find_one({"_id": RECENT_VIEWS_ID}) or {}
+        # Views since the start are newer than the saved ones.
+        keys = OrderedDict.fromkeys(document.get("keys", [])[-self.size :])
+        for key in self._keys:
+            keys.pop(key, None)
+            keys[key] = None
+        while len(keys) > self.size:
+            keys.popitem(last=False)
+        self._keys = keys
+
+    async def save(self, db: AsyncIOMotorCollection) -> None:
+        if not self.dirty:
+            return
+        self.dirty = False
+        await db.update_one({"_id": RECENT_VIEWS_ID}, {"$set": {"keys": list(self._keys)}}, upsert=True)
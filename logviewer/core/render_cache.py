@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional
+
+from core.models import getLogger
+
+if TYPE_CHECKING:
+    from .types_ext import RawPayload
+
+
+logger = getLogger(__name__)
+
+# Rendered groups show relative times ("5 minutes ago") and can miss edits,
+# so a cached prefix is thrown away after this many seconds.
+RENDER_CACHE_TTL = 300
+
+
+class CachedRender:
+    """
+    The rendered part of an open log.
+
+    `html` holds every message group but the last one. The last group may
+    still grow with the next message, so its raw messages are kept in
+    `tail` and it is rendered again together with whatever comes next.
+    `count` is the number of messages in the log the entry covers.
+    """
+
+    __slots__ = ("html", "tail", "count", "thread_messages", "internal_messages", "expires_at")
+
+    def __init__(
+        self,
+        html: str,
+        tail: List[RawPayload],
+        count: int,
+        *,
+        thread_messages: int,
+        internal_messages: int,
+        expires_at: float,
+    ):
+        self.html: str = html
+        self.tail: List[RawPayload] = tail
+        self.count: int = count
+        self.thread_messages: int = thread_messages
+        self.internal_messages: int = internal_messages
+        self.expires_at: float = expires_at
+
+    @property
+    def size(self) -> int:
+        return len(self.html)
+
+
+class RenderCache:
+    """
+    LRU of `CachedRender` by log key, bounded by `max_bytes` of HTML.
+    """
+
+    def __init__(self, *, max_bytes: int):
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+        self._entries: OrderedDict[str, CachedRender] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedRender]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() >= entry.expires_at:
+            self.discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedRender) -> None:
+        self.discard(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
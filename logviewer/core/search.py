@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import re
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, List, Optional
+
+import dateutil.parser
+from core.models import getLogger
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .loaders import stored_date
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+    from .types_ext import RawPayload
+
+
+logger = getLogger(__name__)
+
+# `name:value`, `name:"quoted value"`, `"quoted phrase"` or a bare word.
+TOKEN_RE = re.compile(
+    r'(?P<name>[a-z]+):(?:"(?P<qvalue>[^"]*)"|(?P<value>\S+))|"(?P<phrase>[^"]*)"|(?P<word>\S+)'
+)
+
+TRUE_VALUES = ("true", "yes", "y", "1", "on")
+FALSE_VALUES = ("false", "no", "n", "0", "off")
+
+# Indexes backing the filters below. Modmail itself already maintains the
+# `key` and `$text` indexes on the logs collection.
+SEARCH_INDEXES = [
+    IndexModel([("bot_id", ASCENDING), ("created_at", DESCENDING)], name="logviewer_bot_created"),
+    IndexModel(
+        [("bot_id", ASCENDING), ("open", ASCENDING), ("created_at", DESCENDING)],
+        name="logviewer_bot_open_created",
+    ),
+    IndexModel([("recipient.id", ASCENDING), ("created_at", DESCENDING)], name="logviewer_recipient"),
+    IndexModel([("messages.author.id", ASCENDING)], name="logviewer_message_author"),
+]
+
+
+class SearchQuery:
+    """
+    A parsed log search query, e.g. `recipient:123 mod:456 after:2025-01-01 "refund"`.
+
+    Supported filters are `recipient:<id>`, `mod:<id>`, `key:<key>`,
+    `after:<date>`, `before:<date>`, `open:<yes/no>` and `nsfw:<yes/no>`.
+    Everything else, including filters with an invalid value, is searched
+    as text.
+    """
+
+    def __init__(self):
+        self.recipients: List[str] = []
+        self.mods: List[str] = []
+        self.keys: List[str] = []
+        self.after: Optional[datetime] = None
+        self.before: Optional[datetime] = None
+        self.open: Optional[bool] = None
+        self.nsfw: Optional[bool] = None
+        self.terms: List[str] = []
+
+    @classmethod
+    def parse(cls, query: str) -> SearchQuery:
+        self = cls()
+        for match in TOKEN_RE.finditer(query or ""):
+            name = match.group("name")
+            if name is None:
+                phrase = match.group("phrase")
+                if phrase is not None:
+                    if phrase.strip():
+                        self.terms.append(f'"{phrase}"')
+                else:
+                    self.terms.append(match.group("word"))
+                continue
+            value = match.group("qvalue") if match.group("qvalue") is not None else match.group("value")
+            if not self._add_filter(name, value):
+                self.terms.append(match.group(0))
+        return self
+
+    def _add_filter(self, name: str, value: str) -> bool:
+        if name in ("recipient", "user") and value.isdigit():
+            self.recipients.append(value)
+        elif name in ("mod", "moderator") and value.isdigit():
+            self.mods.append(value)
+        elif name == "key" and value.isalnum():
+            self.keys.append(value)
+        elif name in ("after", "before"):
+            try:
+                date = dateutil.parser.parse(value)
+            except (ValueError, OverflowError):
+                return False
+            if date.tzinfo is not None:
+                date = date.astimezone(timezone.utc).replace(tzinfo=None)
+            setattr(self, name, date)
+        elif name in ("open", "nsfw") and value.lower() in TRUE_VALUES + FALSE_VALUES:
+            setattr(self, name, value.lower() in TRUE_VALUES)
+        else:
+            return False
+        return True
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.terms)
+
+    def __bool__(self) -> bool:
+        return any(
+            (
+                self.recipients,
+                self.mods,
+                self.keys,
+                self.after,
+                self.before,
+                self.open is not None,
+                self.nsfw is not None,
+                self.terms,
+            )
+        )
+
+    def compile(self) -> RawPayload:
+        """
+        Compiles the query into a Mongo filter.
+        """
+        filter_ = {}
+        if self.recipients:
+            filter_["recipient.id"] = _one_or_in(self.recipients)
+        if self.mods:
+            filter_["messages"] = {"$elemMatch": {"author.id": _one_or_in(self.mods), "author.mod": True}}
+        if self.keys:
+            filter_["key"] = _one_or_in(self.keys)
+        created_at = {}
+        if self.after is not None:
+            created_at["$gte"] = stored_date(self.after)
+        if self.before is not None:
+            created_at["$lt"] = stored_date(self.before)
+        if created_at:
+            filter_["created_at"] = created_at
+        if self.open is not None:
+            filter_["open"] = self.open
+        if self.nsfw is not None:
+            filter_["nsfw"] = True if self.nsfw else {"$ne": True}
+        if self.terms:
+            filter_["$text"] = {"$search": self.text}
+        return filter_
+
+
+def _one_or_in(values: List[str]):
+    return values[0] if len(values) == 1 else {"$in": values}
+
+
+async def ensure_indexes(logs: AsyncIOMotorCollection) -> None:
+    """
+    Creates the indexes used by log search. This is a no-op for indexes that already exist.
+    """
+    try:
+        await logs.create_indexes(SEARCH_INDEXES)
+    except Exception:
+        logger.warning("Failed to create logviewer search indexes.", exc_info=True)
@@ -1,37 +1,79 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import os
 import re
+import socket
 import ssl
+import time
+from collections import OrderedDict
+from functools import partial
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import aiohttp
+import dateutil.parser
 import jinja2
 from aiohttp import web
-from aiohttp.web import Application, Request, Response, normalize_path_middleware
-from aiohttp_session import get_session, setup
+from aiohttp.web import (
+    Application,
+    Request,
+    Response,
+    StreamResponse,
+    normalize_path_middleware,
+)
+from aiohttp_session import AbstractStorage, Session, get_session, setup
 from aiohttp_session.cookie_storage import EncryptedCookieStorage
 from core.models import getLogger
 from cryptography import fernet
 from discord.utils import MISSING
 from jinja2 import Environment, FileSystemLoader
+from pymongo.errors import ExecutionTimeout
 
-from .auth import authentication
+from . import api, export, loaders, media, search
+from .access_log import AccessLog, QueuedAccessLogger
+from .admission import AdmissionController, admission_middleware
+from .analytics import AnalyticsStore, format_duration
+from .auth import authentication, owner_only
+from .changes import ChangeTracker
+from .database import QUERY_BUDGETS, ReadClient
 from .handlers import AIOHTTPMethodHandler, aiohttp_error_handler
-from .models import LogEntry, LogList
+from .health import DatabasePing, LoopLagMonitor
+from .live import HEARTBEAT, HEARTBEAT_INTERVAL, LIVE_TAIL, LiveHub, format_event
+from .memory import MemoryProfiler, approx_size, count_instances, process_rss
+from .models import (
+    Attachment,
+    Author,
+    LogEntry,
+    LogList,
+    Message,
+    MessageGroup,
+    cache as model_cache,
+    group_messages,
+)
+from .recent import RECENT_VIEWS_FLUSH_INTERVAL, RecentViews
+from .render_cache import RENDER_CACHE_TTL, CachedRender, RenderCache
+from .sessions import ServerSideStorage
+from .snapshots import SnapshotStore
 
 if TYPE_CHECKING:
     from bot import ModmailBot
     from jinja2 import Template  # noqa: F401
+    from motor.motor_asyncio import AsyncIOMotorCollection
 
     from .types_ext import RawPayload
 
 
 logger = getLogger(__name__)
 
+SUGGEST_CACHE_SIZE = 256
+SUGGEST_CACHE_TTL = 5  # seconds
+
+# Logs loaded at once while warming the caches after a start.
+WARMUP_CONCURRENCY = 2
+
 # Set path for static
 parent_dir = Path(__file__).parent.parent.resolve()
 static_path = parent_dir / "static"
@@ -44,6 +86,17 @@ jinja_env = Environment(
 )
 
 
+def _setting(config: dict, name: str, default: Any) -> Any:
+    """
+    Returns the `LOGVIEWER_<NAME>` environment variable, else the stored
+    setting, else `default`. Unlike `or` chains this keeps a stored `0`.
+    """
+    value = os.getenv(f"LOGVIEWER_{name.upper()}")
+    if value is None:
+        value = config.get(name)
+    return default if value is None else value
+
+
 class Config:
     """
     Base class for storing configurations from `.env` (environment variables).
@@ -60,6 +113,44 @@ class Config:
         self.redirect_uri = os.getenv("OAUTH2_REDIRECT_URI") or config.get("oauth2_redirect_uri") or ""
         self.ssl_cert_path = os.getenv("SSL_CERT_PATH") or config.get("ssl_cert_path") or ""
         self.ssl_key_path = os.getenv("SSL_KEY_PATH") or config.get("ssl_key_path") or ""
+        self.export_batch_size = int(
+            os.getenv("LOGVIEWER_EXPORT_BATCH_SIZE") or config.get("export_batch_size") or 100
+        )
+        self.snapshot_path = Path(
+            os.getenv("LOGVIEWER_SNAPSHOT_PATH") or config.get("snapshot_path") or parent_dir / "snapshots"
+        )
+        # Quota in megabytes, 0 disables snapshots.
+        self.snapshot_quota = int(_setting(config, "snapshot_quota", 256))
+        media_quota = os.getenv("LOGVIEWER_MEDIA_QUOTA") or config.get("media_cache_quota")
+        # Quota in megabytes, 0 disables the media proxy.
+        self.media_cache_quota = int(media_quota if media_quota is not None else 128)
+        self.media_cache_path = Path(
+            os.getenv("LOGVIEWER_MEDIA_CACHE_PATH")
+            or config.get("media_cache_path")
+            or parent_dir / "media_cache"
+        )
+        self.media_cdn_url = (
+            os.getenv("LOGVIEWER_MEDIA_CDN_URL") or config.get("media_cdn_url") or media.DISCORD_CDN_URL
+        )
+        self.max_concurrent_renders = int(_setting(config, "max_concurrent_renders", 8))
+        self.render_queue_size = int(_setting(config, "render_queue_size", 32))
+        self.render_queue_timeout = float(_setting(config, "render_queue_timeout", 10))
+        self.rate_limit = int(_setting(config, "rate_limit", 120))
+        self.rate_burst = int(_setting(config, "rate_burst", 30))
+        self.negative_cache_ttl = float(_setting(config, "negative_cache_ttl", 30))
+        self.drain_timeout = float(_setting(config, "drain_timeout", 10))
+        self.loop_lag_threshold = float(_setting(config, "loop_lag_threshold", 250))
+        self.render_cache_size = int(_setting(config, "render_cache_size", 32))
+        # 0 shares the bot's database client instead of opening a pool for the webserver.
+        self.read_pool_size = int(_setting(config, "read_pool_size", 0))
+        self.read_mongo_uri = _setting(config, "read_mongo_uri", None)
+        self.warmup_logs = int(_setting(config, "warmup_logs", 20))
+        self.warmup_pages = int(_setting(config, "warmup_pages", 2))
+        # Share of asset and 304 responses written to the access log.
+        self.access_log_sample = min(1.0, max(0.0, float(_setting(config, "access_log_sample", 0.1))))
+        self.session_store = (
+            os.getenv("LOGVIEWER_SESSION_STORE") or config.get("session_store") or "cookie"
+        ).lower()
         self.encryption_key = (
             os.getenv("LOGVIEWER_SECRET") or config.get("encryption_key") or "A very sophisticated key"
         )
@@ -81,14 +172,67 @@ class LogviewerServer:
     Main class to handle the log viewer server.
     """
 
-    def __init__(self, bot: ModmailBot, config: dict):
+    def __init__(self, bot: ModmailBot, config: dict, db: Optional[AsyncIOMotorCollection] = None):
         self.bot: ModmailBot = bot
+        self.db: Optional[AsyncIOMotorCollection] = db
         self.config: Config = Config(config=config)
         self.app: Application = MISSING
         self.site: web.TCPSite = MISSING
         self.runner: web.AppRunner = MISSING
+        self.session_storage: AbstractStorage = MISSING
+        self.snapshots: Optional[SnapshotStore] = None
+        self.media: Optional[media.MediaProxy] = None
+        self.changes: ChangeTracker = ChangeTracker()
+        self.analytics: Optional[AnalyticsStore] = AnalyticsStore(db) if db is not None else None
+        self.loop_lag: LoopLagMonitor = LoopLagMonitor()
+        self.ping_database: DatabasePing = DatabasePing()
+        self.live: LiveHub = LiveHub()
+        self.access_log: AccessLog = AccessLog(sample_rate=self.config.access_log_sample)
+        self.recent_views: RecentViews = RecentViews()
+        self.memory: MemoryProfiler = MemoryProfiler()
+        self.render_cache: Optional[RenderCache] = (
+            RenderCache(max_bytes=self.config.render_cache_size * 1024 * 1024)
+            if self.config.render_cache_size > 0
+            else None
+        )
+        self.admission: AdmissionController = AdmissionController(
+            max_concurrent=self.config.max_concurrent_renders,
+            queue_size=self.config.render_queue_size,
+            queue_timeout=self.config.render_queue_timeout,
+            rate_limit=self.config.rate_limit,
+            rate_burst=self.config.rate_burst,
+            negative_ttl=self.config.negative_cache_ttl,
+        )
+        self.read_client: Optional[ReadClient] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._index_task: Optional[asyncio.Task] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._recent_views_task: Optional[asyncio.Task] = None
+        self._suggest_cache: OrderedDict[Tuple[str, int], Tuple[float, List[RawPayload]]] = OrderedDict()
+        self.socket: Optional[socket.socket] = None
         self._hooked: bool = False
         self._running: bool = False
+        self._handed_off: bool = False
+
+    @property
+    def logs(self) -> AsyncIOMotorCollection:
+        """
+        The logs collection web pages read from: through the webserver's own
+        client when `read_pool_size` is set, else through the bot's.
+        """
+        if self.read_client is not None:
+            return self.read_client.logs
+        return self.bot.api.logs
+
+    @property
+    def primary_logs(self) -> AsyncIOMotorCollection:
+        """
+        The logs collection through the bot's client, which reads from the
+        primary. Used for anything cached under a `ChangeTracker` ETag or
+        kept in the snapshot store or render cache: the webserver's client
+        reads from secondaries, which may not have the latest change yet.
+        """
+        return self.bot.api.logs
 
     def init_hook(self) -> None:
         """
@@ -97,6 +241,7 @@ class LogviewerServer:
         self.app: Application = Application(
             middlewares=[
                 normalize_path_middleware(remove_slash=True, append_slash=False),
+                admission_middleware,
             ]
         )
         self.app.router.add_static("/static", static_path)
@@ -104,76 +249,316 @@ class LogviewerServer:
 
         self._add_routes()
 
+        if self.config.media_cache_quota > 0:
+            self.media = media.MediaProxy(
+                self.bot,
+                self.bot.api.logs,
+                self.config.media_cache_path,
+                max_bytes=self.config.media_cache_quota * 1024 * 1024,
+                cdn_url=self.config.media_cdn_url,
+            )
+            self.media.load()
+
+        if self.config.snapshot_quota > 0:
+            self.snapshots = SnapshotStore(
+                self.config.snapshot_path,
+                templates_path,
+                max_bytes=self.config.snapshot_quota * 1024 * 1024,
+                # Pages link to the media proxy while it is on, else straight to Discord.
+                settings={
+                    "media_proxy": self.media is not None,
+                    "media_cdn_url": self.config.media_cdn_url,
+                },
+            )
+            self.snapshots.load()
+
         # middlewares
         self.app.middlewares.append(aiohttp_error_handler)
 
         self._hooked = True
 
         key = self.config.encryption_key
-        key_b = key.encode("utf-8")
-        key64 = base64.urlsafe_b64encode(key_b.ljust(32)[:32])
-        secret_key = fernet.Fernet(key64)
+        store = self.config.session_store
+        if store in ("memory", "mongo"):
+            # Only a signed session ID goes in the cookie, so requests don't
+            # pay for encrypting and decrypting the whole session.
+            self.session_storage = ServerSideStorage(
+                key,
+                db=self.db if store == "mongo" else None,
+                max_age=86400,
+                samesite="Lax",
+            )
+        else:
+            key_b = key.encode("utf-8")
+            key64 = base64.urlsafe_b64encode(key_b.ljust(32)[:32])
+            secret_key = fernet.Fernet(key64)
+            self.session_storage = EncryptedCookieStorage(secret_key, max_age=86400, samesite=True)
 
         # max_age = 3 days
-        setup(
-            self.app,
-            EncryptedCookieStorage(secret_key, max_age=86400, samesite=True),
-        )
+        setup(self.app, self.session_storage)
 
     def _add_routes(self) -> None:
         prefix = self.config.log_prefix or "/logs"
         self.app.router.add_route("HEAD", "/", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/healthz", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/readyz", AIOHTTPMethodHandler)
         self.app.router.add_route("GET", "/login", AIOHTTPMethodHandler)
         self.app.router.add_route("GET", "/callback", AIOHTTPMethodHandler)
         self.app.router.add_route("GET", "/logout", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/export", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/analytics", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/memory", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/media/avatar/{user_id}", AIOHTTPMethodHandler)
+        self.app.router.add_route("GET", "/media/emoji/{emoji}", AIOHTTPMethodHandler)
+
+        for path in (
+            "/api/logs",
+            "/api/logs/{key}",
+            "/api/logs/{key}/messages",
+            "/api/search/suggest",
+            "/api/analytics",
+        ):
+            self.app.router.add_route("GET", path, AIOHTTPMethodHandler)
+            self.app.router.add_route(
+                "GET", path.replace("/api", f"/api/v{api.API_VERSION}", 1), AIOHTTPMethodHandler
+            )
 
         if prefix == "/":
-            for path in ("/", "/{key}", "/raw/{key}"):
+            for path in ("/", "/{key}", "/raw/{key}", "/{key}/live"):
                 self.app.router.add_route("GET", path, AIOHTTPMethodHandler)
         else:
-            for path in ("/", prefix, prefix + "/{key}", prefix + "/raw/{key}"):
+            for path in ("/", prefix, prefix + "/{key}", prefix + "/raw/{key}", prefix + "/{key}/live"):
                 self.app.router.add_route("GET", path, AIOHTTPMethodHandler)
 
-    async def start(self) -> None:
+    async def start(self, *, previous: Optional[LogviewerServer] = None) -> None:
         """
         Starts the log viewer server.
+
+        If `previous` is a running server, this is a graceful reload: caches
+        are carried over and, when host and port are unchanged, its listening
+        socket is shared, so the port never closes. `previous` keeps serving
+        until it is stopped.
         """
         if self._running:
             raise RuntimeError("Log viewer server is already running.")
         if not self._hooked:
             self.init_hook()
         logger.info("Starting log viewer server.")
+        if isinstance(self.session_storage, ServerSideStorage):
+            await self.session_storage.setup()
+        if self.config.read_pool_size > 0 and self.read_client is None:
+            self.read_client = ReadClient(
+                self.config.read_mongo_uri or self.bot.config["connection_uri"],
+                self.bot.api.logs.database.name,
+                pool_size=self.config.read_pool_size,
+            )
+        if previous is not None and previous.is_running():
+            self.warm(previous)
+        else:
+            previous = None
+            self.warm()
         self.runner = web.AppRunner(
-            self.app, handle_signals=True, access_log=logger, access_log_format="[%a] %r %s %b"
+            self.app, handle_signals=True, access_log_class=QueuedAccessLogger.bind(self.access_log)
         )
         await self.runner.setup()
+        ssl_context = None
         ssl_keypair = [self.config.ssl_cert_path, self.config.ssl_key_path]
         ssl_enabled = all(ssl_keypair)
         if ssl_enabled:
             try:
                 ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
                 ssl_context.load_cert_chain(ssl_keypair[0], ssl_keypair[1])
-                self.site = web.TCPSite(
-                    self.runner, self.config.host, self.config.port, ssl_context=ssl_context
-                )
-                self.is_https = True
             except Exception as e:
+                ssl_context = None
                 logger.error(f"Failed to configure SSL, falling back to HTTP server\n{e}")
-        if not self.site:
-            self.site = web.TCPSite(self.runner, self.config.host, self.config.port)
-            self.is_https = False
-        await self.site.start()
+        self.is_https = ssl_context is not None
+
+        if (
+            previous is not None
+            and previous.socket is not None
+            and (previous.config.host, previous.config.port) == (self.config.host, self.config.port)
+        ):
+            logger.info("Taking over the listening socket of the running log viewer server.")
+            self.socket, previous.socket = previous.socket, None
+            previous._handed_off = True
+        else:
+            self.socket = self.bind()
+        # Each site gets its own descriptor, so stopping a site never closes
+        # the socket the next server has taken over.
+        self.site = web.SockSite(self.runner, self.socket.dup(), ssl_context=ssl_context)
+        try:
+            await self.site.start()
+        except Exception:
+            await self.runner.cleanup()
+            if previous is not None and previous._handed_off:
+                self.socket, previous.socket = None, self.socket
+                previous._handed_off = False
+            raise
         self._running = True
+        media.MEDIA_PROXY_ENABLED = self.media is not None
+        self.loop_lag.start()
+        self.access_log.start()
+
+        self._index_task = asyncio.create_task(search.ensure_indexes(self.bot.api.logs))
+        if previous is None:
+            await self.changes.load(self.bot.api.logs, self.bot.user.id)
+
+        if self.snapshots and self.snapshots.stale_keys:
+            keys, self.snapshots.stale_keys = self.snapshots.stale_keys, []
+            logger.info(f"Templates changed, rebuilding {len(keys)} logviewer snapshots.")
+            self._snapshot_task = asyncio.create_task(self.backfill_snapshots(keys=keys))
+
+        if self.db is not None:
+            self._recent_views_task = asyncio.create_task(self._save_recent_views())
+        # On a reload the caches are carried over, they are warm already.
+        if previous is None:
+            self._warmup_task = asyncio.create_task(self.prefetch())
+
+    async def prefetch(self) -> None:
+        """
+        Warms the caches in the background after a start: the first log list
+        pages, the logs viewed last before the restart and the newest logs.
+        Only a couple of logs load at a time, and whenever requests are being
+        rendered the warm-up waits for them, so real traffic goes first.
+        """
+        started = time.perf_counter()
+        try:
+            if self.db is not None:
+                await self.recent_views.load(self.db)
+            filter_ = {"bot_id": str(self.bot.user.id)}
+            for page in range(1, self.config.warmup_pages + 1):
+                await self._wait_idle()
+                await self.find_logs(filter_, page)
+
+            keys = self.recent_views.newest()
+            if self.config.warmup_logs > 0:
+                newest = await self.logs.find(
+                    filter_, projection={"key": 1}, sort=[("created_at", -1)], limit=self.config.warmup_logs
+                ).to_list(length=self.config.warmup_logs)
+                keys += [document["key"] for document in newest]
+            keys = list(dict.fromkeys(keys))
+        except Exception:
+            logger.error("Failed to warm up the logviewer.", exc_info=True)
+            return
+
+        semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
+
+        async def warm(key: str) -> None:
+            async with semaphore:
+                await self._wait_idle()
+                try:
+                    await self.prefetch_log(key)
+                except Exception:
+                    logger.debug(f"Failed to warm up log entry '{key}'.", exc_info=True)
+
+        await asyncio.gather(*(warm(key) for key in keys))
+        logger.info(
+            f"Warmed up {self.config.warmup_pages} log list pages and {len(keys)} logs "
+            f"in {time.perf_counter() - started:.1f}s."
+        )
+
+    async def prefetch_log(self, key: str) -> None:
+        """
+        Renders a log entry ahead of its first view: closed logs into the
+        snapshot store, open ones into the render cache. Loading it also
+        refreshes its expired attachment URLs.
+        """
+        if (self.snapshots and key in self.snapshots) or (self.render_cache and self.render_cache.get(key)):
+            return
+        document = await self.load_log(key, loaders.load_log_view, logs=self.primary_logs)
+        if not document:
+            return
+        if not document.get("open"):
+            await self.save_snapshot(document)
+        elif self.render_cache is not None:
+            await self.render_chatlog(key, LogEntry(document, self.bot), document["messages"])
+
+    async def _wait_idle(self) -> None:
+        while self.admission.in_flight or self.admission.waiting:
+            await asyncio.sleep(0.1)
+
+    async def _save_recent_views(self) -> None:
+        while True:
+            await asyncio.sleep(RECENT_VIEWS_FLUSH_INTERVAL)
+            try:
+                await self.recent_views.save(self.db)
+            except Exception:
+                logger.error("Failed to save recently viewed logs.", exc_info=True)
+
+    def bind(self) -> socket.socket:
+        """
+        Creates the listening socket for the configured host and port.
+        """
+        family = socket.AF_INET6 if ":" in self.config.host else socket.AF_INET
+        sock = socket.create_server((self.config.host, self.config.port), family=family, backlog=128)
+        sock.setblocking(False)
+        return sock
 
-    async def stop(self) -> None:
+    def warm(self, previous: Optional[LogviewerServer] = None) -> None:
+        """
+        Prepares the server before it takes traffic: compiles every template
+        and, on a reload, carries over the caches of the `previous` server.
+        """
+        for template in templates_path.glob("*.html"):
+            jinja_env.get_template(template.name)
+
+        if previous is None:
+            return
+        self.changes = previous.changes
+        self.recent_views = previous.recent_views
+        self.memory = previous.memory
+        self._suggest_cache = previous._suggest_cache
+        self.admission.missing_keys = previous.admission.missing_keys
+        if self.render_cache is not None and previous.render_cache is not None:
+            self.render_cache._entries = previous.render_cache._entries
+            self.render_cache.size = previous.render_cache.size
+        if isinstance(self.session_storage, ServerSideStorage) and isinstance(
+            previous.session_storage, ServerSideStorage
+        ):
+            self.session_storage.inherit(previous.session_storage)
+
+    async def stop(self, *, drain_timeout: float = 0) -> None:
         """
         Stops the log viewer server.
+
+        New connections are refused right away, then requests still in
+        flight get up to `drain_timeout` seconds to finish.
         """
         logger.info(" - Shutting down web server. - ")
+        for task in (self._snapshot_task, self._warmup_task, self._recent_views_task):
+            if task and not task.done():
+                task.cancel()
+        if self.db is not None:
+            try:
+                await self.recent_views.save(self.db)
+            except Exception:
+                logger.error("Failed to save recently viewed logs.", exc_info=True)
+        self.loop_lag.stop()
+        # Live streams never finish on their own, end them so they don't hold up the drain.
+        self.live.close_all()
         if self.site:
             await self.site.stop()
+        if drain_timeout > 0:
+            deadline = time.monotonic() + drain_timeout
+            while self.admission.active and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            if self.admission.active:
+                logger.warning(f"Cutting off {self.admission.active} in-flight logviewer requests.")
         if self.runner:
             await self.runner.cleanup()
+        # After the cleanup, so the requests that were drained are logged too.
+        self.access_log.stop()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if self.media:
+            await self.media.close()
+        if self.read_client is not None:
+            self.read_client.close()
+            self.read_client = None
+        if not self._handed_off:
+            media.MEDIA_PROXY_ENABLED = False
+            self.memory.stop()
         self._running = False
 
     def is_running(self) -> bool:
@@ -189,18 +574,146 @@ class LogviewerServer:
 
         return main_deps
 
+    async def health(self, *, ping: bool = True) -> Dict[str, Any]:
+        """
+        Collects the numbers reported by the health endpoints and `logviewer info`.
+        Lags and latencies are in milliseconds.
+        """
+        data: Dict[str, Any] = {
+            "loop_lag": {
+                "current": round(self.loop_lag.current * 1000, 1),
+                "peak": round(self.loop_lag.peak * 1000, 1),
+                "threshold": self.config.loop_lag_threshold,
+            },
+            "requests": {
+                "active": self.admission.active,
+                "rendering": self.admission.in_flight,
+                "queued": self.admission.waiting,
+                "rejected": dict(self.admission.rejected),
+            },
+            "caches": {
+                "snapshots": len(self.snapshots.index) if self.snapshots else 0,
+                "snapshot_bytes": self.snapshots.size if self.snapshots else 0,
+                "media": len(self.media.entries) if self.media else 0,
+                "media_bytes": self.media.size if self.media else 0,
+                "suggestions": len(self._suggest_cache),
+                "rendered_logs": len(self.render_cache) if self.render_cache else 0,
+                "missing_keys": len(self.admission.missing_keys),
+                "sessions": len(self.session_storage)
+                if isinstance(self.session_storage, ServerSideStorage)
+                else 0,
+                "rate_limited_clients": len(self.admission.buckets) if self.admission.buckets else 0,
+            },
+            "access_log": {
+                "queued": len(self.access_log.records),
+                "written": self.access_log.written,
+                "skipped": self.access_log.skipped,
+                "dropped": self.access_log.dropped,
+            },
+        }
+        if self.read_client is not None:
+            data["read_pool"] = {"size": self.read_client.pool_size, **self.read_client.stats.snapshot()}
+        if ping:
+            # The primary, as the bot itself can't work without it.
+            latency = await self.ping_database(self.primary_logs)
+            data["database"] = {
+                "ok": latency is not None,
+                "latency": round(latency * 1000, 1) if latency is not None else None,
+            }
+        return data
+
+    async def memory_report(self, *, top: int = 10) -> Dict[str, Any]:
+        """
+        Collects the numbers reported by `/memory` and `logviewer memory`: the
+        process RSS, the approximate size of every logviewer cache, counts of
+        live model objects and, while tracing, the `top` allocation sites and
+        lines with their growth since the previous report. Sizes are in bytes.
+        """
+        caches = {
+            "render_cache": self.render_cache,
+            "suggestions": self._suggest_cache,
+            "sessions": self.session_storage if isinstance(self.session_storage, ServerSideStorage) else None,
+            "missing_keys": self.admission.missing_keys,
+            "rate_limited_clients": self.admission.buckets,
+            "rate_limited_media_clients": self.admission.media_buckets,
+            "live_streams": self.live,
+            "recent_views": self.recent_views,
+            "snapshot_index": self.snapshots.index if self.snapshots else None,
+            "media_index": self.media.entries if self.media else None,
+            "users": model_cache["users"],
+            "dm_channels": model_cache["dm_channels"],
+        }
+        data: Dict[str, Any] = {
+            "rss": process_rss(),
+            "caches": {
+                name: {"entries": len(cache), "bytes": approx_size(cache)}
+                for name, cache in caches.items()
+                if cache is not None
+            },
+            "objects": count_instances(LogEntry, Message, MessageGroup, Author, Attachment, CachedRender),
+            "tracing": self.memory.tracing,
+        }
+        snapshot = self.memory.snapshot()
+        if snapshot is not None:
+            # Summing the snapshot takes a while with many allocations, so it's kept off the event loop.
+            loop = asyncio.get_running_loop()
+            data["allocations"] = await loop.run_in_executor(
+                None, partial(self.memory.report, snapshot, top=top)
+            )
+        return data
+
+    @owner_only
+    async def render_memory(self, request: Request, **kwargs) -> Response:
+        """
+        Returns the memory report as JSON. `?trace=1` starts tracing
+        allocations and `?trace=0` stops it.
+        """
+        trace = request.query.get("trace")
+        if trace in ("1", "true"):
+            self.memory.start()
+        elif trace in ("0", "false"):
+            self.memory.stop()
+        top = api.parse_int(request.query.get("top"), default=10, minimum=1, maximum=100)
+        return api.json_response(await self.memory_report(top=top), headers={"Cache-Control": "no-store"})
+
+    def is_lagging(self) -> bool:
+        return self.loop_lag.peak * 1000 > self.config.loop_lag_threshold
+
+    async def render_health(self, request: Request, *, ready: bool) -> Response:
+        """
+        `/healthz` answers 200 as long as the process serves requests. `/readyz`
+        also pings the database, at most once every `PING_CACHE_TTL` seconds,
+        and answers 503 if it is unreachable or the event loop lags behind the
+        threshold.
+        """
+        data = await self.health(ping=ready)
+        problems = []
+        if ready:
+            if not data["database"]["ok"]:
+                problems.append("database unreachable")
+            if self.is_lagging():
+                problems.append("event loop lagging")
+        data["status"] = "ok" if not problems else ", ".join(problems)
+        return api.json_response(
+            data,
+            status=503 if problems else 200,
+            headers={"Cache-Control": "no-store"},
+        )
+
     async def process_logs(self, request: Request, *, path: str, key: str, **kwargs) -> Response:
         """
         Matches the request path with regex before rendering the logs template to user.
         """
 
         prefix = "" if self.config.log_prefix == "/" else self.config.log_prefix or "/logs"
-        path_re = re.compile(rf"^{prefix}/(?:(?P<raw>raw)/)?(?P<key>([a-zA-Z]|[0-9])+)")
+        path_re = re.compile(rf"^{prefix}/(?:(?P<raw>raw)/)?(?P<key>([a-zA-Z]|[0-9])+)(?:/(?P<live>live))?")
         match = path_re.match(path)
         if match is None:
             return await self.raise_error("not_found", message=f"Invalid path, '{path}'.")
         data = match.groupdict()
         raw = data["raw"]
+        if data["live"] and not raw:
+            return await self.render_live(request, key, **kwargs)
         if not raw:
             return await self.render_logs(request, key, **kwargs)
         else:
@@ -214,20 +727,261 @@ class LogviewerServer:
         **kwargs,
     ) -> Response:
         """Returns the html rendered log entry"""
-        logs = self.bot.api.logs
-        document: RawPayload = await logs.find_one({"key": key})
+        if self.snapshots and "gzip" in request.headers.get("Accept-Encoding", ""):
+            path = self.snapshots.get(key)
+            if path is not None:
+                self.recent_views.touch(key)
+                request["cache"] = "snapshot"
+                return web.FileResponse(path, headers={"X-Logviewer-Snapshot": "hit"})
+
+        entry = self.render_cache.get(key) if self.render_cache else None
+        if entry is not None:
+            log_entry = await self.render_cached_log(key, entry)
+            if log_entry is not None:
+                self.recent_views.touch(key)
+                request["cache"] = "hit"
+                return await self.render_template("logbase", request, log_entry=log_entry, **kwargs)
+
+        request["cache"] = "miss"
+        document = await self.load_log(key, loaders.load_log_view, logs=self.primary_logs)
         if not document:
             return await self.raise_error("not_found", message=f"Log entry '{key}' not found.")
+        self.recent_views.touch(key)
         log_entry = LogEntry(document, self.bot)
+        if self.render_cache is not None and log_entry.open:
+            log_entry.chatlog = await self.render_chatlog(key, log_entry, document["messages"])
         return await self.render_template("logbase", request, log_entry=log_entry, **kwargs)
 
+    async def render_cached_log(self, key: str, entry: CachedRender) -> Optional[LogEntry]:
+        """
+        Renders an open log from its cached prefix: only the messages added
+        since are fetched and formatted. Returns `None` if the cache can't be
+        used, e.g. because the log was closed or messages were deleted.
+        """
+        document = await loaders.load_log_tail(self.primary_logs, key, entry.count)
+        new = len(document["messages"]) if document else 0
+        if not document or not document["open"] or document["message_count"] != entry.count + new:
+            self.render_cache.discard(key)
+            return None
+        # The last cached group goes through grouping again, so it merges
+        # with the new messages exactly as in a full render.
+        messages = entry.tail + document["messages"]
+        document["messages"] = messages
+        log_entry = LogEntry(document, self.bot)
+        log_entry.chatlog = await self.render_chatlog(key, log_entry, messages, entry)
+        log_entry.thread_message_count += entry.thread_messages
+        log_entry.internal_message_count += entry.internal_messages
+        return log_entry
+
+    async def render_chatlog(
+        self,
+        key: str,
+        log_entry: LogEntry,
+        messages: List[RawPayload],
+        entry: Optional[CachedRender] = None,
+    ) -> str:
+        """
+        Renders the message groups of `log_entry`, whose raw `messages`
+        follow the prefix of `entry`, and caches the result for the next view
+        unless a message ran out of formatting time.
+        """
+        groups = log_entry.message_groups
+        rendered = [await self.render_html("message_group", group=group) for group in groups]
+        prefix = (entry.html if entry else "") + "".join(rendered[:-1])
+
+        closed = [message for group in groups[:-1] for message in group.messages]
+        if any(message.degraded for message in closed):
+            # Formatted as plain text while the loop was busy, left for the next view to format again.
+            return prefix + (rendered[-1] if rendered else "")
+        tail = messages[len(messages) - len(groups[-1].messages) :] if groups else []
+        # Rendering refreshes expired attachment URLs, so expiries are read afterwards.
+        expiries = [a.expires_at for m in closed for a in m.attachments if a.expires_at]
+        expires_at = entry.expires_at if entry else time.time() + RENDER_CACHE_TTL
+        self.render_cache.put(
+            key,
+            CachedRender(
+                prefix,
+                tail,
+                (entry.count if entry else 0) + len(messages) - len(entry.tail if entry else ()),
+                thread_messages=(entry.thread_messages if entry else 0)
+                + sum(m.type not in ("internal", "system") for m in closed),
+                internal_messages=(entry.internal_messages if entry else 0)
+                + sum(m.type == "internal" for m in closed),
+                expires_at=min([expires_at, *expiries]),
+            ),
+        )
+        return prefix + (rendered[-1] if rendered else "")
+
+    async def load_log(
+        self,
+        key: str,
+        loader: Callable[[AsyncIOMotorCollection, str], Awaitable[Optional[RawPayload]]],
+        *,
+        logs: Optional[AsyncIOMotorCollection] = None,
+    ) -> Optional[RawPayload]:
+        """
+        Loads a log entry with `loader` from `logs`, `self.logs` by default,
+        skipping the database for keys recently found not to exist.
+        """
+        if key in self.admission.missing_keys:
+            return None
+        document = await loader(logs if logs is not None else self.logs, key)
+        if not document:
+            self.admission.missing_keys.add(key)
+        return document
+
+    async def save_snapshot(self, document: RawPayload) -> bool:
+        """
+        Pre-renders a closed log entry into the snapshot store.
+
+        The snapshot is rendered without any viewer specific data and is
+        considered stale once the earliest attachment URL in it expires.
+        Returns `True` if a snapshot was written.
+        """
+        if not self.snapshots or document.get("open", True):
+            return False
+        log_entry = LogEntry(document, self.bot)
+        html = await self.render_html(
+            "logbase",
+            log_entry=log_entry,
+            **self.template_context(None),
+            snapshot=True,
+        )
+        if log_entry.degraded:
+            logger.debug(
+                f"Not snapshotting log entry '{log_entry.key}', a message ran out of formatting time."
+            )
+            return False
+        # Rendering refreshes expired attachment URLs, so the expiry is read afterwards.
+        await self.snapshots.save(log_entry.key, html, expires_at=log_entry.attachments_expire_at)
+        return True
+
+    async def backfill_snapshots(self, *, keys: Optional[List[str]] = None, limit: int = 0) -> int:
+        """
+        Snapshots closed logs that don't have a valid snapshot yet, newest
+        first. If `keys` is given, only those logs are considered.
+        Returns the number of snapshots written.
+        """
+        if not self.snapshots:
+            return 0
+        filter_ = {"bot_id": str(self.bot.user.id), "open": False}
+        if keys is not None:
+            filter_["key"] = {"$in": keys}
+        cursor = self.logs.find(filter_, projection={"key": 1}, sort=[("created_at", -1)])
+        count = 0
+        async for item in cursor:
+            if item["key"] in self.snapshots:
+                continue
+            document = await loaders.load_log_view(self.primary_logs, item["key"])
+            try:
+                if document and await self.save_snapshot(document):
+                    count += 1
+            except Exception:
+                logger.error(f"Failed to snapshot log entry '{item['key']}'.", exc_info=True)
+            if limit and count >= limit:
+                break
+        await cursor.close()
+        return count
+
+    @authentication
+    async def render_live(self, request: Request, key: str, **kwargs) -> StreamResponse:
+        """
+        Streams the new messages of an open log as Server-Sent Events.
+
+        The viewer passes the ID of the newest message it has, as `after` or
+        through `Last-Event-ID` when reconnecting, and is sent whatever it
+        missed before joining the stream.
+        """
+        after = request.headers.get("Last-Event-ID") or request.query.get("after")
+        async with self.live.lock(key):
+            document = await self.primary_logs.find_one(
+                {"key": key},
+                projection={"open": 1, "channel_id": 1, "messages": {"$slice": -LIVE_TAIL}},
+                max_time_ms=QUERY_BUDGETS["live"],
+            )
+            if not document or not document.get("open"):
+                # 204 tells EventSource not to reconnect.
+                return Response(status=204)
+            messages = document.get("messages") or []
+            # Bring existing viewers up to date first, so everyone continues from the same message.
+            await self._flush_live(key, messages)
+            queue = self.live.subscribe(key, int(document["channel_id"]))
+            if not messages or after == messages[-1]["message_id"]:
+                catch_up = None
+            else:
+                missed = self.live.new_messages(messages, after)
+                if missed is None:
+                    catch_up = format_event("reload")
+                else:
+                    catch_up = await self.render_live_messages(missed)
+            self.live.last_message[key] = messages[-1]["message_id"] if messages else None
+
+        response = StreamResponse(
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                # Stops nginx from buffering the stream.
+                "X-Accel-Buffering": "no",
+            }
+        )
+        try:
+            await response.prepare(request)
+            if catch_up:
+                await response.write(catch_up)
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    frame = HEARTBEAT
+                if frame is None:
+                    break
+                await response.write(frame)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.live.unsubscribe(key, queue)
+        return response
+
+    async def push_live(self, channel_id: int) -> None:
+        """
+        Sends the new messages of a thread to everyone streaming its log.
+        Does nothing, not even a database query, if nobody is.
+        """
+        key = self.live.channels.get(channel_id)
+        if key is None:
+            return
+        async with self.live.lock(key):
+            # Always the bot's client: a secondary may not have the new message yet.
+            document = await self.primary_logs.find_one(
+                {"key": key},
+                projection={"messages": {"$slice": -LIVE_TAIL}},
+                max_time_ms=QUERY_BUDGETS["live"],
+            )
+            if document:
+                await self._flush_live(key, document.get("messages") or [])
+
+    async def _flush_live(self, key: str, messages: List[RawPayload]) -> None:
+        if key not in self.live.subscribers or not messages:
+            return
+        new = self.live.new_messages(messages, self.live.last_message.get(key))
+        if new is None:
+            self.live.publish(key, format_event("reload"))
+        elif new:
+            # Formatted once, no matter how many viewers there are.
+            self.live.publish(key, await self.render_live_messages(new))
+        self.live.last_message[key] = messages[-1]["message_id"]
+
+    async def render_live_messages(self, messages: List[RawPayload]) -> bytes:
+        groups = group_messages([Message(m) for m in messages])
+        html = "".join([await self.render_html("message_group", group=group) for group in groups])
+        return format_event("message", html, event_id=messages[-1]["message_id"])
+
     @authentication
     async def render_raw_logs(self, request, key, **kwargs) -> Any:
         """
         Returns the plain text rendered log entry.
         """
-        logs = self.bot.api.logs
-        document: RawPayload = await logs.find_one({"key": key})
+        document = await self.load_log(key, loaders.load_raw_view)
         if not document:
             return await self.raise_error("not_found", message=f"Log entry '{key}' not found.")
 
@@ -239,74 +993,370 @@ class LogviewerServer:
             charset="utf-8",
         )
 
+    async def find_logs(
+        self, filter_: RawPayload, page: int, *, logs: Optional[AsyncIOMotorCollection] = None
+    ) -> Tuple[List[RawPayload], int, int]:
+        """
+        Returns a page of the log list matching `filter_` from `logs`,
+        `self.logs` by default, the number of pages and the number of logs overall.
+        """
+        logs = logs if logs is not None else self.logs
+        budget = QUERY_BUDGETS["list"]
+        logs_per_page = int(self.config.pagination)
+
+        count_all = await logs.count_documents(filter={"bot_id": str(self.bot.user.id)}, maxTimeMS=budget)
+
+        projection_ = {
+            "key": 1,
+            "open": 1,
+            "created_at": 1,
+            "closed_at": 1,
+            "recipient": 1,
+            "creator": 1,
+            "title": 1,
+            "last_message": {"$arrayElemAt": ["$messages", -1]},
+            "message_count": {"$size": "$messages"},
+            "nsfw": 1,
+        }
+
+        cursor = logs.find(
+            filter=filter_,
+            projection=projection_,
+            skip=(page - 1) * logs_per_page,
+            max_time_ms=budget,
+        ).sort("created_at", -1)
+
+        count = await logs.count_documents(filter=filter_, maxTimeMS=budget)
+
+        max_page = count // logs_per_page
+        if (count % logs_per_page) > 0:
+            max_page += 1
+
+        items = await cursor.to_list(length=logs_per_page)
+
+        return items, max_page, count_all
+
     @authentication
     async def render_loglist(self, request, **kwargs) -> Any:
         """
         Returns the html rendered log list
         """
-        logs = self.bot.api.logs
-
-        logs_per_page = int(self.config.pagination)
+        scope = "closed" if request.query.get("open") == "false" else "all"
+        user = kwargs.get("user")
+        etag, last_modified = self.changes.validators(
+            scope, request.query_string, user["id"] if user else None
+        )
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if self.changes.not_modified(request, etag, last_modified):
+            response = Response(status=304, headers=cache_headers)
+            response.last_modified = last_modified
+            return response
 
         try:
             page = int(request.query.get("page", 1))
         except ValueError:
             page = 1
 
-        async def find_logs():
-            filter_ = {"bot_id": str(self.bot.user.id)}
+        filter_, status_open = self.loglist_filter(request)
+        # Served under a `ChangeTracker` ETag, so it mustn't lag behind the change.
+        document, max_page, count_all = await self.find_logs(filter_, page, logs=self.primary_logs)
+        prefix = self.config.log_prefix
+
+        log_list = LogList(document, prefix, page, max_page, status_open, count_all)
 
-            count_all = await logs.count_documents(filter=filter_)
+        response = await self.render_template("loglist", request, data=log_list, **kwargs)
+        response.headers.update(cache_headers)
+        response.last_modified = last_modified
+        return response
 
-            status_open = request.query.get("open")
+    @authentication
+    async def render_analytics(self, request: Request, **kwargs) -> Response:
+        """
+        Returns the html rendered analytics dashboard. Everything comes from
+        the daily rollups, the logs themselves are never scanned here.
+        """
+        if self.analytics is None:
+            return await self.raise_error("not_found", message="Analytics are not available.")
+        days = api.parse_int(request.query.get("days"), default=30, minimum=1, maximum=365)
+        report = await self.analytics.report(days)
+        return await self.render_template(
+            "analytics", request, data=report, days=days, format_duration=format_duration, **kwargs
+        )
 
-            if status_open == "false":
-                filter_["open"] = False
-            elif status_open == "true":
-                filter_["open"] = True
-            else:
-                status_open = None
-
-            if request.query.get("search"):
-                search = request.query.get("search")
-                filter_["$text"] = {"$search": search}
-
-            projection_ = {
-                "key": 1,
-                "open": 1,
-                "created_at": 1,
-                "closed_at": 1,
-                "recipient": 1,
-                "creator": 1,
-                "title": 1,
-                "last_message": {"$arrayElemAt": ["$messages", -1]},
-                "message_count": {"$size": "$messages"},
-                "nsfw": 1,
+    @authentication
+    async def render_api_analytics(self, request: Request, **kwargs) -> Response:
+        """
+        Returns the analytics report as JSON, for the last `days` days.
+        """
+        if self.analytics is None:
+            return api.json_error("Analytics are not available.", status=404)
+        days = api.parse_int(request.query.get("days"), default=30, minimum=1, maximum=365)
+        return api.json_response(await self.analytics.report(days))
+
+    def loglist_filter(self, request: Request) -> Tuple[RawPayload, Optional[str]]:
+        """
+        Builds the log list filter from the `open` and `search` query parameters.
+        """
+        filter_ = {"bot_id": str(self.bot.user.id)}
+
+        status_open = request.query.get("open")
+
+        if status_open == "false":
+            filter_["open"] = False
+        elif status_open == "true":
+            filter_["open"] = True
+        else:
+            status_open = None
+
+        if request.query.get("search"):
+            query = search.SearchQuery.parse(request.query["search"])
+            filter_.update(query.compile())
+
+        return filter_, status_open
+
+    async def process_api(self, request: Request, *, path: str, **kwargs) -> Response:
+        """
+        Matches the request path of a JSON API call and dispatches it to the right handler.
+        """
+        if re.match(r"^/api(?:/v\d+)?/search/suggest$", path):
+            return await self.render_api_suggest(request, **kwargs)
+        if re.match(r"^/api(?:/v\d+)?/analytics$", path):
+            return await self.render_api_analytics(request, **kwargs)
+
+        path_re = re.compile(
+            r"^/api(?:/v(?P<version>\d+))?/logs(?:/(?P<key>[a-zA-Z0-9]+)(?P<messages>/messages)?)?$"
+        )
+        match = path_re.match(path)
+        if match is None:
+            return api.json_error(f"Invalid path, '{path}'.", status=404)
+        data = match.groupdict()
+        if data["version"] is not None and int(data["version"]) != api.API_VERSION:
+            return api.json_error(f"Unsupported API version, 'v{data['version']}'.", status=404)
+        key = data["key"]
+        if key is None:
+            return await self.render_api_loglist(request, **kwargs)
+        if data["messages"]:
+            return await self.render_api_messages(request, key, **kwargs)
+        return await self.render_api_log(request, key, **kwargs)
+
+    @authentication
+    async def render_api_loglist(self, request: Request, **kwargs) -> Response:
+        """
+        Returns a page of the log list as JSON, paged with an opaque keyset cursor.
+        """
+        logs = self.logs
+        limit = api.parse_int(
+            request.query.get("limit"), default=int(self.config.pagination), minimum=1, maximum=100
+        )
+
+        filter_, status_open = self.loglist_filter(request)
+        cursor = request.query.get("cursor")
+        if cursor:
+            position = api.decode_cursor(cursor)
+            if position is None:
+                return api.json_error("Invalid cursor.", status=400)
+            filter_ = {"$and": [filter_, api.keyset_filter(position)]}
+
+        documents = await logs.find(
+            filter=filter_,
+            projection=api.LOGLIST_PROJECTION,
+            sort=[("created_at", -1), ("key", -1)],
+            limit=limit + 1,
+            max_time_ms=QUERY_BUDGETS["api"],
+        ).to_list(length=limit + 1)
+
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+        next_cursor = api.encode_cursor(documents[-1]) if has_more else None
+
+        return api.json_response(
+            {
+                "logs": [api.serialize_log(d) for d in documents],
+                "open": None if status_open is None else status_open == "true",
+                "search": request.query.get("search"),
+                "next_cursor": next_cursor,
             }
+        )
+
+    @authentication
+    async def render_api_suggest(self, request: Request, **kwargs) -> Response:
+        """
+        Returns a handful of logs matching a search query, for search-as-you-type.
+
+        Results are cached for a few seconds per query and the Mongo query is
+        bounded by `maxTimeMS`, so a slow search can't pile up behind keystrokes.
+        """
+        query = (request.query.get("q") or "").strip()
+        limit = api.parse_int(request.query.get("limit"), default=8, minimum=1, maximum=25)
+        parsed = search.SearchQuery.parse(query)
+        if not parsed:
+            return api.json_response({"query": query, "results": []})
+
+        cache_key = (query, limit)
+        cached = self._suggest_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._suggest_cache.move_to_end(cache_key)
+            request["cache"] = "hit"
+            return api.json_response({"query": query, "results": cached[1]})
 
-            cursor = logs.find(
+        request["cache"] = "miss"
+        filter_ = {"bot_id": str(self.bot.user.id)}
+        filter_.update(parsed.compile())
+        try:
+            documents = await self.logs.find(
                 filter=filter_,
-                projection=projection_,
-                skip=(page - 1) * logs_per_page,
-            ).sort("created_at", -1)
+                projection=api.SUGGEST_PROJECTION,
+                sort=[("created_at", -1)],
+                limit=limit,
+                max_time_ms=QUERY_BUDGETS["suggest"],
+            ).to_list(length=limit)
+        except ExecutionTimeout:
+            return api.json_error("Search took too long, try a more specific query.", status=504)
 
-            count = await logs.count_documents(filter=filter_)
+        results = [api.serialize_log(d) for d in documents]
+        self._suggest_cache[cache_key] = (time.monotonic() + SUGGEST_CACHE_TTL, results)
+        if len(self._suggest_cache) > SUGGEST_CACHE_SIZE:
+            self._suggest_cache.popitem(last=False)
+        return api.json_response({"query": query, "results": results})
 
-            max_page = count // logs_per_page
-            if (count % logs_per_page) > 0:
-                max_page += 1
+    @authentication
+    async def render_api_log(self, request: Request, key: str, **kwargs) -> Response:
+        """
+        Returns the metadata of a single log entry as JSON, without its messages.
+        """
+        document = await self.load_log(
+            key,
+            lambda logs, k: logs.find_one(
+                {"key": k}, projection=api.LOG_PROJECTION, max_time_ms=QUERY_BUDGETS["api"]
+            ),
+        )
+        if not document:
+            return api.json_error(f"Log entry '{key}' not found.", status=404)
+        return api.json_response(api.serialize_log(document))
 
-            items = await cursor.to_list(length=logs_per_page)
+    @authentication
+    async def render_api_messages(self, request: Request, key: str, **kwargs) -> Response:
+        """
+        Returns a slice of the messages of a log entry as JSON.
+        """
+        offset = api.parse_int(request.query.get("offset"), default=0)
+        limit = api.parse_int(request.query.get("limit"), default=100, minimum=1, maximum=500)
 
-            return items, max_page, status_open, count_all
+        document = await self.load_log(
+            key,
+            lambda logs, k: logs.find_one(
+                {"key": k},
+                projection={
+                    "_id": 0,
+                    "key": 1,
+                    "messages": {"$slice": [offset, limit]},
+                    "message_count": {"$size": "$messages"},
+                },
+                max_time_ms=QUERY_BUDGETS["api"],
+            ),
+        )
+        if not document:
+            return api.json_error(f"Log entry '{key}' not found.", status=404)
 
-        prefix = self.config.log_prefix
+        messages = document.get("messages", [])
+        total = document.get("message_count", 0)
+        return api.json_response(
+            {
+                "key": key,
+                "offset": offset,
+                "limit": limit,
+                "total": total,
+                "messages": messages,
+                "next_offset": offset + len(messages) if offset + len(messages) < total else None,
+            }
+        )
 
-        document, max_page, status_open, count_all = await find_logs()
+    async def process_media(self, request: Request, *, path: str) -> web.StreamResponse:
+        """
+        Serves an avatar or custom emoji through the caching media proxy.
 
-        log_list = LogList(document, prefix, page, max_page, status_open, count_all)
+        These are public on Discord already, so they don't go through
+        authentication. Only avatars of users found in the logs are served,
+        each client can only cause a limited number of upstream fetches and
+        all of them together a limited number of emoji fetches.
+        """
+        parsed = media.parse_media_path(path)
+        if self.media is None or parsed is None:
+            raise web.HTTPNotFound(reason=f"Invalid path, '{path}'.")
+        kind, media_id, ext = parsed
+        if kind == "avatar":
+            name, max_age = f"avatar-{media_id}", media.AVATAR_MAX_AGE
+        else:
+            name, max_age = f"emoji-{media_id}.{ext}", media.EMOJI_MAX_AGE
+
+        entry = self.media.cached(name, max_age)
+        if entry is not None:
+            request["cache"] = "hit"
+            return self.media.response(entry, max_age)
+
+        request["cache"] = "miss"
+        retry_after = self.media.consume_miss(kind, self.admission.client_address(request))
+        if retry_after:
+            stale = self.media.entries.get(name)
+            if stale is not None:
+                return self.media.response(stale, max_age)
+            return self.admission.reject(429, retry_after, "Too many requests, slow down.")
+
+        if kind == "avatar":
+            source = await self.media.avatar_source(int(media_id))
+        else:
+            source = self.media.emoji_source(media_id, ext)
+        # Without a source, a stale copy is still better than nothing.
+        entry = await self.media.get(name, source, max_age) if source else self.media.entries.get(name)
+        if entry is None:
+            raise web.HTTPNotFound(reason=f"Media '{media_id}' not found.")
+        return self.media.response(entry, max_age)
+
+    @owner_only
+    async def render_export(self, request: Request, **kwargs) -> StreamResponse:
+        """
+        Streams every log matching the `recipient`, `after` and `before` query
+        parameters as NDJSON or as a zip of plain text transcripts.
+        """
+        fmt = request.query.get("format", "ndjson")
+        if fmt not in export.EXPORT_FORMATS:
+            raise web.HTTPBadRequest(reason=f"Invalid export format, '{fmt}'.")
+
+        try:
+            recipient = int(request.query["recipient"]) if request.query.get("recipient") else None
+            after = dateutil.parser.parse(request.query["after"]) if request.query.get("after") else None
+            before = dateutil.parser.parse(request.query["before"]) if request.query.get("before") else None
+        except (ValueError, OverflowError):
+            raise web.HTTPBadRequest(reason="Invalid export filter.")
+
+        batch_size = api.parse_int(
+            request.query.get("batch_size"), default=self.config.export_batch_size, minimum=1, maximum=1000
+        )
+        cursor = self.logs.find(
+            export.export_filter(self.bot.user.id, recipient=recipient, after=after, before=before),
+            projection=export.export_projection(fmt),
+            sort=[("created_at", 1)],
+            batch_size=batch_size,
+        )
 
-        return await self.render_template("loglist", request, data=log_list, **kwargs)
+        response = StreamResponse(
+            status=200,
+            headers={
+                "Content-Type": "application/zip" if fmt == "zip" else "application/x-ndjson",
+                "Content-Disposition": f'attachment; filename="{export.export_filename(fmt)}"',
+            },
+        )
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        try:
+            async for chunk in export.iter_export(cursor, fmt):
+                # `write` waits for the transport to drain, so a slow client
+                # pauses the Mongo cursor instead of growing our buffers.
+                await response.write(chunk)
+        finally:
+            await cursor.close()
+        await response.write_eof()
+        return response
 
     @staticmethod
     async def raise_error(error_type: str, *, message: Optional[str] = None, **kwargs) -> Any:
@@ -326,6 +1376,27 @@ class LogviewerServer:
             message = "No error message."
         raise ret(reason=message, **kwargs)
 
+    def template_context(self, session: Optional[Session]) -> Dict[str, Any]:
+        """
+        Returns the variables every template is rendered with. Without a
+        `session`, the context describes an anonymous, logged in viewer.
+        """
+        user = session.get("user") if session is not None else None
+        return {
+            "session": session,
+            "user": user,
+            "app": self.app,
+            "config": self.config,
+            "using_oauth": self.config.using_oauth,
+            "logged_in": user is not None or (session is None and self.config.using_oauth),
+            "favicon": self.bot.user.display_avatar.replace(size=32, format="webp"),
+        }
+
+    @staticmethod
+    async def render_html(name: str, *args: Any, **kwargs: Any) -> str:
+        template = jinja_env.get_template(name + ".html")
+        return await template.render_async(*args, **kwargs)
+
     async def render_template(
         self,
         name: str,
@@ -334,16 +1405,9 @@ class LogviewerServer:
         **kwargs: Any,
     ) -> Response:
         session = await get_session(request)
-        kwargs["session"] = session
-        kwargs["user"] = session.get("user")
-        kwargs["app"] = request.app
-        kwargs["config"] = self.config
-        kwargs["using_oauth"] = self.config.using_oauth
-        kwargs["logged_in"] = kwargs["user"] is not None
-        kwargs["favicon"] = self.bot.user.display_avatar.replace(size=32, format="webp")
+        kwargs.update(self.template_context(session))
 
-        template = jinja_env.get_template(name + ".html")
-        template = await template.render_async(*args, **kwargs)
+        template = await self.render_html(name, *args, **kwargs)
         response = Response(
             status=200,
             content_type="text/html",
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from aiohttp import web
+from aiohttp_session import AbstractStorage, Session
+from core.models import getLogger
+
+if TYPE_CHECKING:
+    from aiohttp_session import SessionData
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+
+logger = getLogger(__name__)
+
+SESSION_STORES = ("cookie", "memory", "mongo")
+
+
+class ServerSideStorage(AbstractStorage):
+    """
+    Session storage that keeps only a signed session ID in the cookie.
+
+    Session data is held in an in-process LRU with a TTL of `max_age`. When
+    `db` is given, sessions are also written through to that collection so
+    they survive restarts; a TTL index on `session_expires_at` makes Mongo
+    clean up expired ones.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        *,
+        db: Optional[AsyncIOMotorCollection] = None,
+        max_size: int = 10000,
+        max_age: int = 86400,
+        **kwargs,
+    ):
+        super().__init__(max_age=max_age, **kwargs)
+        self._secret: bytes = hashlib.sha256(secret.encode("utf-8")).digest()
+        self._db: Optional[AsyncIOMotorCollection] = db
+        self._max_size: int = max_size
+        self._cache: OrderedDict[str, Tuple[float, SessionData]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def inherit(self, other: ServerSideStorage) -> None:
+        """
+        Takes over the sessions of `other` when the server is reloaded, as
+        long as both sign session IDs with the same secret.
+        """
+        if hmac.compare_digest(self._secret, other._secret):
+            self._cache = other._cache
+
+    async def setup(self) -> None:
+        if self._db is None:
+            return
+        try:
+            await self._db.create_index("session_expires_at", expireAfterSeconds=0, sparse=True)
+        except Exception:
+            logger.warning("Failed to create logviewer session TTL index.", exc_info=True)
+
+    def _signature(self, sid: str) -> str:
+        digest = hmac.new(self._secret, sid.encode("ascii"), hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+    def _sign(self, sid: str) -> str:
+        return f"{sid}.{self._signature(sid)}"
+
+    def _unsign(self, cookie: str) -> Optional[str]:
+        sid, _, signature = cookie.partition(".")
+        if not sid or not signature or not sid.isascii():
+            return None
+        if not hmac.compare_digest(signature, self._signature(sid)):
+            return None
+        return sid
+
+    @staticmethod
+    def _document_id(sid: str) -> str:
+        return f"session_{sid}"
+
+    def _cache_get(self, sid: str) -> Optional[SessionData]:
+        entry = self._cache.get(sid)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if time.monotonic() >= expires_at:
+            del self._cache[sid]
+            return None
+        self._cache.move_to_end(sid)
+        return data
+
+    def _cache_set(self, sid: str, data: SessionData) -> None:
+        self._cache[sid] = (time.monotonic() + self.max_age, data)
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    async def load_session(self, request: web.Request) -> Session:
+        cookie = self.load_cookie(request)
+        sid = self._unsign(cookie) if cookie else None
+        if sid is None:
+            return Session(None, data=None, new=True, max_age=self.max_age)
+
+        data = self._cache_get(sid)
+        if data is None and self._db is not None:
+            document = await self._db.find_one({"_id": self._document_id(sid)})
+            if document and document["session_expires_at"] > datetime.utcnow():
+                data = document["session"]
+                self._cache_set(sid, data)
+        if data is None:
+            return Session(None, data=None, new=True, max_age=self.max_age)
+        return Session(sid, data=data, new=False, max_age=self.max_age)
+
+    async def save_session(
+        self, request: web.Request, response: web.StreamResponse, session: Session
+    ) -> None:
+        sid = session.identity
+        if session.empty:
+            self.save_cookie(response, "", max_age=session.max_age)
+            if sid is not None:
+                self._cache.pop(sid, None)
+                if self._db is not None:
+                    await self._db.delete_one({"_id": self._document_id(sid)})
+            return
+
+        if sid is None:
+            sid = secrets.token_urlsafe(24)
+            session.set_new_identity(sid)
+        data: SessionData = {"created": session.created, "session": dict(session)}
+        self._cache_set(sid, data)
+        if self._db is not None:
+            await self._db.update_one(
+                {"_id": self._document_id(sid)},
+                {
+                    "$set": {
+                        "session": data,
+                        "session_expires_at": datetime.utcnow() + timedelta(seconds=self.max_age),
+                    }
+                },
+                upsert=True,
+            )
+        self.save_cookie(response, self._sign(sid), max_age=session.max_age)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from time import time
+from typing import Any, Dict, List, Optional
+
+from core.models import getLogger
+
+logger = getLogger(__name__)
+
+
+def template_version(templates_path: Path, settings: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Returns a short hash of every template file and of the `settings` that
+    change rendered pages, so snapshots rendered by an older set of
+    templates, or with other settings, are never served.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(templates_path.glob("*.html")):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    digest.update(json.dumps(settings or {}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class SnapshotStore:
+    """
+    On-disk store of pre-rendered, gzip compressed log pages.
+
+    Snapshots live in a directory named after the current template version,
+    which also covers `settings` like whether media URLs point to the proxy.
+    An `index.json` next to them tracks, per log key, when the snapshot
+    stops being valid (e.g. when an attachment URL embedded in it expires),
+    its size on disk and when it was last served. The least recently served
+    snapshots are evicted once the store grows past `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        templates_path: Path,
+        *,
+        max_bytes: int,
+        settings: Optional[Dict[str, Any]] = None,
+    ):
+        self.root: Path = root
+        self.version: str = template_version(templates_path, settings)
+        self.path: Path = root / self.version
+        self.max_bytes: int = max_bytes
+        self.index: Dict[str, List[float]] = {}
+        self.stale_keys: List[str] = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return int(sum(entry[1] for entry in self.index.values()))
+
+    def load(self) -> None:
+        """
+        Loads the index of the current template version and removes snapshots
+        of any other version. Keys that were snapshotted under an old version
+        are kept in `stale_keys` so they can be rebuilt.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        for child in self.root.iterdir():
+            if child == self.path or not child.is_dir():
+                continue
+            try:
+                with open(child / "index.json", encoding="utf-8") as f:
+                    self.stale_keys.extend(json.load(f))
+            except (OSError, ValueError):
+                pass
+            logger.info(f"Removing logviewer snapshots for outdated templates '{child.name}'.")
+            shutil.rmtree(child, ignore_errors=True)
+
+        try:
+            with open(self.path / "index.json", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+        self.index = {k: v for k, v in self.index.items() if self._file(k).is_file()}
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.html.gz"
+
+    def _write_index(self) -> None:
+        tmp = self.path / "index.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        tmp.replace(self.path / "index.json")
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Returns the path to serve for `key`, or `None` if there is no valid snapshot.
+
+        The returned path has no `.gz` suffix; `FileResponse` picks up the
+        compressed sibling itself when the client accepts gzip.
+        """
+        entry = self._valid(key)
+        if entry is None:
+            return None
+        entry[2] = time()
+        return self.path / f"{key}.html"
+
+    def _valid(self, key: str) -> Optional[List[float]]:
+        entry = self.index.get(key)
+        if entry is None or (entry[0] and time() >= entry[0]):
+            return None
+        return entry
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Whether `key` has a valid snapshot. Unlike `get`, this doesn't count
+        as serving it, so checks made by prefetching and backfills leave the
+        eviction order alone.
+        """
+        return self._valid(key) is not None and self._file(key).is_file()
+
+    async def save(self, key: str, html: str, *, expires_at: Optional[float] = None) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            size = await loop.run_in_executor(None, self._save, key, html)
+            self.index[key] = [expires_at or 0, size, time()]
+            evicted = self._evict()
+            await loop.run_in_executor(None, self._write_index)
+        if evicted:
+            logger.debug(f"Evicted {evicted} logviewer snapshots to stay under quota.")
+
+    def _save(self, key: str, html: str) -> int:
+        path = self._file(key)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(gzip.compress(html.encode("utf-8"), compresslevel=6))
+        tmp.replace(path)
+        return path.stat().st_size
+
+    def _evict(self) -> int:
+        total = self.size
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        for key, (_, size, _) in sorted(self.index.items(), key=lambda i: i[1][2]):
+            if total <= self.max_bytes:
+                break
+            self._file(key).unlink(missing_ok=True)
+            del self.index[key]
+            total -= size
+            evicted += 1
+        return evicted
+
+    async def delete(self, key: str) -> None:
+        async with self._lock:
+            if self.index.pop(key, None) is not None:
+                self._file(key).unlink(missing_ok=True)
+                self._write_index()
+
+    async def clear(self) -> None:
+        async with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.index = {}
+            self._write_index()
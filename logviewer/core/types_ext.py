@@ -45,3 +45,34 @@ class LogEntryPayload(TypedDict):
     closer: Optional[AuthorPayload]
     close_message: Optional[str]
     messages: List[MessagePayload]
+
+
+# Trimmed shapes returned by the loaders in `loaders.py` for the plain text view.
+
+
+class RawAuthorPayload(TypedDict):
+    id: str
+    name: str
+    discriminator: str
+    mod: bool
+
+
+class RawMessagePayload(TypedDict):
+    message_id: str
+    timestamp: str
+    content: str
+    attachments: List[AttachmentPayload]
+    author: RawAuthorPayload
+
+
+class RawLogEntryPayload(TypedDict):
+    key: str
+    open: bool
+    created_at: str
+    closed_at: Optional[str]
+    channel_id: str
+    guild_id: str
+    creator: RawAuthorPayload
+    recipient: RawAuthorPayload
+    closer: Optional[RawAuthorPayload]
+    messages: List[RawMessagePayload]
@@ -2,8 +2,10 @@ from __future__ import annotations
 
 import json
 import os
+import tempfile
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlencode
 
 import discord
 from core import checks
@@ -12,11 +14,17 @@ from core.utils import strtobool
 from discord.ext import commands
 from discord.utils import MISSING
 
-from .core.servers import LogviewerServer
+# Only modules with light dependencies are imported here. The web server
+# stack (aiohttp.web, jinja2, cryptography, aiohttp_session) and the log
+# models are imported when they are first needed, so loading the plugin
+# stays cheap when the server isn't started.
+from .core import analytics, loaders
 
 if TYPE_CHECKING:
     from bot import ModmailBot
 
+    from .core.servers import LogviewerServer
+
 info_json = Path(__file__).parent.resolve() / "info.json"
 with open(info_json, encoding="utf-8") as f:
     __plugin_info__ = json.loads(f.read())
@@ -47,8 +55,30 @@ class Logviewer(commands.Cog, name=__plugin_name__):
             "ssl_cert_path": None,
             "ssl_key_path": None,
             "encryption_key": "A sophisticated key",
+            "export_batch_size": 100,
+            "snapshot_path": None,
+            "snapshot_quota": 256,
+            "session_store": "cookie",
+            "media_cache_path": None,
+            "media_cache_quota": 128,
+            "media_cdn_url": None,
+            "max_concurrent_renders": 8,
+            "render_queue_size": 32,
+            "render_queue_timeout": 10,
+            "rate_limit": 120,
+            "rate_burst": 30,
+            "negative_cache_ttl": 30,
+            "drain_timeout": 10,
+            "loop_lag_threshold": 250,
+            "render_cache_size": 32,
+            "read_pool_size": 0,
+            "read_mongo_uri": None,
+            "warmup_logs": 20,
+            "warmup_pages": 2,
+            "access_log_sample": 0.1,
         }
         self.server: LogviewerServer = MISSING
+        self.analytics = analytics.AnalyticsStore(self.db)
 
     async def cog_load(self) -> None:
         self.config = await self.db.find_one({"_id": "logviewer"})
@@ -63,7 +93,7 @@ class Logviewer(commands.Cog, name=__plugin_name__):
             )
         await self.update_config()
         if strtobool(os.environ.get("LOGVIEWER_AUTOSTART", True)):
-            self.server = LogviewerServer(self.bot, config=self.config)
+            self.server = self._new_server()
             await self.server.start()
 
     async def update_config(self):
@@ -76,6 +106,24 @@ class Logviewer(commands.Cog, name=__plugin_name__):
     async def cog_unload(self) -> None:
         await self._stop_server()
 
+    def _new_server(self) -> LogviewerServer:
+        from .core.servers import LogviewerServer
+
+        return LogviewerServer(self.bot, config=self.config, db=self.db)
+
+    async def _reload_server(self) -> None:
+        """
+        Replaces the running server without closing its port. The new server
+        is started on the same socket first, then the old one stops taking
+        connections and finishes the requests it already has. If the new
+        server fails to start, the old one keeps running.
+        """
+        previous = self.server
+        server = self._new_server()
+        await server.start(previous=previous)
+        self.server = server
+        await previous.stop(drain_timeout=server.config.drain_timeout)
+
     async def _stop_server(self) -> None:
         if self.server:
             await self.server.stop()
@@ -149,6 +197,176 @@ class Logviewer(commands.Cog, name=__plugin_name__):
         await ctx.message.delete()
         await ctx.send("Logviewer encryption key set.")
 
+    @logviewer_config.command(name="media_quota")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_media_quota(self, ctx: commands.Context, megabytes: int):
+        """
+        Set the disk quota in megabytes for cached avatars and emojis. Set to `0` to disable the media proxy and load them straight from Discord.
+        Webserver must be restarted for this change to take effect.
+        """
+        if megabytes < 0:
+            raise commands.BadArgument("Media cache quota cannot be negative.")
+        self.config["media_cache_quota"] = megabytes
+        await self.update_config()
+        await ctx.send("Logviewer media cache quota set.")
+
+    @logviewer_config.command(name="concurrency")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_concurrency(
+        self, ctx: commands.Context, max_renders: int, queue_size: int = 32, queue_timeout: float = 10
+    ):
+        """
+        Set how many log pages can be rendered at once, how many more requests may wait for a slot and for how many seconds.
+        Requests beyond that get a `503` with `Retry-After`. Set `max_renders` to `0` to disable the limit.
+        Webserver must be restarted for this change to take effect.
+        """
+        if max_renders < 0 or queue_size < 0 or queue_timeout <= 0:
+            raise commands.BadArgument("Limits cannot be negative and the timeout must be positive.")
+        self.config["max_concurrent_renders"] = max_renders
+        self.config["render_queue_size"] = queue_size
+        self.config["render_queue_timeout"] = queue_timeout
+        await self.update_config()
+        await ctx.send("Logviewer concurrency limits set.")
+
+    @logviewer_config.command(name="ratelimit")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_ratelimit(self, ctx: commands.Context, per_minute: int, burst: int = 30):
+        """
+        Set how many requests per minute each IP address may make, with bursts of up to `burst` requests.
+        Set `per_minute` to `0` to disable rate limiting. Webserver must be restarted for this change to take effect.
+        """
+        if per_minute < 0 or burst < 1:
+            raise commands.BadArgument("Rate limit cannot be negative and burst must be at least 1.")
+        self.config["rate_limit"] = per_minute
+        self.config["rate_burst"] = burst
+        await self.update_config()
+        await ctx.send("Logviewer rate limit set.")
+
+    @logviewer_config.command(name="negative_ttl")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_negative_ttl(self, ctx: commands.Context, seconds: float):
+        """
+        Set for how many seconds a log key that wasn't found is remembered, so repeated requests for it skip the database.
+        Set to `0` to disable. Webserver must be restarted for this change to take effect.
+        """
+        if seconds < 0:
+            raise commands.BadArgument("TTL cannot be negative.")
+        self.config["negative_cache_ttl"] = seconds
+        await self.update_config()
+        await ctx.send("Logviewer negative cache TTL set.")
+
+    @logviewer_config.command(name="drain_timeout")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_drain_timeout(self, ctx: commands.Context, seconds: float):
+        """
+        Set how many seconds requests in flight get to finish when the webserver is restarted or reloaded.
+        """
+        if seconds < 0:
+            raise commands.BadArgument("Timeout cannot be negative.")
+        self.config["drain_timeout"] = seconds
+        await self.update_config()
+        await ctx.send("Logviewer drain timeout set.")
+
+    @logviewer_config.command(name="lag_threshold")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_lag_threshold(self, ctx: commands.Context, milliseconds: float):
+        """
+        Set the event loop lag, in milliseconds, above which `/readyz` reports the webserver as not ready and `logviewer info` warns.
+        Webserver must be restarted for this change to take effect.
+        """
+        if milliseconds <= 0:
+            raise commands.BadArgument("Threshold must be positive.")
+        self.config["loop_lag_threshold"] = milliseconds
+        await self.update_config()
+        await ctx.send("Logviewer loop lag threshold set.")
+
+    @logviewer_config.command(name="render_cache")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_render_cache(self, ctx: commands.Context, megabytes: int):
+        """
+        Set how many megabytes of rendered open logs are kept, so views of open logs only format the messages added since the last view.
+        Set to `0` to disable. Webserver must be restarted for this change to take effect.
+        """
+        if megabytes < 0:
+            raise commands.BadArgument("Cache size cannot be negative.")
+        self.config["render_cache_size"] = megabytes
+        await self.update_config()
+        await ctx.send("Logviewer render cache size set.")
+
+    @logviewer_config.command(name="access_log_sample")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_access_log_sample(self, ctx: commands.Context, rate: float):
+        """
+        Set the share of static file, media and `304 Not Modified` responses written to the access log, from `0` to `1`.
+        Errors and every other request are always logged. Webserver must be restarted for this change to take effect.
+        """
+        if not 0 <= rate <= 1:
+            raise commands.BadArgument("Sample rate must be between 0 and 1.")
+        self.config["access_log_sample"] = rate
+        await self.update_config()
+        await ctx.send("Logviewer access log sample rate set.")
+
+    @logviewer_config.command(name="warmup")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_warmup(self, ctx: commands.Context, logs: int, pages: int = 2):
+        """
+        Set how many of the newest logs and log list pages are loaded in the background when the webserver starts, along with the logs viewed last before the restart.
+        Set both to `0` to only warm up recently viewed logs. Takes effect on the next start.
+        """
+        if logs < 0 or pages < 0:
+            raise commands.BadArgument("Warm-up sizes cannot be negative.")
+        self.config["warmup_logs"] = logs
+        self.config["warmup_pages"] = pages
+        await self.update_config()
+        await ctx.send("Logviewer warm-up set.")
+
+    @logviewer_config.command(name="read_pool")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_read_pool(self, ctx: commands.Context, size: int):
+        """
+        Set the connection pool size of a database client used only by the webserver, so page views don't compete with the bot for connections.
+        Reads through it prefer secondaries of a replica set, except for log pages and the log list, which are cached and so still read from the primary. Set to `0` to share the bot's client (default). Webserver must be restarted for this change to take effect.
+        """
+        if size < 0:
+            raise commands.BadArgument("Pool size cannot be negative.")
+        self.config["read_pool_size"] = size
+        await self.update_config()
+        await ctx.send("Logviewer read pool size set.")
+
+    @logviewer_config.command(name="read_uri")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_read_uri(self, ctx: commands.Context, *, uri: str):
+        """
+        Set the MongoDB connection URI of the webserver's own client, e.g. to point it at a replica set member. Defaults to the bot's connection URI.
+        Only used when `[prefix]logviewer config read_pool` is set. Webserver must be restarted for this change to take effect.
+
+        Note: `LOGVIEWER_READ_MONGO_URI` environment variable will always override this settings.
+        """
+        self.config["read_mongo_uri"] = uri
+        await self.update_config()
+        await ctx.message.delete()
+        await ctx.send("Logviewer read URI set.")
+
+    @logviewer_config.command(name="session_store")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_session_store(self, ctx: commands.Context, store: str.lower):
+        """
+        Set where Logviewer sessions are stored. Webserver must be restarted for this change to take effect.
+
+        - `cookie`: the whole session is encrypted into the cookie (default).
+        - `memory`: the cookie only holds a signed session ID and sessions are kept in memory. Users are logged out on restart.
+        - `mongo`: same as `memory`, but sessions are also saved to the database so they survive restarts.
+
+        Note: `LOGVIEWER_SESSION_STORE` environment variable will always override this settings.
+        """
+        from .core.sessions import SESSION_STORES
+
+        if store not in SESSION_STORES:
+            raise commands.BadArgument(f"Session store must be one of {', '.join(SESSION_STORES)}.")
+        self.config["session_store"] = store
+        await self.update_config()
+        await ctx.send("Logviewer session store set.")
+
     @logviewer_config.command(name="port")
     @checks.has_permissions(PermissionLevel.OWNER)
     async def set_port(self, ctx: commands.Context, port: int):
@@ -169,6 +387,44 @@ class Logviewer(commands.Cog, name=__plugin_name__):
         await self.update_config()
         await ctx.send("Logviewer pagination set.")
 
+    @logviewer_config.command(name="export_batch_size")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_export_batch_size(self, ctx: commands.Context, batch_size: int):
+        """
+        Set the number of logs fetched from the database per batch when exporting. Larger batches are faster but use more memory.
+        Webserver must be restarted for this change to take effect.
+        """
+        if not 1 <= batch_size <= 1000:
+            raise commands.BadArgument("Batch size must be between 1 and 1000.")
+        self.config["export_batch_size"] = batch_size
+        await self.update_config()
+        await ctx.send("Logviewer export batch size set.")
+
+    @logviewer_config.command(name="snapshot_quota")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_snapshot_quota(self, ctx: commands.Context, megabytes: int):
+        """
+        Set the disk quota in megabytes for pre-rendered snapshots of closed logs. Set to `0` to disable snapshots.
+        Webserver must be restarted for this change to take effect.
+        """
+        if megabytes < 0:
+            raise commands.BadArgument("Snapshot quota cannot be negative.")
+        self.config["snapshot_quota"] = megabytes
+        await self.update_config()
+        await ctx.send("Logviewer snapshot quota set.")
+
+    @logviewer_config.command(name="snapshot_path")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def set_snapshot_path(self, ctx: commands.Context, *, path: str):
+        """
+        Set the directory where snapshots of closed logs are stored. Webserver must be restarted for this change to take effect.
+
+        Note: `LOGVIEWER_SNAPSHOT_PATH` environment variable will always override this settings.
+        """
+        self.config["snapshot_path"] = path
+        await self.update_config()
+        await ctx.send("Logviewer snapshot path set.")
+
     @logviewer_config.group(name="remove", aliases=["reset", "delete"])
     @checks.has_permissions(PermissionLevel.OWNER)
     async def remove_config(self, ctx: commands.Context):
@@ -206,6 +462,16 @@ class Logviewer(commands.Cog, name=__plugin_name__):
         await self.update_config()
         await ctx.send("SSL certificate key path removed.")
 
+    @remove_config.command(name="read_uri")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def remove_read_uri(self, ctx: commands.Context):
+        """
+        Remove the webserver's database URI, its client connects with the bot's URI again. Webserver must be restarted for this change to take effect.
+        """
+        self.config["read_mongo_uri"] = None
+        await self.update_config()
+        await ctx.send("Logviewer read URI removed.")
+
     @remove_config.command(name="encryption_key", aliases=["session_key"])
     @checks.has_permissions(PermissionLevel.OWNER)
     async def remove_encryption_key(self, ctx: commands.Context):
@@ -225,7 +491,7 @@ class Logviewer(commands.Cog, name=__plugin_name__):
         if self.server:
             raise commands.BadArgument("Logviewer server is already running.")
 
-        self.server = LogviewerServer(self.bot, config=self.config)
+        self.server = self._new_server()
         await self.server.start()
         embed = discord.Embed(
             title="Start",
@@ -255,11 +521,14 @@ class Logviewer(commands.Cog, name=__plugin_name__):
     async def lv_restart(self, ctx: commands.Context):
         """
         Restarts the log viewer server.
+
+        The port stays open throughout: the new server takes over the listening socket before the old one stops, and requests in flight are given `drain_timeout` seconds to finish.
         """
         if self.server:
-            await self._stop_server()
-        self.server = LogviewerServer(self.bot, config=self.config)
-        await self.server.start()
+            await self._reload_server()
+        else:
+            self.server = self._new_server()
+            await self.server.start()
         embed = discord.Embed(
             title="Restart",
             color=self.bot.main_color,
@@ -267,6 +536,310 @@ class Logviewer(commands.Cog, name=__plugin_name__):
         )
         await ctx.send(embed=embed)
 
+    @logviewer.command(name="export")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_export(
+        self,
+        ctx: commands.Context,
+        fmt: str.lower = "ndjson",
+        recipient: Optional[discord.User] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ):
+        """
+        Exports logs as NDJSON or as a zip of plain text transcripts.
+
+        `fmt` may be `ndjson` or `zip`. Optionally filter by `recipient` and by creation date with `after` and `before` (e.g. `2025-01-01`).
+        If the export is too large to upload here, a link to the owner-only `/export` endpoint is sent instead.
+        """
+        import dateutil.parser
+
+        from .core import export
+
+        if fmt not in export.EXPORT_FORMATS:
+            raise commands.BadArgument(f"Format must be one of {', '.join(export.EXPORT_FORMATS)}.")
+        try:
+            after_dt = dateutil.parser.parse(after) if after else None
+            before_dt = dateutil.parser.parse(before) if before else None
+        except (ValueError, OverflowError):
+            raise commands.BadArgument("Dates must be in a format like `2025-01-01`.")
+
+        query = {"format": fmt}
+        if recipient:
+            query["recipient"] = recipient.id
+        if after_dt:
+            query["after"] = after_dt.isoformat()
+        if before_dt:
+            query["before"] = before_dt.isoformat()
+
+        filesize_limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+        cursor = self.bot.api.logs.find(
+            export.export_filter(
+                self.bot.user.id,
+                recipient=recipient.id if recipient else None,
+                after=after_dt,
+                before=before_dt,
+            ),
+            projection=export.export_projection(fmt),
+            sort=[("created_at", 1)],
+            batch_size=int(self.config.get("export_batch_size") or 100),
+        )
+        async with ctx.typing():
+            with tempfile.TemporaryFile() as fp:
+                try:
+                    async for chunk in export.iter_export(cursor, fmt):
+                        fp.write(chunk)
+                        if fp.tell() > filesize_limit:
+                            break
+                finally:
+                    await cursor.close()
+
+                if fp.tell() <= filesize_limit:
+                    fp.seek(0)
+                    file = discord.File(fp, filename=export.export_filename(fmt))
+                    return await ctx.send("Logviewer export complete.", file=file)
+
+        log_url = (self.config.get("log_url") or "").rstrip("/")
+        await ctx.send(
+            "This export is too large to upload here, download it from the logviewer instead:\n"
+            f"<{log_url}/export?{urlencode(query)}>"
+        )
+
+    @logviewer.group(name="snapshot", invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_snapshot(self, ctx: commands.Context):
+        """
+        Shows the state of the snapshot store for closed logs.
+        """
+        if not self.server or not self.server.snapshots:
+            raise commands.BadArgument("Logviewer snapshots are not enabled.")
+        snapshots = self.server.snapshots
+        embed = discord.Embed(
+            title="Snapshots",
+            color=self.bot.main_color,
+            description=(
+                f"`{len(snapshots.index)}` snapshots using `{snapshots.size / 1024 / 1024:.1f}` "
+                f"out of `{snapshots.max_bytes / 1024 / 1024:.0f}` MB.\n"
+                f"Template version: `{snapshots.version}`"
+            ),
+        )
+        await ctx.send(embed=embed)
+
+    @lv_snapshot.command(name="backfill")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_snapshot_backfill(self, ctx: commands.Context, limit: int = 0):
+        """
+        Pre-renders snapshots of closed logs that don't have one yet, newest first.
+
+        `limit` caps the number of snapshots written, `0` means no limit.
+        """
+        if not self.server or not self.server.snapshots:
+            raise commands.BadArgument("Logviewer snapshots are not enabled.")
+        async with ctx.typing():
+            count = await self.server.backfill_snapshots(limit=limit)
+        await ctx.send(f"Rendered `{count}` logviewer snapshots.")
+
+    @lv_snapshot.command(name="clear")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_snapshot_clear(self, ctx: commands.Context):
+        """
+        Deletes every stored snapshot.
+        """
+        if not self.server or not self.server.snapshots:
+            raise commands.BadArgument("Logviewer snapshots are not enabled.")
+        await self.server.snapshots.clear()
+        await ctx.send("Logviewer snapshots cleared.")
+
+    @logviewer.group(name="analytics", invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_analytics(self, ctx: commands.Context):
+        """
+        Shows the thread analytics of the last 30 days and a link to the dashboard.
+
+        Threads are counted when they are closed. Run `logviewer analytics backfill` once to include threads closed before this was set up.
+        """
+        report = await self.analytics.report(30)
+        progress = await self.analytics.progress()
+        embed = discord.Embed(
+            title="Analytics",
+            color=self.bot.main_color,
+            url=f"{self.config['log_url'].rstrip('/')}/analytics",
+            description=(
+                f"`{report['threads']}` threads in the last 30 days.\n"
+                f"Median first response: `{analytics.format_duration(report['median_response'])}`\n"
+                f"Messages per thread: `{report['messages_per_thread']}`"
+            ),
+        )
+        if report["moderators"]:
+            embed.add_field(
+                name="Top moderators",
+                value="\n".join(f"{m['name']}: `{m['messages']}`" for m in report["moderators"][:5]),
+            )
+        if not progress.get("done"):
+            embed.set_footer(text="Backfill not finished, older threads may be missing.")
+        await ctx.send(embed=embed)
+
+    @lv_analytics.command(name="backfill")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_analytics_backfill(self, ctx: commands.Context, limit: int = 0):
+        """
+        Adds closed logs to the analytics rollups, newest first, in batches.
+
+        Progress is saved as it goes, so running this again resumes where it stopped. `limit` caps the number of logs added in this run, `0` means no limit.
+        """
+        async with ctx.typing():
+            count = await self.analytics.backfill(
+                self.bot.api.logs,
+                self.bot.user.id,
+                batch_size=int(self.config.get("export_batch_size") or 100),
+                limit=limit,
+            )
+        progress = await self.analytics.progress()
+        status = "Backfill complete." if progress.get("done") else "Run this again to continue."
+        await ctx.send(f"Added `{count}` logs to analytics. {status}")
+
+    @lv_analytics.command(name="reset")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_analytics_reset(self, ctx: commands.Context):
+        """
+        Deletes every analytics rollup. Use `logviewer analytics backfill` to rebuild them.
+        """
+        await self.analytics.reset()
+        await ctx.send("Logviewer analytics reset.")
+
+    @logviewer.group(name="memory", invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_memory(self, ctx: commands.Context):
+        """
+        Shows the memory used by the logviewer caches and, while tracing, where memory was allocated.
+
+        Run `logviewer memory start` to trace allocations. Each report then shows what grew since the previous one, so run this before and after the usage you want to look into. The same report is served as JSON at `/memory` to the bot owner.
+        """
+        if not self.server:
+            raise commands.BadArgument("Logviewer server is not running.")
+        async with ctx.typing():
+            report = await self.server.memory_report()
+
+        rss = report["rss"]
+        embed = discord.Embed(
+            title="Memory",
+            color=self.bot.main_color,
+            description=f"Process RSS: `{rss / 1024 / 1024:.1f} MB`" if rss is not None else None,
+        )
+        embed.add_field(
+            name="Caches",
+            value="```\n"
+            + "\n".join(
+                f"{name}: {cache['entries']} ({cache['bytes'] // 1024} KB)"
+                for name, cache in report["caches"].items()
+            )
+            + "\n```",
+            inline=False,
+        )
+        embed.add_field(
+            name="Objects",
+            value="```\n"
+            + "\n".join(f"{name}: {count}" for name, count in report["objects"].items())
+            + "\n```",
+            inline=False,
+        )
+
+        allocations = report.get("allocations")
+        if allocations is None:
+            embed.set_footer(text="Allocations aren't traced, run `logviewer memory start` to trace them.")
+            await ctx.send(embed=embed)
+            return
+
+        def row(item: dict) -> str:
+            line = f"{item['size'] // 1024} KB"
+            if "size_diff" in item:
+                line += f" ({item['size_diff'] / 1024:+.0f} KB)"
+            return f"{line} {item['name']}"
+
+        embed.add_field(
+            name="Traced",
+            value=(
+                f"`{allocations['traced'] / 1024 / 1024:.1f} MB`, peak `{allocations['peak'] / 1024 / 1024:.1f} MB`, "
+                f"tracing overhead `{allocations['overhead'] / 1024 / 1024:.1f} MB`"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="Top allocation sites",
+            value="```\n" + "\n".join(row(item) for item in allocations["sites"])[:1000] + "\n```",
+            inline=False,
+        )
+        embed.add_field(
+            name="Top lines by growth" if allocations["interval"] is not None else "Top lines",
+            value="```\n" + "\n".join(row(item) for item in allocations["lines"])[:1000] + "\n```",
+            inline=False,
+        )
+        if allocations["interval"] is not None:
+            embed.set_footer(text=f"Changes since the previous report, {allocations['interval']:g}s ago.")
+        else:
+            embed.set_footer(text="Run this again to see what changed.")
+        await ctx.send(embed=embed)
+
+    @lv_memory.command(name="start")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_memory_start(self, ctx: commands.Context):
+        """
+        Starts tracing memory allocations. This slows down the bot a bit and uses more memory, stop it when done.
+        """
+        if not self.server:
+            raise commands.BadArgument("Logviewer server is not running.")
+        if not self.server.memory.start():
+            raise commands.BadArgument("Memory allocations are already traced.")
+        await ctx.send("Tracing memory allocations. Run `logviewer memory` to see the report.")
+
+    @lv_memory.command(name="stop")
+    @checks.has_permissions(PermissionLevel.OWNER)
+    async def lv_memory_stop(self, ctx: commands.Context):
+        """
+        Stops tracing memory allocations.
+        """
+        if not self.server:
+            raise commands.BadArgument("Logviewer server is not running.")
+        self.server.memory.stop()
+        await ctx.send("Stopped tracing memory allocations.")
+
+    @commands.Cog.listener()
+    async def on_thread_ready(self, thread, creator, category, initial_message) -> None:
+        if self.server:
+            self.server.changes.touch()
+
+    @commands.Cog.listener()
+    async def on_thread_reply(self, thread, from_mod, message, anon, plain) -> None:
+        if self.server:
+            self.server.changes.touch(reply=True)
+            await self.server.push_live(thread.channel.id)
+
+    @commands.Cog.listener()
+    async def on_thread_close(self, thread, closer, silent, delete_channel, message, scheduled) -> None:
+        if self.server:
+            self.server.changes.touch()
+            self.server.live.close_channel(thread.channel.id)
+        snapshots = self.server.snapshots if self.server else None
+        # The log view projection covers what the rollups need as well.
+        projection = loaders.LOG_VIEW_PROJECTION if snapshots else analytics.ANALYTICS_PROJECTION
+        document = await self.bot.api.logs.find_one(
+            {"channel_id": str(thread.channel.id)}, projection=projection
+        )
+        if not document:
+            return
+        if self.server and self.server.render_cache:
+            self.server.render_cache.discard(document["key"])
+        try:
+            await self.analytics.record(document)
+        except Exception:
+            logger.error(f"Failed to add log entry '{document['key']}' to analytics.", exc_info=True)
+        if not snapshots:
+            return
+        try:
+            await self.server.save_snapshot(document)
+        except Exception:
+            logger.error(f"Failed to snapshot log entry '{document['key']}'.", exc_info=True)
+
     @logviewer.command(name="info")
     @checks.has_permissions(PermissionLevel.OWNER)
     async def lv_info(self, ctx: commands.Context):
@@ -291,6 +864,49 @@ class Logviewer(commands.Cog, name=__plugin_name__):
         embed.description = f"Serving over `{'HTTPS' if self.server.is_https else 'HTTP'}` on port `{self.server.config.port}`.\n"
         embed.add_field(name="Dependencies", value=f"```py\n{main_deps}\n```")
 
+        health = await self.server.health()
+        lag, database = health["loop_lag"], health["database"]
+        requests, caches = health["requests"], health["caches"]
+        latency = f"{database['latency']} ms" if database["ok"] else "unreachable"
+        embed.add_field(
+            name="Health",
+            value=(
+                "```\n"
+                f"Loop lag: {lag['current']} ms (peak {lag['peak']} ms)\n"
+                f"Database ping: {latency}\n"
+                f"Requests: {requests['active']} active, {requests['rendering']} rendering, "
+                f"{requests['queued']} queued\n"
+                f"Snapshots: {caches['snapshots']} ({caches['snapshot_bytes'] // 1024} KB)\n"
+                f"Media: {caches['media']} ({caches['media_bytes'] // 1024} KB)\n"
+                f"Sessions: {caches['sessions']}, missing keys: {caches['missing_keys']}\n"
+                "```"
+            ),
+            inline=False,
+        )
+        pool = health.get("read_pool")
+        if pool is not None:
+            embed.add_field(
+                name="Read pool",
+                value=(
+                    "```\n"
+                    f"Connections: {pool['open']} open, {pool['in_use']} in use (max {pool['size']})\n"
+                    f"Waiting: {pool['waiting']} (peak {pool['peak_waiting']})\n"
+                    f"Checkouts: {pool['checkouts']}, wait timeouts: {pool['wait_timeouts']}\n"
+                    "```"
+                ),
+                inline=False,
+            )
+        if self.server.is_lagging():
+            embed.add_field(
+                name="Warning",
+                value=f"Event loop lag peaked above `{lag['threshold']:g} ms`, renders may be blocking the bot.",
+                inline=False,
+            )
+            embed.color = discord.Color.orange()
+        elif not database["ok"]:
+            embed.add_field(name="Warning", value="Database did not answer the ping.", inline=False)
+            embed.color = discord.Color.orange()
+
         embed.set_footer(text=f"Version: v{__version__}")
 
         await ctx.send(embed=embed)
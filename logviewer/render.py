@@ -0,0 +1,315 @@
+"""
+Renders an export of Modmail logs into a static site, without running the bot.
+
+    python render.py logs.json [more dumps...] --output site
+
+Dumps can be `mongoexport` JSON, one document per line or as an array, or
+`mongodump` BSON, either optionally gzipped. Every log is rendered to
+`<prefix>/<key>/index.html`, with its plain text transcript at
+`<prefix>/raw/<key>.txt`, next to an index of all logs and a copy of the
+static files. Serve the output directory as the root of a website.
+
+Attachment URLs aren't refreshed and avatars are loaded from Discord directly.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import importlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import types
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+PLUGIN_DIR = Path(__file__).resolve().parent
+
+# Documents sent to a worker at once.
+BATCH_SIZE = 20
+
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 5
+
+COMPRESS_MODES = ("both", "gzip", "none")
+
+# Fields of each log kept in memory for the index page.
+INDEX_FIELDS = ("key", "open", "created_at", "closed_at", "creator", "recipient", "nsfw", "title")
+
+logger = logging.getLogger("logviewer.render")
+
+
+def bootstrap() -> None:
+    """
+    Makes the plugin importable on its own. When the bot's `core` package
+    isn't on the path, the logger it provides is replaced with the standard
+    library's, which is all the plugin uses of it.
+    """
+    # Running this file puts the plugin directory on the path, where `core` is the plugin's own package.
+    sys.path[:] = [p for p in sys.path if Path(p or os.curdir).resolve() != PLUGIN_DIR]
+    sys.path.insert(0, str(PLUGIN_DIR.parent))
+    try:
+        import core.models
+    except ImportError:
+        core = types.ModuleType("core")
+        core.__path__ = []
+        models = types.ModuleType("core.models")
+        models.getLogger = logging.getLogger
+        core.models = models
+        sys.modules.update({"core": core, "core.models": models})
+
+
+bootstrap()
+
+from jinja2 import Environment, FileSystemLoader  # noqa: E402
+
+models = importlib.import_module(f"{PLUGIN_DIR.name}.core.models")
+
+
+class Renderer:
+    """
+    Renders logs to files. Each worker process has its own.
+    """
+
+    def __init__(self, output: Path, *, prefix: str, compress: str, text: bool):
+        self.output: Path = output
+        self.prefix: str = prefix.strip("/")
+        self.compress: str = compress
+        self.text: bool = text
+        self.env = Environment(loader=FileSystemLoader(PLUGIN_DIR / "templates"), enable_async=True)
+        self.loop = asyncio.new_event_loop()
+        self.context: Dict[str, Any] = {
+            "session": None,
+            "user": None,
+            "app": None,
+            "config": types.SimpleNamespace(log_prefix="/" + self.prefix),
+            "using_oauth": False,
+            "logged_in": False,
+            "favicon": "/static/img/avatar_self.png",
+            # Leaves out everything that needs the webserver, like live updates.
+            "snapshot": True,
+        }
+
+    def render(self, name: str, **kwargs: Any) -> str:
+        template = self.env.get_template(name + ".html")
+        return self.loop.run_until_complete(template.render_async(**self.context, **kwargs))
+
+    def write(self, path: Path, content: str) -> int:
+        """
+        Writes `content` to `path` and, depending on the compression mode, a
+        gzipped copy next to it. Returns the number of bytes written.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = content.encode("utf-8")
+        written = 0
+        if self.compress != "gzip":
+            path.write_bytes(data)
+            written += len(data)
+        if self.compress != "none":
+            # A fixed mtime keeps the output identical across runs.
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            path.with_name(path.name + ".gz").write_bytes(compressed)
+            written += len(compressed)
+        return written
+
+    def render_log(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Renders a log and returns what the index needs to know about it.
+        """
+        log_entry = models.LogEntry(document)
+        key = log_entry.key
+        self.write(
+            self.output / self.prefix / key / "index.html", self.render("logbase", log_entry=log_entry)
+        )
+        if self.text:
+            self.write(self.output / self.prefix / "raw" / f"{key}.txt", log_entry.plain_text())
+
+        messages = document.get("messages") or []
+        summary = {field: document.get(field) for field in INDEX_FIELDS}
+        summary["message_count"] = len(messages)
+        summary["last_message"] = messages[-1] if messages else None
+        return summary
+
+    def render_index(self, summaries: List[Dict[str, Any]]) -> None:
+        summaries.sort(key=lambda s: s["created_at"], reverse=True)
+        log_list = models.LogList(summaries, "/" + self.prefix, 1, 1, None, len(summaries))
+        html = self.render("loglist", data=log_list)
+        self.write(self.output / self.prefix / "index.html", html)
+        if self.prefix:
+            self.write(self.output / "index.html", html)
+
+
+_renderer: Optional[Renderer] = None
+
+
+def _init_worker(output: Path, prefix: str, compress: str, text: bool) -> None:
+    global _renderer
+    _renderer = Renderer(output, prefix=prefix, compress=compress, text=text)
+
+
+def _render_batch(documents: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    summaries, errors = [], []
+    for document in documents:
+        try:
+            summaries.append(_renderer.render_log(document))
+        except Exception as e:
+            errors.append((str(document.get("key")), f"{type(e).__name__}: {e}"))
+    return summaries, errors
+
+
+def _open(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode, encoding="utf-8" if "t" in mode else None)
+    return open(path, mode, encoding="utf-8" if "t" in mode else None)
+
+
+def iter_documents(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the documents of a dump file, without loading it whole.
+    """
+    name = path.name[:-3] if path.suffix == ".gz" else path.name
+    if name.endswith(".bson"):
+        import bson
+
+        with _open(path, "rb") as f:
+            yield from bson.decode_file_iter(f)
+        return
+
+    try:
+        from bson import json_util
+
+        # Turns extended JSON like `{"$oid": ...}` back into BSON types.
+        decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+    except ImportError:
+        decoder = json.JSONDecoder()
+
+    buffer = ""
+    with _open(path, "rt") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            buffer += chunk
+            position = 0
+            while True:
+                # Skips what separates documents, in NDJSON as well as in an array.
+                while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                    position += 1
+                try:
+                    document, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The document continues in the next chunk.
+                    break
+                yield document
+            buffer = buffer[position:]
+    if buffer.strip(" \t\r\n,[]"):
+        raise ValueError(f"Unexpected data at the end of {path}.")
+
+
+def _batches(documents: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for document in documents:
+        # Not needed for rendering, and cheaper to send to the workers without.
+        document.pop("_id", None)
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_dumps(
+    paths: List[Path],
+    output: Path,
+    *,
+    workers: int,
+    prefix: str = "/logs",
+    compress: str = "both",
+    text: bool = True,
+) -> Tuple[int, int, float]:
+    """
+    Renders every log in `paths` to `output` across `workers` processes.
+    Returns the number of logs rendered, the number that failed and the time taken.
+    """
+    started = time.perf_counter()
+    output.mkdir(parents=True, exist_ok=True)
+    shutil.copytree(PLUGIN_DIR / "static", output / "static", dirs_exist_ok=True)
+
+    options = (output, prefix, compress, text)
+    summaries: List[Dict[str, Any]] = []
+    failed = 0
+    reported = started
+
+    def collect(futures: Set[Future]) -> None:
+        nonlocal failed, reported
+        for future in futures:
+            rendered, errors = future.result()
+            summaries.extend(rendered)
+            failed += len(errors)
+            for key, error in errors:
+                logger.error(f"Failed to render log entry '{key}': {error}")
+        now = time.perf_counter()
+        if now - reported >= PROGRESS_INTERVAL:
+            reported = now
+            logger.info(f"Rendered {len(summaries)} logs, {len(summaries) / (now - started):.1f} logs/s.")
+
+    documents = (document for path in paths for document in iter_documents(path))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=options) as pool:
+        pending: Set[Future] = set()
+        for batch in _batches(documents, BATCH_SIZE):
+            # Only a few batches are queued at a time, so huge dumps are never held in memory.
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(_render_batch, batch))
+        collect(pending)
+
+    Renderer(output, prefix=prefix, compress=compress, text=text).render_index(summaries)
+    return len(summaries), failed, time.perf_counter() - started
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Render an export of Modmail logs into a static site.",
+    )
+    parser.add_argument("dumps", nargs="+", type=Path, help="mongoexport JSON or mongodump BSON files")
+    parser.add_argument("-o", "--output", type=Path, default=Path("logviewer-site"), help="output directory")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=os.cpu_count() or 1, help="number of render processes"
+    )
+    parser.add_argument("--prefix", default="/logs", help="URL prefix of the logs, like LOG_URL_PREFIX")
+    parser.add_argument(
+        "--compress",
+        choices=COMPRESS_MODES,
+        default="both",
+        help="write gzipped copies next to the files, only gzipped files, or no gzipped files",
+    )
+    parser.add_argument("--no-text", action="store_true", help="skip the plain text transcripts")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    missing = [str(path) for path in args.dumps if not path.is_file()]
+    if missing:
+        parser.error(f"No such file: {', '.join(missing)}")
+
+    count, failed, elapsed = render_dumps(
+        args.dumps,
+        args.output,
+        workers=max(1, args.workers),
+        prefix=args.prefix,
+        compress=args.compress,
+        text=not args.no_text,
+    )
+    logger.info(
+        f"Rendered {count} logs to {args.output} in {elapsed:.1f}s, "
+        f"{count / elapsed if elapsed else 0:.1f} logs/s. {failed} failed."
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
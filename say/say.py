@@ -1,8 +1,12 @@
 # Say by retke, aka El Laggron
 
+import asyncio
+import heapq
 import re
+import secrets
+import time
 from logging import getLogger
-from typing import Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import discord
 from bot import ModmailBot
@@ -14,6 +18,228 @@ logger = getLogger(__name__)
 
 ROLE_MENTION_REGEX = re.compile(r"<@&(?P<id>[0-9]{17,19})>")
 
+# How many channels `sayall` sends to at once. discord.py queues requests
+# per rate limit bucket on its own, this only keeps a broadcast from
+# flooding the global limit.
+BROADCAST_WORKERS = 5
+
+# Longest embed description Discord accepts.
+EMBED_DESCRIPTION_LIMIT = 4096
+
+# Set names are used as database keys, so no dots or dollar signs.
+SET_NAME_REGEX = re.compile(r"[a-z0-9_-]{1,32}")
+
+DURATION_REGEX = re.compile(r"(?P<amount>[0-9]+)\s*(?P<unit>[wdhms])")
+DURATION_UNITS = {"w": 604800, "d": 86400, "h": 3600, "m": 60, "s": 1}
+
+# Shortest interval a recurring message may have, in seconds.
+MIN_INTERVAL = 60
+
+# Seconds before a job is tried again when its channel can't be sent in,
+# and how many times it is tried before that run is given up on.
+RETRY_DELAY = 60
+RETRY_LIMIT = 60
+
+
+class Duration(commands.Converter):
+    """
+    Converts durations like `30m`, `2h30m` or `1d` to seconds.
+    """
+
+    async def convert(self, ctx: commands.Context, argument: str) -> int:
+        argument = argument.lower()
+        if not re.fullmatch(r"(?:[0-9]+\s*[wdhms])+", argument):
+            raise commands.BadArgument(f"`{argument}` is not a duration, use something like `2h30m`.")
+        return sum(int(m["amount"]) * DURATION_UNITS[m["unit"]] for m in DURATION_REGEX.finditer(argument))
+
+
+def split_lines(lines: List[str], limit: int = EMBED_DESCRIPTION_LIMIT) -> List[str]:
+    """
+    Joins `lines` into as few pages as possible, each at most `limit` characters.
+    """
+    pages, page = [], ""
+    for line in lines:
+        line = line[:limit]
+        if page and len(page) + 1 + len(line) > limit:
+            pages.append(page)
+            page = ""
+        page = f"{page}\n{line}" if page else line
+    if page:
+        pages.append(page)
+    return pages
+
+
+def format_duration(seconds: int) -> str:
+    parts = []
+    for unit, size in DURATION_UNITS.items():
+        if seconds >= size:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return "".join(parts) or "0s"
+
+
+class Scheduler:
+    """
+    Runs scheduled say jobs from a heap with a single timer task.
+
+    Adding a job is a heap push and the timer only ever sleeps until the
+    earliest job, so thousands of pending jobs cost no more than one. Jobs
+    are stored in the plugin's partition with a `job_` ID prefix and loaded
+    back on startup.
+
+    Cancelled or rescheduled jobs are not removed from the heap: their
+    stale entry is skipped when it comes up.
+    """
+
+    def __init__(self, cog: "Say"):
+        self.cog: Say = cog
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+
+    async def load(self) -> None:
+        async for job in self.cog.db.find({"_id": {"$regex": "^job_"}}):
+            self.jobs[job["_id"]] = job
+        self._heap = [(job["run_at"], job_id) for job_id, job in self.jobs.items()]
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run())
+        logger.debug(f"Loaded {len(self.jobs)} scheduled say jobs.")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def add(
+        self,
+        channel: discord.TextChannel,
+        author: discord.Member,
+        text: str,
+        *,
+        delay: int,
+        interval: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        job = {
+            "_id": f"job_{secrets.token_hex(4)}",
+            "channel_id": channel.id,
+            "author_id": author.id,
+            "text": text,
+            "run_at": time.time() + delay,
+            "interval": interval,
+        }
+        await self.cog.db.insert_one(job)
+        self.jobs[job["_id"]] = job
+        self._schedule(job)
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        if self.jobs.pop(job_id, None) is None:
+            return False
+        await self.cog.db.delete_one({"_id": job_id})
+        return True
+
+    def _schedule(self, job: Dict[str, Any]) -> None:
+        if self.jobs.get(job["_id"]) is not job:
+            # Cancelled while it was being sent or updated.
+            return
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (job["run_at"], job["_id"]))
+        if earliest is None or job["run_at"] < earliest:
+            # New earliest job, the timer has to wake up sooner.
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        # Channels aren't cached before the bot is ready.
+        await self.cog.bot.wait_until_ready()
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            run_at, job_id = heapq.heappop(self._heap)
+            job = self.jobs.get(job_id)
+            if job is None or job["run_at"] != run_at:
+                continue
+            # Delivered in the background so a slow send doesn't hold up other due jobs.
+            task = asyncio.create_task(self._deliver(job))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: Dict[str, Any]) -> None:
+        """
+        Sends the message of a due job. The job is only deleted, or moved to
+        its next run, once the message is sent or its retries are used up.
+        """
+        try:
+            try:
+                error = await self._send(job)
+            except Exception as e:
+                logger.error(f"Failed to send scheduled say job {job['_id']}.", exc_info=True)
+                error = str(e)
+            if error is None:
+                await self._complete(job)
+                return
+            retries = job.get("retries", 0) + 1
+            if retries > RETRY_LIMIT:
+                logger.warning(f"Skipping scheduled say job {job['_id']}, {error}.")
+                await self._complete(job)
+                return
+            # The channel may be back later, like after an outage or a permission fix.
+            logger.warning(
+                f"Can't send scheduled say job {job['_id']}, {error}. "
+                f"Retrying in {RETRY_DELAY}s ({retries}/{RETRY_LIMIT})."
+            )
+            # The slot stays, so retries don't shift the later runs of a recurring job.
+            await self._update(
+                job, run_at=time.time() + RETRY_DELAY, slot=job.get("slot", job["run_at"]), retries=retries
+            )
+        except Exception:
+            logger.error(f"Scheduled say job {job['_id']} failed.", exc_info=True)
+
+    async def _send(self, job: Dict[str, Any]) -> Optional[str]:
+        """
+        Sends the message of `job`. Returns why it can't be sent, if it can't.
+        """
+        channel = self.cog.bot.get_channel(job["channel_id"])
+        if channel is None:
+            return f"channel {job['channel_id']} not found"
+        if not channel.permissions_for(channel.guild.me).send_messages:
+            return f"can't send in channel {job['channel_id']}"
+        try:
+            await channel.send(job["text"])
+        except discord.HTTPException as e:
+            return f"sending failed: {e}"
+        return None
+
+    async def _complete(self, job: Dict[str, Any]) -> None:
+        interval = job.get("interval")
+        if not interval:
+            self.jobs.pop(job["_id"], None)
+            await self.cog.db.delete_one({"_id": job["_id"]})
+            return
+        # Runs missed while the bot was offline are coalesced into the one just sent.
+        slot = job.get("slot", job["run_at"])
+        missed = max(0, int((time.time() - slot) // interval))
+        slot += (missed + 1) * interval
+        await self._update(job, run_at=slot, slot=slot, retries=0)
+
+    async def _update(self, job: Dict[str, Any], **fields: Any) -> None:
+        if self.jobs.get(job["_id"]) is not job:
+            return
+        job.update(fields)
+        await self.cog.db.update_one({"_id": job["_id"]}, {"$set": fields})
+        self._schedule(job)
+
 
 class Say(commands.Cog):
     """
@@ -24,7 +250,12 @@ class Say(commands.Cog):
 
     def __init__(self, bot: ModmailBot):
         self.bot = bot
+        self.db = bot.plugin_db.get_partition(self)
         self.interaction = []
+        self.scheduler = Scheduler(self)
+
+    async def cog_load(self) -> None:
+        await self.scheduler.load()
 
     __author__ = ["retke (El Laggron)", "raidensakura"]
     __version__ = "1.0.0"
@@ -169,6 +400,241 @@ class Say(commands.Cog):
                 return
         await self.say(ctx, channel, text, mentions=discord.AllowedMentions(everyone=True, roles=True))
 
+    async def get_channel_sets(self) -> Dict[str, List[int]]:
+        config = await self.db.find_one({"_id": "channel_sets"})
+        return config["sets"] if config else {}
+
+    async def broadcast(
+        self, channels: List[discord.TextChannel], text: str
+    ) -> List[Tuple[discord.TextChannel, Optional[str], float]]:
+        """
+        Sends `text` to every channel with a pool of `BROADCAST_WORKERS` workers.
+
+        Returns `(channel, error, latency)` for each channel, in the order
+        given, where `error` is `None` if the message was sent.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, channel in enumerate(channels):
+            queue.put_nowait((index, channel))
+        results = [None] * len(channels)
+
+        async def worker():
+            while not queue.empty():
+                index, channel = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    await channel.send(text)
+                    error = None
+                except Exception as e:
+                    # Any error is recorded, so one channel can't stop the
+                    # others or leave a hole in the results.
+                    error = (getattr(e, "text", None) or str(e) or type(e).__name__)[:100]
+                    logger.error(f"Failed to send message to {channel}.", exc_info=True)
+                results[index] = (channel, error, time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(min(BROADCAST_WORKERS, len(channels)))))
+        return results
+
+    @commands.command(name="sayall")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayall(
+        self, ctx: commands.Context, channels: commands.Greedy[discord.TextChannel], *, text: str = ""
+    ):
+        """
+        Make the bot say the same thing in several channels at once.
+
+        Instead of listing channels, the message can start with the name of a channel set saved with `sayset`.
+        Nothing is sent if the bot can't send messages in one of the channels.
+
+        Example usage :
+        - `!sayall #general #announcements hello there`
+        - `!sayall announcements hello there`
+        """
+        if not channels and text:
+            name, _, rest = text.partition(" ")
+            channel_sets = await self.get_channel_sets()
+            if name.lower() in channel_sets:
+                channels = [ctx.guild.get_channel(i) for i in channel_sets[name.lower()]]
+                channels = [c for c in channels if c is not None]
+                text = rest.strip()
+        if not channels or not text:
+            await ctx.send_help(ctx.command)
+            return
+        # Listing a channel twice, directly or through a set, sends once.
+        channels = list(dict.fromkeys(channels))
+
+        missing = [c for c in channels if not c.permissions_for(c.guild.me).send_messages]
+        if missing:
+            await ctx.send(
+                "I am not allowed to send messages in {channels}, nothing was sent.".format(
+                    channels=", ".join(c.mention for c in missing)
+                )
+            )
+            return
+
+        async with ctx.typing():
+            results = await self.broadcast(channels, text)
+
+        sent = [r for r in results if r[1] is None]
+        color = ctx.bot.main_color if len(sent) == len(results) else discord.Color.red()
+        pages = split_lines(
+            [
+                f"✅ {channel.mention} `{latency * 1000:.0f} ms`"
+                if error is None
+                else f"❌ {channel.mention} {error}"
+                for channel, error, latency in results
+            ]
+        )
+        # One embed per message, as a message's embeds share a 6000 character limit.
+        for index, page in enumerate(pages):
+            e = discord.Embed(color=color, title="Broadcast" if index == 0 else None, description=page)
+            if index == len(pages) - 1:
+                e.set_footer(text=f"Sent to {len(sent)} of {len(results)} channels")
+            await ctx.send(embed=e)
+
+    @commands.group(name="sayset", invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayset(self, ctx: commands.Context):
+        """
+        Manage the channel sets used by `sayall`.
+        """
+        channel_sets = await self.get_channel_sets()
+        if not channel_sets:
+            await ctx.send("There are no channel sets yet, add one with `sayset add`.")
+            return
+        e = discord.Embed(color=ctx.bot.main_color, title="Channel sets")
+        for name, channel_ids in channel_sets.items():
+            e.add_field(name=name, value=" ".join(f"<#{i}>" for i in channel_ids), inline=False)
+        await ctx.send(embed=e)
+
+    @_sayset.command(name="add")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayset_add(
+        self, ctx: commands.Context, name: str.lower, channels: commands.Greedy[discord.TextChannel]
+    ):
+        """
+        Save a set of channels under a name, replacing any set with the same name.
+        """
+        if not channels:
+            await ctx.send_help(ctx.command)
+            return
+        if not SET_NAME_REGEX.fullmatch(name):
+            await ctx.send("Set names may only contain letters, numbers, `-` and `_`.")
+            return
+        await self.db.find_one_and_update(
+            {"_id": "channel_sets"},
+            {"$set": {f"sets.{name}": [c.id for c in channels]}},
+            upsert=True,
+        )
+        await ctx.send(f"Channel set `{name}` saved with {len(channels)} channels.")
+
+    @_sayset.command(name="remove", aliases=["delete"])
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayset_remove(self, ctx: commands.Context, name: str.lower):
+        """
+        Delete a channel set.
+        """
+        await self.db.find_one_and_update({"_id": "channel_sets"}, {"$unset": {f"sets.{name}": ""}})
+        await ctx.send(f"Channel set `{name}` removed.")
+
+    async def schedule(
+        self,
+        ctx: commands.Context,
+        channel: Optional[discord.TextChannel],
+        text: str,
+        *,
+        delay: int,
+        interval: Optional[int] = None,
+    ):
+        channel = channel or ctx.channel
+        if not text:
+            await ctx.send_help(ctx.command)
+            return
+        if not channel.permissions_for(channel.guild.me).send_messages:
+            await ctx.send(("I am not allowed to send messages in ") + channel.mention)
+            return
+        job = await self.scheduler.add(channel, ctx.author, text, delay=delay, interval=interval)
+        message = f"Message `{job['_id'][4:]}` scheduled in {channel.mention} <t:{int(job['run_at'])}:R>"
+        if interval:
+            message += f", then every `{format_duration(interval)}`"
+        await ctx.send(message + ".")
+
+    @commands.command(name="saylater")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _saylater(
+        self,
+        ctx: commands.Context,
+        channel: Optional[discord.TextChannel],
+        delay: Duration,
+        *,
+        text: str = "",
+    ):
+        """
+        Make the bot say something after a delay, like `30m`, `2h` or `1d12h`.
+
+        Scheduled messages survive restarts. If the bot was offline when a message was due, it is sent once it's back.
+
+        Example usage :
+        - `!saylater #general 2h hello there`
+        """
+        await self.schedule(ctx, channel, text, delay=delay)
+
+    @commands.command(name="sayevery")
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayevery(
+        self,
+        ctx: commands.Context,
+        channel: Optional[discord.TextChannel],
+        interval: Duration,
+        *,
+        text: str = "",
+    ):
+        """
+        Make the bot say something repeatedly, every `interval`, starting one interval from now.
+
+        Runs missed while the bot was offline are sent once, not once per missed interval.
+
+        Example usage :
+        - `!sayevery #general 1d remember to drink water`
+        """
+        if interval < MIN_INTERVAL:
+            await ctx.send(f"The interval must be at least {format_duration(MIN_INTERVAL)}.")
+            return
+        await self.schedule(ctx, channel, text, delay=interval, interval=interval)
+
+    @commands.group(name="sayjobs", invoke_without_command=True)
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayjobs(self, ctx: commands.Context):
+        """
+        List the scheduled and recurring messages, soonest first.
+        """
+        jobs = sorted(self.scheduler.jobs.values(), key=lambda j: j["run_at"])
+        if not jobs:
+            await ctx.send("There are no scheduled messages.")
+            return
+        lines = []
+        for job in jobs[:25]:
+            line = f"`{job['_id'][4:]}` <#{job['channel_id']}> <t:{int(job['run_at'])}:R>"
+            if job.get("interval"):
+                line += f" every `{format_duration(job['interval'])}`"
+            text = job["text"] if len(job["text"]) <= 50 else job["text"][:47] + "..."
+            lines.append(f"{line}\n{discord.utils.escape_markdown(text)}")
+        e = discord.Embed(color=ctx.bot.main_color, title="Scheduled messages", description="\n".join(lines))
+        if len(jobs) > 25:
+            e.set_footer(text=f"And {len(jobs) - 25} more")
+        await ctx.send(embed=e)
+
+    @_sayjobs.command(name="cancel", aliases=["remove", "delete"])
+    @checks.has_permissions(PermissionLevel.ADMINISTRATOR)
+    async def _sayjobs_cancel(self, ctx: commands.Context, job_id: str):
+        """
+        Cancel a scheduled or recurring message by its ID, as shown by `sayjobs`.
+        """
+        if not await self.scheduler.cancel(f"job_{job_id}"):
+            await ctx.send(f"There is no scheduled message `{job_id}`.")
+            return
+        await ctx.send(f"Scheduled message `{job_id}` cancelled.")
+
     @commands.command(hidden=True)
     @checks.has_permissions(PermissionLevel.OWNER)
     async def sayinfo(self, ctx):
@@ -192,6 +658,7 @@ class Say(commands.Cog):
 
     async def cog_unload(self):
         logger.debug("Unloading cog...")
+        self.scheduler.stop()
         for user in self.interaction:
             await self.stop_interaction(user)
 
@@ -0,0 +1,3 @@
+import stubs
+
+stubs.install()
@@ -0,0 +1,109 @@
+"""
+Stand-ins for the modules the Modmail bot provides to its plugins (`bot` and
+`core`), and for discord.py when it isn't installed, so plugin modules can be
+imported on their own. Only what the plugins touch at import time is covered.
+"""
+
+import enum
+import importlib.util
+import logging
+import sys
+import types
+from functools import lru_cache
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@lru_cache(maxsize=None)
+def _placeholder(name: str) -> type:
+    if name.startswith("__"):
+        # Keeps the import system and inspect from mistaking modules for packages.
+        raise AttributeError(name)
+    # Subscriptable for annotations like `commands.Greedy[discord.TextChannel]`.
+    return type(name, (), {"__class_getitem__": classmethod(lambda cls, item: cls)})
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    # Anything else the plugins reference, like `discord.Attachment` in annotations.
+    module.__getattr__ = _placeholder
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+class _Command:
+    """Stands in for commands and command groups, so their decorators can be stacked."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def command(self, **kwargs):
+        return _Command
+
+    def group(self, **kwargs):
+        return _Command
+
+
+class _Cog:
+    def __init_subclass__(cls, **kwargs):
+        pass
+
+    @staticmethod
+    def listener(*args, **kwargs):
+        return lambda func: func
+
+
+class PermissionLevel(enum.IntEnum):
+    OWNER = 5
+    ADMINISTRATOR = 4
+    ADMIN = 4
+    MODERATOR = 3
+    MOD = 3
+    SUPPORTER = 2
+    RESPONDER = 2
+    REGULAR = 1
+    INVALID = -1
+
+
+def _install_discord() -> None:
+    commands = _module(
+        "discord.ext.commands",
+        Cog=_Cog,
+        Context=_placeholder("Context"),
+        BadArgument=type("BadArgument", (Exception,), {}),
+        group=lambda **kwargs: _Command,
+        command=lambda **kwargs: _Command,
+    )
+    ext = _module("discord.ext", commands=commands)
+    utils = _module("discord.utils", MISSING=None)
+    abc = _module("discord.abc")
+    errors = _module("discord.errors", HTTPException=type("HTTPException", (Exception,), {"text": ""}))
+    _module("discord", ext=ext, utils=utils, abc=abc, errors=errors, HTTPException=errors.HTTPException)
+
+
+def install() -> None:
+    """Installs the stand-ins, keeping discord.py if it is installed."""
+    try:
+        import discord  # noqa: F401
+    except ImportError:
+        _install_discord()
+
+    models = _module("core.models", getLogger=logging.getLogger, PermissionLevel=PermissionLevel)
+    checks = _module("core.checks", has_permissions=lambda *args: (lambda func: func))
+    utils = _module("core.utils", strtobool=lambda value: str(value).lower() in ("1", "true", "yes", "on"))
+    thread = _module("core.thread")
+    core = _module("core", models=models, checks=checks, utils=utils, thread=thread)
+    core.__path__ = []
+    _module("bot")
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+
+def load_plugin(path: str, name: str) -> types.ModuleType:
+    """Imports a plugin file whose directory isn't a valid package name, like `video-preview`."""
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+from aiohttp import web
+
+from logviewer.core.access_log import AccessLog, QueuedAccessLogger
+
+
+async def ok(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+async def serve(*requests: bytes):
+    """Sends raw `requests` to a server logging into a fresh `AccessLog`, each on its own connection."""
+    access_log = AccessLog(sample_rate=1.0)
+    app = web.Application()
+    app.router.add_get("/logs/{key}", ok)
+    runner = web.AppRunner(app, access_log_class=QueuedAccessLogger.bind(access_log))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        for raw in requests:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            await reader.read()
+            writer.close()
+    finally:
+        await runner.cleanup()
+    return [AccessLog.format(record) for record in access_log.records]
+
+
+def test_records_routed_requests():
+    lines = asyncio.run(serve(b"GET /logs/abc%20d HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"))
+    assert len(lines) == 1
+    assert " GET /logs/abc%20d 200 " in lines[0]
+    assert "route=/logs/{key}" in lines[0] and "key=abc%20d" in lines[0]
+
+
+def test_records_malformed_requests(caplog):
+    with caplog.at_level(logging.ERROR):
+        lines = asyncio.run(serve(b"GARBAGE\r\n\r\n"))
+    assert "Unhandled exception" not in caplog.text
+    assert len(lines) == 1
+    assert " 400 " in lines[0] and "route=- " in lines[0] and "key=" not in lines[0]
@@ -0,0 +1,34 @@
+import pytest
+
+from logviewer.core.analytics import summarize
+
+
+def log(created_at, *timestamps):
+    author = {"id": 1, "name": "mod", "mod": True}
+    return {
+        "key": "abc",
+        "created_at": created_at,
+        "messages": [{"timestamp": timestamp, "author": author} for timestamp in timestamps],
+    }
+
+
+@pytest.mark.parametrize(
+    "created_at, timestamp",
+    [
+        # As Modmail stores them: `str(datetime)`, naive or aware.
+        ("2025-01-05 23:59:00", "2025-01-06 00:01:00"),
+        ("2025-01-05 23:59:00+00:00", "2025-01-06 00:01:00"),
+        ("2025-01-05 23:59:00", "2025-01-06T02:01:00+02:00"),
+        ("2025-01-06T00:59:00+01:00", "2025-01-06 00:01:00+00:00"),
+        ("2025-01-05 23:59:00.000000", "Mon, 06 Jan 2025 00:01:00 GMT"),
+    ],
+)
+def test_summarize_mixed_timezones(created_at, timestamp):
+    summary = summarize(log(created_at, timestamp))
+    assert summary["day"] == "2025-01-05"
+    assert summary["first_response"] == 120.0
+
+
+def test_summarize_unparsable():
+    assert summarize(log("not a date")) is None
+    assert summarize(log("2025-01-05 00:00:00", "not a date"))["first_response"] is None
@@ -0,0 +1,112 @@
+import html
+import time
+
+import pytest
+
+from logviewer.core import formatter
+from logviewer.core.formatter import format_content_html, format_content_html_timed
+from logviewer.core.models import Message
+
+# Characters in each adversarial message. Quadratic patterns take seconds on
+# messages this long, linear ones a few milliseconds.
+SIZE = 20000
+
+# Upper bound for formatting one of them with the budget lifted, generous
+# enough for slow machines.
+TIME_BOUND = 0.5
+
+ADVERSARIAL = {
+    "unclosed italic": "*a " * (SIZE // 3),
+    "unclosed bold": "**a " * (SIZE // 4),
+    "unclosed underline": "_a " * (SIZE // 3),
+    "unclosed strike": "~~a " * (SIZE // 4),
+    "italic lines": "*a\n" * (SIZE // 3),
+    "mixed delimiters": "*_~`" * (SIZE // 4),
+    "backticks": "`" * SIZE,
+    "unclosed codeblock": "```" + "a\n" * (SIZE // 2),
+    "codeblock fences": "```a" * (SIZE // 4),
+    "bare www": "www." * (SIZE // 4),
+    "url punctuation": "http://" + "." * SIZE,
+    "url parentheses": "http://a" + "(a" * (SIZE // 2),
+    "unclosed emoji": "&lt;:" + "a" * SIZE,
+    "emoji colons": "<:a" * (SIZE // 3),
+    "colons": ":a" * (SIZE // 2),
+    "brackets": "[" * SIZE,
+    "unclosed links": "[a](" * (SIZE // 4),
+    "unclosed link urls": "[a](b" * (SIZE // 5),
+    "link text": "[a]" * (SIZE // 3),
+    "blockquotes": "> " * (SIZE // 2),
+}
+
+
+@pytest.mark.parametrize("allow_links", [False, True])
+@pytest.mark.parametrize("content", ADVERSARIAL.values(), ids=ADVERSARIAL.keys())
+def test_adversarial_linear_time(monkeypatch, content, allow_links):
+    monkeypatch.setattr(formatter, "FORMAT_TIME_BUDGET", 60)
+    started = time.perf_counter()
+    format_content_html(content, allow_links)
+    assert time.perf_counter() - started < TIME_BOUND
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        ("**bold** *italic* __under__ ~~strike~~", "<b>bold</b> <i>italic</i> <u>under</u> <s>strike</s>"),
+        ("`a < b`", '<span class="pre pre--inline">a &lt; b</span>'),
+        (
+            "see https://example.com/a_(b).",
+            'see <a href="https://example.com/a_(b)">https://example.com/a_(b)</a>.',
+        ),
+        ("*a b", "*a b"),
+    ],
+)
+def test_formats(content, expected):
+    assert format_content_html(content) == expected
+
+
+def test_masked_links():
+    assert format_content_html("[docs](https://example.com)", allow_links=True) == (
+        '<a href="https://example.com">docs</a>'
+    )
+    assert format_content_html("[docs](https://example.com)") == (
+        '[docs](<a href="https://example.com">https://example.com</a>)'
+    )
+
+
+def plain(content):
+    return html.escape(content).replace("\n", "<br>")
+
+
+def test_over_budget_falls_back_to_plain_text(monkeypatch):
+    monkeypatch.setattr(formatter, "FORMAT_TIME_BUDGET", 0)
+    content = "**bold** <b>\n" * 10
+    assert format_content_html(content) == plain(content)
+
+
+def test_placeholder_characters_fall_back_to_plain_text():
+    content = "\x1aI**not base64**\x1aI"
+    assert format_content_html(content) == plain(content)
+    # Always formatted the same, so it may be cached.
+    assert format_content_html_timed(content) == (plain(content), False)
+
+
+def message(content):
+    author = {"id": "1", "name": "mod", "discriminator": "0", "mod": True}
+    return Message(
+        {
+            "message_id": "2",
+            "timestamp": "2025-01-05 00:00:00",
+            "attachments": [],
+            "content": content,
+            "author": author,
+        }
+    )
+
+
+def test_messages_over_budget_are_degraded(monkeypatch):
+    fast = message("**bold**")
+    assert fast.content == "<b>bold</b>" and not fast.degraded
+
+    monkeypatch.setattr(formatter, "FORMAT_TIME_BUDGET", 0)
+    slow = message("**bold**")
+    assert slow.content == "**bold**" and slow.degraded
@@ -0,0 +1,30 @@
+import asyncio
+import types
+
+from logviewer.core.health import DatabasePing
+
+
+class Logs:
+    """A collection whose database counts its pings."""
+
+    def __init__(self):
+        self.pings = 0
+        self.database = types.SimpleNamespace(command=self.command)
+
+    async def command(self, name):
+        self.pings += 1
+        await asyncio.sleep(0.01)
+
+
+def test_ping_is_shared_and_cached():
+    async def run():
+        logs, ping = Logs(), DatabasePing(ttl=0.05)
+        latencies = await asyncio.gather(*(ping(logs) for _ in range(10)))
+        assert logs.pings == 1 and all(latency is not None for latency in latencies)
+        await ping(logs)
+        assert logs.pings == 1
+        await asyncio.sleep(0.05)
+        await ping(logs)
+        assert logs.pings == 2
+
+    asyncio.run(run())
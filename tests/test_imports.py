@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+# Only needed once the webserver starts, which may be never with autostart off.
+SERVER_MODULES = (
+    "aiohttp.web",
+    "jinja2",
+    "aiohttp_session",
+    "cryptography",
+    "dateutil",
+    "natural",
+    "logviewer.core.models",
+    "logviewer.core.servers",
+)
+
+# Loaded by the bot before any plugin, so imported first and not counted against the cog.
+BOT_MODULES = ("asyncio", "aiohttp", "pymongo")
+
+# Cumulative import time of the cog, in seconds. It takes 10 to 20 ms, and
+# over 50 ms once it pulls in the server stack.
+IMPORT_TIME_LIMIT = 0.04
+
+SCRIPT = f"""
+import sys
+import {", ".join(BOT_MODULES)}
+import stubs
+
+stubs.install()
+import logviewer.logviewer
+
+print(",".join(name for name in {SERVER_MODULES!r} if name in sys.modules))
+"""
+
+
+@lru_cache(maxsize=None)
+def import_cog() -> subprocess.CompletedProcess:
+    """Imports the cog in a fresh interpreter, as other tests import these modules."""
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parent)}
+    command = [sys.executable, "-X", "importtime", "-c", SCRIPT]
+    # The first run may have to compile the modules.
+    subprocess.run(command, env=env, capture_output=True)
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+def cumulative_import_time(stderr: str, module: str) -> float:
+    """Reads the cumulative time of `module` from `-X importtime` output, in seconds."""
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and line.rsplit("|", 1)[-1].strip() == module:
+            return int(line.split("|")[1]) / 1_000_000
+    raise AssertionError(f"{module} not in the import time output")
+
+
+def test_cog_import_skips_server_modules():
+    assert import_cog().stdout.strip() == ""
+
+
+def test_cog_import_time():
+    stderr = import_cog().stderr
+    # The bot modules, pymongo above all, are imported first and so not part of this.
+    assert cumulative_import_time(stderr, "logviewer.logviewer") < IMPORT_TIME_LIMIT
@@ -0,0 +1,23 @@
+import asyncio
+
+from logviewer.core.live import LiveHub
+
+
+def test_locks_are_per_log():
+    async def run():
+        hub, order = LiveHub(), []
+
+        async def hold(key, name, delay):
+            async with hub.lock(key):
+                order.append(f"{name} start")
+                await asyncio.sleep(delay)
+                order.append(f"{name} end")
+
+        await asyncio.gather(hold("a", "a1", 0.05), hold("a", "a2", 0), hold("b", "b", 0))
+        assert not hub._locks
+        return order
+
+    order = asyncio.run(run())
+    # A slow read of one log doesn't hold up another, and one log's are serialized.
+    assert order.index("b end") < order.index("a1 end")
+    assert order.index("a1 end") < order.index("a2 start")
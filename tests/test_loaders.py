@@ -0,0 +1,66 @@
+import asyncio
+
+from logviewer.core.loaders import load_raw_view
+from logviewer.core.models import LogEntry
+
+AUTHOR = {"id": "1", "name": "user", "discriminator": "0", "avatar_url": "", "mod": False}
+
+ATTACHMENT = {
+    "id": "3",
+    "filename": "a.png",
+    "url": "https://cdn.example.com/a.png",
+    "is_image": True,
+    "size": 10,
+}
+
+DOCUMENT = {
+    "_id": "1",
+    "key": "abc",
+    "open": False,
+    "created_at": "2025-01-05 00:00:00",
+    "closed_at": "2025-01-05 01:00:00",
+    "channel_id": "4",
+    "guild_id": "5",
+    "creator": AUTHOR,
+    "recipient": AUTHOR,
+    "closer": AUTHOR,
+    "close_message": None,
+    "messages": [
+        {
+            "message_id": "2",
+            "timestamp": "2025-01-05 00:00:00",
+            "content": "hello",
+            "author": AUTHOR,
+            "type": "thread_message",
+            # Logs from older Modmail versions store bare URLs.
+            "attachments": ["https://cdn.example.com/old.png", ATTACHMENT],
+        }
+    ],
+}
+
+
+def project(value, paths):
+    """Applies an inclusion projection the way Mongo does, including through arrays."""
+    if isinstance(value, list):
+        # Array elements that are not documents have no fields to include.
+        return [project(item, paths) for item in value if isinstance(item, dict)]
+    result = {}
+    for field in {path[0] for path in paths}:
+        if field in value:
+            rest = [path[1:] for path in paths if path[0] == field and len(path) > 1]
+            included = any(path == (field,) for path in paths)
+            result[field] = value[field] if included or not rest else project(value[field], rest)
+    return result
+
+
+class Logs:
+    async def find_one(self, query, projection, max_time_ms):
+        paths = [tuple(field.split(".")) for field, value in projection.items() if value]
+        return project(DOCUMENT, paths)
+
+
+def test_raw_view_keeps_legacy_attachments():
+    document = asyncio.run(load_raw_view(Logs(), "abc"))
+    text = LogEntry(document).plain_text()
+    assert "Attachment: https://cdn.example.com/old.png" in text
+    assert "Attachment: https://cdn.example.com/a.png" in text
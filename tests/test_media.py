@@ -0,0 +1,12 @@
+from pathlib import Path
+
+from logviewer.core import media
+
+
+def test_emoji_misses_share_a_budget():
+    proxy = media.MediaProxy(None, None, Path("unused"), max_bytes=0)
+    clients = [f"10.0.0.{i}" for i in range(media.EMOJI_MISS_BURST // 10 + 1)]
+    allowed = sum(not proxy.consume_miss("emoji", client) for client in clients for _ in range(10))
+    assert allowed == media.EMOJI_MISS_BURST
+    # Avatars only count against each client's own budget.
+    assert not proxy.consume_miss("avatar", "10.0.1.1")
@@ -0,0 +1,234 @@
+import asyncio
+import types
+
+from stubs import load_plugin
+
+say = load_plugin("say/say.py", "say")
+
+
+class Partition:
+    """Just enough of a motor collection for the scheduler."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def update_one(self, query, update):
+        if query["_id"] in self.docs:
+            self.docs[query["_id"]].update(update["$set"])
+
+    async def delete_one(self, query):
+        self.docs.pop(query["_id"], None)
+
+    async def find(self, query):
+        for doc in list(self.docs.values()):
+            yield dict(doc)
+
+
+class ServerError(say.discord.HTTPException):
+    def __init__(self):
+        Exception.__init__(self, "503 Service Unavailable")
+
+
+class Channel:
+    id = 1
+    guild = types.SimpleNamespace(me=None)
+
+    def __init__(self):
+        self.sent = []
+        # Sends that fail before they go through.
+        self.failures = 0
+
+    def permissions_for(self, member):
+        return types.SimpleNamespace(send_messages=True)
+
+    async def send(self, text):
+        if self.failures:
+            self.failures -= 1
+            raise ServerError()
+        self.sent.append(text)
+
+
+class Bot:
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.channel = Channel()
+        self.available = True
+
+    async def wait_until_ready(self):
+        await self.ready.wait()
+
+    def get_channel(self, channel_id):
+        return self.channel if self.available else None
+
+
+async def scheduler():
+    bot = Bot()
+    scheduler = say.Scheduler(types.SimpleNamespace(bot=bot, db=Partition()))
+    await scheduler.load()
+    return bot, scheduler
+
+
+async def add(scheduler, text, **kwargs):
+    author = types.SimpleNamespace(id=2)
+    return await scheduler.add(scheduler.cog.bot.channel, author, text, delay=0, **kwargs)
+
+
+def test_waits_until_ready():
+    async def run():
+        bot, s = await scheduler()
+        await add(s, "hello")
+        await asyncio.sleep(0.05)
+        assert bot.channel.sent == []
+        bot.ready.set()
+        await asyncio.sleep(0.05)
+        s.stop()
+        assert bot.channel.sent == ["hello"]
+        assert not s.jobs and not s.cog.db.docs
+
+    asyncio.run(run())
+
+
+def test_keeps_job_while_channel_unavailable(monkeypatch):
+    monkeypatch.setattr(say, "RETRY_DELAY", 0.02)
+
+    async def run():
+        bot, s = await scheduler()
+        bot.ready.set()
+        bot.available = False
+        once = await add(s, "once")
+        recurring = await add(s, "again", interval=3600)
+        await asyncio.sleep(0.05)
+        assert once["_id"] in s.jobs and once["_id"] in s.cog.db.docs
+        assert s.cog.db.docs[recurring["_id"]]["retries"] >= 1
+        bot.available = True
+        await asyncio.sleep(0.05)
+        s.stop()
+        assert sorted(bot.channel.sent) == ["again", "once"]
+        assert list(s.jobs) == [recurring["_id"]]
+        assert s.cog.db.docs[recurring["_id"]]["retries"] == 0
+
+    asyncio.run(run())
+
+
+def test_gives_up_after_retry_limit(monkeypatch):
+    monkeypatch.setattr(say, "RETRY_DELAY", 0.01)
+    monkeypatch.setattr(say, "RETRY_LIMIT", 2)
+
+    async def run():
+        bot, s = await scheduler()
+        bot.ready.set()
+        bot.available = False
+        await add(s, "lost")
+        await asyncio.sleep(0.1)
+        s.stop()
+        assert not s.jobs and not s.cog.db.docs
+
+    asyncio.run(run())
+
+
+def test_keeps_job_until_sent(monkeypatch):
+    monkeypatch.setattr(say, "RETRY_DELAY", 0.02)
+
+    async def run():
+        bot, s = await scheduler()
+        bot.ready.set()
+        bot.channel.failures = 2
+        job = await add(s, "once")
+        await asyncio.sleep(0.03)
+        assert bot.channel.sent == []
+        assert job["_id"] in s.jobs and job["_id"] in s.cog.db.docs
+        await asyncio.sleep(0.05)
+        s.stop()
+        assert bot.channel.sent == ["once"]
+        assert not s.jobs and not s.cog.db.docs
+
+    asyncio.run(run())
+
+
+def test_retries_keep_recurring_slot(monkeypatch):
+    monkeypatch.setattr(say, "RETRY_DELAY", 0.02)
+
+    async def run():
+        bot, s = await scheduler()
+        bot.ready.set()
+        bot.channel.failures = 2
+        job = await add(s, "daily", interval=86400)
+        slot = job["run_at"]
+        await asyncio.sleep(0.1)
+        s.stop()
+        assert bot.channel.sent == ["daily"]
+        assert job["run_at"] == job["slot"] == slot + 86400
+        assert s.cog.db.docs[job["_id"]]["run_at"] == slot + 86400
+
+    asyncio.run(run())
+
+
+def test_cancel_while_sending():
+    class SlowChannel(Channel):
+        async def send(self, text):
+            await asyncio.sleep(0.02)
+            await super().send(text)
+
+    async def run():
+        bot, s = await scheduler()
+        bot.channel = SlowChannel()
+        bot.ready.set()
+        job = await add(s, "again", interval=60)
+        await asyncio.sleep(0.01)
+        assert await s.cancel(job["_id"])
+        await asyncio.sleep(0.03)
+        s.stop()
+        assert bot.channel.sent == ["again"]
+        assert not s.jobs and not s.cog.db.docs
+
+    asyncio.run(run())
+
+
+def test_logs_unexpected_send_errors(caplog, monkeypatch):
+    monkeypatch.setattr(say, "RETRY_DELAY", 0.02)
+
+    async def run():
+        bot, s = await scheduler()
+
+        async def send(text):
+            raise ValueError("unexpected")
+
+        bot.channel.send = send
+        bot.ready.set()
+        job = await add(s, "once")
+        await asyncio.sleep(0.01)
+        s.stop()
+        assert job["_id"] in s.jobs and s.jobs[job["_id"]]["retries"] == 1
+
+    asyncio.run(run())
+    assert "Failed to send scheduled say job" in caplog.text
+
+
+def test_split_lines():
+    lines = [f"line {i}" for i in range(100)]
+    pages = say.split_lines(lines, limit=50)
+    assert all(len(page) <= 50 for page in pages)
+    assert "\n".join(pages).split("\n") == lines
+    assert say.split_lines(["x" * 60], limit=50) == ["x" * 50]
+    assert say.split_lines([]) == []
+
+
+def test_broadcast_records_every_error(caplog):
+    class BrokenChannel(Channel):
+        async def send(self, text):
+            raise ValueError("unexpected")
+
+    async def run():
+        cog = say.Say.__new__(say.Say)
+        channels = [Channel(), BrokenChannel(), Channel()]
+        channels[0].failures = 1
+        return channels, await cog.broadcast(channels, "hello")
+
+    channels, results = asyncio.run(run())
+    assert [channel for channel, _, _ in results] == channels
+    assert [error for _, error, _ in results] == ["503 Service Unavailable", "unexpected", None]
+    assert channels[2].sent == ["hello"]
+    assert "Failed to send message to" in caplog.text
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from logviewer.core.snapshots import SnapshotStore
+
+
+def store(tmp_path, max_bytes=1 << 20, settings=None):
+    templates = tmp_path / "templates"
+    templates.mkdir(exist_ok=True)
+    (templates / "logbase.html").write_text("{{ log_entry }}")
+    snapshots = SnapshotStore(tmp_path / "snapshots", templates, max_bytes=max_bytes, settings=settings)
+    snapshots.load()
+    return snapshots
+
+
+def test_contains_does_not_count_as_served(tmp_path):
+    snapshots = store(tmp_path)
+    asyncio.run(snapshots.save("a", "<p>a</p>"))
+    served_at = snapshots.index["a"][2]
+    time.sleep(0.01)
+    assert "a" in snapshots
+    assert snapshots.index["a"][2] == served_at
+    assert snapshots.get("a") is not None
+    assert snapshots.index["a"][2] > served_at
+
+
+def test_contains_checks_expiry_and_file(tmp_path):
+    snapshots = store(tmp_path)
+
+    async def save():
+        await snapshots.save("expired", "<p>x</p>", expires_at=time.time() - 1)
+        await snapshots.save("deleted", "<p>x</p>")
+
+    asyncio.run(save())
+    snapshots._file("deleted").unlink()
+    assert "expired" not in snapshots
+    assert "deleted" not in snapshots
+    assert "missing" not in snapshots
+
+
+def test_contains_leaves_eviction_order(tmp_path):
+    snapshots = store(tmp_path)
+
+    async def save(key):
+        # Same content, so every snapshot takes the same space.
+        await snapshots.save(key, "<p>x</p>" * 100)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(save("old"))
+    asyncio.run(save("new"))
+    # Backfills and prefetching check membership, they don't serve.
+    assert "old" in snapshots
+    snapshots.max_bytes = snapshots.size
+    asyncio.run(save("newest"))
+    assert "old" not in snapshots
+    assert "new" in snapshots
+
+
+def test_settings_change_invalidates(tmp_path):
+    proxied = {"media_proxy": True, "media_cdn_url": "https://cdn.discordapp.com"}
+    snapshots = store(tmp_path, settings=proxied)
+    asyncio.run(snapshots.save("a", "<img src='/media/avatar/1'>"))
+    assert "a" in store(tmp_path, settings=proxied)
+
+    direct = store(tmp_path, settings={**proxied, "media_proxy": False})
+    assert direct.version != snapshots.version
+    assert "a" not in direct
+    # Kept so the backfill can render them again.
+    assert direct.stale_keys == ["a"]
@@ -0,0 +1,217 @@
+import asyncio
+import struct
+import types
+
+import pytest
+from aiohttp import web
+from stubs import load_plugin
+
+vp = load_plugin("video-preview/video-preview.py", "video_preview")
+
+
+def box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def full_box(kind: bytes, payload: bytes) -> bytes:
+    return box(kind, b"\0\0\0\0" + payload)
+
+
+def trak(handler: bytes, codec: bytes, tkhd: bytes = b"") -> bytes:
+    stsd = full_box(b"stsd", struct.pack(">I", 1) + struct.pack(">I", 16) + codec + b"\0" * 8)
+    hdlr = full_box(b"hdlr", b"\0" * 4 + handler + b"\0" * 12)
+    return box(b"trak", tkhd + box(b"mdia", hdlr + box(b"minf", box(b"stbl", stsd))))
+
+
+def element(element_id: int, payload: bytes) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    assert len(payload) < 127
+    return id_bytes + bytes([0x80 | len(payload)]) + payload
+
+
+MVHD = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 65000) + b"\0" * 80)
+TKHD = full_box(b"tkhd", b"\0" * 72 + struct.pack(">II", 1920 << 16, 1080 << 16))
+# Padded so `moov` spans several of the chunks the server writes.
+MOOV = box(
+    b"moov", MVHD + trak(b"vide", b"avc1", TKHD) + trak(b"soun", b"mp4a") + box(b"free", b"\0" * 20000)
+)
+FTYP = box(b"ftyp", b"isom" + b"\0" * 4)
+
+WEBM_INFO = element(0x2AD7B1, (1000000).to_bytes(3, "big")) + element(0x4489, struct.pack(">f", 12500.0))
+WEBM_VIDEO = element(
+    0xAE,
+    element(0x83, b"\1")
+    + element(0x86, b"V_VP9")
+    + element(0xE0, element(0xB0, (640).to_bytes(2, "big")) + element(0xBA, (360).to_bytes(2, "big"))),
+)
+WEBM_AUDIO = element(0xAE, element(0x83, b"\2") + element(0x86, b"A_OPUS"))
+
+FILES = {
+    # `moov` up front, as written by encoders with "fast start".
+    "fast.mp4": FTYP + MOOV + box(b"mdat", b"\0" * 1000),
+    # `moov` after a large `mdat`, so it takes a second Range request.
+    "slow.mp4": FTYP + box(b"mdat", b"\1" * 300000) + MOOV,
+    "clip.webm": element(0x1A45DFA3, element(0x4282, b"webm"))
+    + bytes.fromhex("18538067")
+    + b"\x01\xff\xff\xff\xff\xff\xff\xff"
+    + element(0x1549A966, WEBM_INFO)
+    + element(0x1654AE6B, WEBM_VIDEO + WEBM_AUDIO)
+    + element(0x1F43B675, b"\0" * 50),
+    "junk.mp4": b"not a video" * 100,
+}
+
+MP4 = {"duration": 65.0, "width": 1920, "height": 1080, "video_codec": "avc1", "audio_codec": "mp4a"}
+WEBM = {"duration": 12.5, "width": 640, "height": 360, "video_codec": "V_VP9", "audio_codec": "A_OPUS"}
+
+
+async def serve(request: web.Request, *, chunk_size: int, ranges: bool) -> web.StreamResponse:
+    """Serves a fixture, optionally honouring Range, written in `chunk_size` pieces."""
+    body = FILES[request.match_info["name"]]
+    status, headers = 200, {}
+    if ranges and request.http_range.start is not None:
+        start, stop = request.http_range.start, min(request.http_range.stop or len(body), len(body))
+        status, headers = 206, {"Content-Range": f"bytes {start}-{stop - 1}/{len(body)}"}
+        body = body[start:stop]
+    response = web.StreamResponse(status=status, headers=headers)
+    response.content_length = len(body)
+    await response.prepare(request)
+    for offset in range(0, len(body), chunk_size):
+        await response.write(body[offset : offset + chunk_size])
+        # Gives the client a chance to read a partial body.
+        await asyncio.sleep(0.001)
+    await response.write_eof()
+    return response
+
+
+async def probe(name: str, *, chunk_size: int = 1 << 20, ranges: bool = True):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get("Range"))
+        return await serve(request, chunk_size=chunk_size, ranges=ranges)
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    prober = vp.Prober()
+    try:
+        attachment = types.SimpleNamespace(
+            id=1, url=f"http://127.0.0.1:{port}/{name}", filename=name, size=len(FILES[name])
+        )
+        info = await prober.probe(attachment)
+    finally:
+        await prober.close()
+        await runner.cleanup()
+    fields = info and {k: getattr(info, k) for k in info.__slots__ if k != "size"}
+    return fields, requests
+
+
+@pytest.mark.parametrize("chunk_size", [1 << 20, 4096, 1000])
+@pytest.mark.parametrize("name, expected", [("fast.mp4", MP4), ("slow.mp4", MP4), ("clip.webm", WEBM)])
+def test_probe(name, expected, chunk_size):
+    info, requests = asyncio.run(probe(name, chunk_size=chunk_size))
+    assert info == expected
+    assert len(requests) <= vp.PROBE_REQUESTS
+    assert all(r and r.startswith("bytes=") for r in requests)
+
+
+@pytest.mark.parametrize("chunk_size", [1 << 20, 4096, 1000])
+def test_probe_reads_whole_range(chunk_size):
+    # The first range covers all of `moov`, however the body is split up.
+    _, requests = asyncio.run(probe("fast.mp4", chunk_size=chunk_size))
+    assert len(requests) == 1
+
+
+def test_probe_moov_at_end_needs_second_request():
+    _, requests = asyncio.run(probe("slow.mp4", chunk_size=4096))
+    assert len(requests) == 2
+
+
+def test_probe_without_range_support():
+    info, requests = asyncio.run(probe("fast.mp4", chunk_size=4096, ranges=False))
+    assert info == MP4
+    assert len(requests) == 1
+
+
+def test_probe_junk():
+    info, _ = asyncio.run(probe("junk.mp4"))
+    assert info is None
+
+
+def test_build_messages_caps_embeds():
+    messages = vp.build_messages(["https://example.com/video.mp4"] * 12)
+    assert [indexes for _, indexes in messages] == [list(range(10)), [10, 11]]
+
+
+class Destination:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def send(self, content, embeds):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(content)
+
+
+def attachments(name):
+    return [types.SimpleNamespace(url=f"https://example.com/{name}.mp4")]
+
+
+async def load_cog(delays):
+    """Loads the cog with a prober that takes `delays[url]` seconds and finds nothing."""
+    cog = vp.VideoPreview(types.SimpleNamespace(main_color=0))
+
+    async def probe_all(batch):
+        await asyncio.sleep(delays.get(batch[0].url, 0))
+        return [None] * len(batch)
+
+    cog.prober.probe_all = probe_all
+    await cog.cog_load()
+    return cog
+
+
+def send(cog, key, destination, batch):
+    cog.pending[key] = (destination, batch)
+    cog.flush(key)
+
+
+def test_sender_survives_errors(caplog):
+    async def run():
+        cog = await load_cog({})
+        broken, working = Destination(ValueError("unexpected")), Destination()
+        send(cog, (1, True), broken, attachments("a"))
+        send(cog, (2, True), working, attachments("b"))
+        await asyncio.sleep(0.01)
+        await cog.cog_unload()
+        return working.sent
+
+    assert asyncio.run(run()) == ["Video Preview (1)\nhttps://example.com/b.mp4"]
+    assert "Failed to send video previews." in caplog.text
+
+
+def test_slow_probe_only_delays_its_thread():
+    async def run():
+        cog = await load_cog({"https://example.com/slow.mp4": 0.1})
+        slow, fast = Destination(), Destination()
+        send(cog, (1, True), slow, attachments("slow"))
+        send(cog, (1, True), slow, attachments("after"))
+        send(cog, (2, True), fast, attachments("fast"))
+        await asyncio.sleep(0.02)
+        sent_early = (list(slow.sent), list(fast.sent))
+        await asyncio.sleep(0.15)
+        await cog.cog_unload()
+        return sent_early, slow.sent
+
+    (slow_early, fast_early), slow_sent = asyncio.run(run())
+    assert fast_early == ["Video Preview (1)\nhttps://example.com/fast.mp4"]
+    assert slow_early == []
+    # Batches of one thread still go out in order.
+    assert slow_sent == [
+        "Video Preview (1)\nhttps://example.com/slow.mp4",
+        "Video Preview (1)\nhttps://example.com/after.mp4",
+    ]
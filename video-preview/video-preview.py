@@ -1,6 +1,11 @@
+import asyncio
 import re
+import struct
+from collections import OrderedDict
 from logging import getLogger
+from typing import Dict, List, Optional, Set, Tuple
 
+import aiohttp
 import discord
 from bot import ModmailBot
 from core.thread import Thread
@@ -10,6 +15,366 @@ logger = getLogger(__name__)
 
 ROLE_MENTION_REGEX = re.compile(r"<@&(?P<id>[0-9]{17,19})>")
 
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+
+# Replies within this many seconds of each other share one preview message.
+COALESCE_WINDOW = 2.0
+
+# How many attachment IDs are remembered, so the same video is never previewed twice.
+SEEN_CACHE_SIZE = 1024
+
+MESSAGE_LIMIT = 2000
+EMBED_LIMIT = 10
+
+# Bytes fetched per Range request, and the most requests spent on one file.
+PROBE_CHUNK = 64 * 1024
+PROBE_REQUESTS = 3
+PROBE_TIMEOUT = 5
+PROBE_CONCURRENCY = 4
+PROBE_CACHE_SIZE = 256
+
+# A `moov` box larger than this isn't fetched, it only holds sample tables past the header.
+MAX_MOOV_SIZE = 1024 * 1024
+
+
+class VideoInfo:
+    """
+    What could be read from a video's headers. Any field may be missing.
+    """
+
+    __slots__ = ("duration", "width", "height", "video_codec", "audio_codec", "size")
+
+    def __init__(self):
+        self.duration: Optional[float] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.video_codec: Optional[str] = None
+        self.audio_codec: Optional[str] = None
+        self.size: Optional[int] = None
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, k) for k in self.__slots__ if k != "size")
+
+
+def parse_mp4_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """
+    Yields `(type, payload_start, box_end)` for the ISO BMFF boxes in `data[start:end]`.
+    Stops at the first box that runs past the data.
+    """
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type.decode("latin-1"), offset + header, offset + size
+        offset += size
+
+
+def parse_moov(data: bytes, info: VideoInfo) -> None:
+    for box_type, start, end in parse_mp4_boxes(data):
+        if box_type == "mvhd":
+            version = data[start]
+            if version == 1:
+                timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", data, start + 12)
+            if timescale:
+                info.duration = duration / timescale
+        elif box_type == "trak":
+            parse_trak(data[start:end], info)
+
+
+def parse_trak(data: bytes, info: VideoInfo) -> None:
+    width = height = 0
+    handler = codec = None
+    boxes = list(parse_mp4_boxes(data))
+    while boxes:
+        box_type, start, end = boxes.pop()
+        if box_type == "tkhd":
+            # Width and height are 16.16 fixed point, the last 8 bytes of the box.
+            width, height = (v >> 16 for v in struct.unpack_from(">II", data, end - 8))
+        elif box_type in ("mdia", "minf", "stbl"):
+            boxes.extend(parse_mp4_boxes(data, start, end))
+        elif box_type == "hdlr":
+            handler = data[start + 8 : start + 12].decode("latin-1")
+        elif box_type == "stsd" and end - start >= 16:
+            # Sample description entry count, then the first entry's size and format.
+            codec = data[start + 12 : start + 16].decode("latin-1").strip()
+    if handler == "vide":
+        info.width, info.height = info.width or width, info.height or height
+        info.video_codec = info.video_codec or codec
+    elif handler == "soun":
+        info.audio_codec = info.audio_codec or codec
+
+
+# Matroska element IDs.
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+
+# Elements whose children are read, the rest are skipped over.
+EBML_MASTERS = (SEGMENT, INFO, TRACKS, TRACK_ENTRY, VIDEO)
+
+
+def read_vint(data: bytes, offset: int, *, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """
+    Reads an EBML variable length integer. Returns `(value, length)`; the
+    value is `None` for the reserved "unknown size".
+    """
+    first = data[offset]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or offset + length > len(data):
+        raise ValueError("Invalid EBML integer.")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[offset + 1 : offset + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def parse_ebml(data: bytes, info: VideoInfo) -> None:
+    scale = 1_000_000
+    duration = None
+    track: Dict[int, object] = {}
+    stack: List[Tuple[int, int]] = []  # (element ID, end offset) of open master elements
+    offset = 0
+    while offset < len(data):
+        while stack and offset >= stack[-1][1]:
+            finish_track(stack.pop()[0], track, info)
+        try:
+            element, id_length = read_vint(data, offset, keep_marker=True)
+            size, size_length = read_vint(data, offset + id_length, keep_marker=False)
+        except (ValueError, IndexError):
+            break
+        start = offset + id_length + size_length
+        end = len(data) if size is None else start + size
+        if element == CLUSTER:
+            break
+        if element in EBML_MASTERS:
+            stack.append((element, end))
+            offset = start
+            continue
+        if end > len(data):
+            break
+        payload = data[start:end]
+        if element == TIMECODE_SCALE:
+            scale = int.from_bytes(payload, "big")
+        elif element == DURATION:
+            duration = struct.unpack(">f" if size == 4 else ">d", payload)[0]
+        elif element in (TRACK_TYPE, PIXEL_WIDTH, PIXEL_HEIGHT):
+            track[element] = int.from_bytes(payload, "big")
+        elif element == CODEC_ID:
+            track[element] = payload.decode("ascii", "replace").rstrip("\x00")
+        offset = end
+    while stack:
+        finish_track(stack.pop()[0], track, info)
+    if duration is not None:
+        info.duration = duration * scale / 1e9
+
+
+def finish_track(element: int, track: Dict[int, object], info: VideoInfo) -> None:
+    if element != TRACK_ENTRY:
+        return
+    if track.get(TRACK_TYPE) == 1:
+        info.video_codec = info.video_codec or track.get(CODEC_ID)
+        info.width = info.width or track.get(PIXEL_WIDTH)
+        info.height = info.height or track.get(PIXEL_HEIGHT)
+    elif track.get(TRACK_TYPE) == 2:
+        info.audio_codec = info.audio_codec or track.get(CODEC_ID)
+    track.clear()
+
+
+class Prober:
+    """
+    Reads video metadata from the first bytes of a file with HTTP Range
+    requests, without downloading it. Results are cached per attachment ID.
+    """
+
+    def __init__(self):
+        self.cache: OrderedDict[int, Optional[VideoInfo]] = OrderedDict()
+        self._semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT))
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def probe_all(self, attachments: List[discord.Attachment]) -> List[Optional[VideoInfo]]:
+        return await asyncio.gather(*(self.probe(a) for a in attachments))
+
+    async def probe(self, attachment: discord.Attachment) -> Optional[VideoInfo]:
+        if attachment.id in self.cache:
+            self.cache.move_to_end(attachment.id)
+            return self.cache[attachment.id]
+        async with self._semaphore:
+            try:
+                info = await asyncio.wait_for(self._probe(attachment.url), timeout=PROBE_TIMEOUT)
+            except Exception as e:
+                logger.debug(f"Failed to probe {attachment.filename}: {type(e).__name__}: {e}")
+                info = None
+        if info is not None:
+            info.size = info.size or attachment.size
+        self.cache[attachment.id] = info
+        if len(self.cache) > PROBE_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return info
+
+    async def fetch(self, url: str, start: int, length: int) -> Tuple[bytes, Optional[int]]:
+        """
+        Fetches `length` bytes from `start`. Returns the bytes and the full size of the file, if known.
+        """
+        headers = {"Range": f"bytes={start}-{start + length - 1}"}
+        async with self.session.get(url, headers=headers) as resp:
+            if resp.status == 206:
+                total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+                return await self._read(resp, length), int(total) if total.isdigit() else None
+            if resp.status == 200 and start == 0:
+                # Range not supported, read just what we asked for and drop the rest.
+                return await self._read(resp, length), resp.content_length
+            raise aiohttp.ClientResponseError(resp.request_info, (), status=resp.status)
+
+    @staticmethod
+    async def _read(resp: aiohttp.ClientResponse, length: int) -> bytes:
+        """
+        Reads up to `length` bytes of the body. A single `read` only returns
+        what has arrived so far, which is less when the body comes in chunks.
+        """
+        data = bytearray()
+        while len(data) < length:
+            chunk = await resp.content.read(length - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    async def _probe(self, url: str) -> Optional[VideoInfo]:
+        data, total = await self.fetch(url, 0, PROBE_CHUNK)
+        info = VideoInfo()
+        info.size = total
+        if data[:4] == EBML_HEADER.to_bytes(4, "big"):
+            parse_ebml(data, info)
+        elif data[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"):
+            await self._probe_mp4(url, data, total, info)
+        else:
+            return None
+        return info if info else None
+
+    async def _probe_mp4(self, url: str, data: bytes, total: Optional[int], info: VideoInfo) -> None:
+        """
+        Walks the top-level boxes until `moov`. When a box runs past the fetched
+        bytes, like a large `mdat` ahead of a `moov` written at the end, the next
+        box is fetched at its offset instead.
+        """
+        base = offset = 0  # file offsets of `data` and of the current box
+        requests = 1
+        while total is None or offset < total:
+            if offset + 16 > base + len(data):
+                if requests >= PROBE_REQUESTS:
+                    return
+                data, _ = await self.fetch(url, offset, PROBE_CHUNK)
+                base, requests = offset, requests + 1
+            header = data[offset - base : offset - base + 16]
+            if len(header) < 8:
+                return
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1 and len(header) == 16:
+                size, header_size = struct.unpack_from(">Q", header, 8)[0], 16
+            if size < header_size:
+                # Zero runs to the end of the file, only `mdat` does that.
+                return
+            if box_type == b"moov":
+                if size > MAX_MOOV_SIZE:
+                    return
+                if offset + size > base + len(data):
+                    if requests >= PROBE_REQUESTS:
+                        return
+                    data, _ = await self.fetch(url, offset, size)
+                    base = offset
+                parse_moov(data[offset - base + header_size : offset - base + size], info)
+                return
+            offset += size
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def build_embed(attachment: discord.Attachment, info: VideoInfo, color: int) -> discord.Embed:
+    embed = discord.Embed(title=attachment.filename, url=attachment.url, color=color)
+    if info.duration:
+        embed.add_field(name="Duration", value=format_duration(info.duration))
+    if info.width and info.height:
+        embed.add_field(name="Resolution", value=f"{info.width}x{info.height}")
+    codecs = " / ".join(c for c in (info.video_codec, info.audio_codec) if c)
+    if codecs:
+        embed.add_field(name="Codecs", value=codecs)
+    if info.size:
+        embed.add_field(name="Size", value=format_size(info.size))
+    return embed
+
+
+def is_video(attachment: discord.Attachment) -> bool:
+    content_type = attachment.content_type or ""
+    return content_type.startswith("video/") or attachment.filename.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def build_messages(urls: List[str]) -> List[Tuple[str, List[int]]]:
+    """
+    Lays out previews for `urls`, split into as many messages as Discord's
+    length and embed limits need. Returns the content of each message with
+    the indexes of the videos in it.
+    """
+    messages, lines, indexes = [], [], []
+    for i, url in enumerate(urls):
+        entry = f"Video Preview ({i + 1})\n{url}"
+        if lines and (len(indexes) == EMBED_LIMIT or len("\n".join(lines + [entry])) > MESSAGE_LIMIT):
+            messages.append(("\n".join(lines), indexes))
+            lines, indexes = [], []
+        lines.append(entry)
+        indexes.append(i)
+    if lines:
+        messages.append(("\n".join(lines), indexes))
+    return messages
+
 
 class VideoPreview(commands.Cog):
     """
@@ -19,31 +384,115 @@ class VideoPreview(commands.Cog):
     def __init__(self, bot: ModmailBot):
         self.bot = bot
         self.interaction = []
+        self.seen: OrderedDict[int, None] = OrderedDict()
+        # Videos waiting for their coalescing window to close, by thread channel and direction.
+        self.pending: Dict[Tuple[int, bool], Tuple[discord.abc.Messageable, List[discord.Attachment]]] = {}
+        # Probed batches waiting to be sent.
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.prober = Prober()
+        self._sender: asyncio.Task = None
+        self._probes: Set[asyncio.Task] = set()
+        # The newest batch being probed for each thread and direction, so batches are sent in order.
+        self._last_probe: Dict[Tuple[int, bool], asyncio.Task] = {}
 
     __author__ = ["raidensakura"]
-    __version__ = "1.0.0"
+    __version__ = "1.1.0"
+
+    async def cog_load(self):
+        self._sender = asyncio.create_task(self.send_previews())
 
     async def cog_unload(self):
         logger.debug("Unloading cog...")
+        if self._sender is not None:
+            self._sender.cancel()
+        for task in self._probes:
+            task.cancel()
+        await self.prober.close()
         for user in self.interaction:
             await self.stop_interaction(user)
 
+    def mark_seen(self, attachment: discord.Attachment) -> bool:
+        """
+        Remembers `attachment`. Returns `False` if it was already previewed.
+        """
+        if attachment.id in self.seen:
+            self.seen.move_to_end(attachment.id)
+            return False
+        self.seen[attachment.id] = None
+        if len(self.seen) > SEEN_CACHE_SIZE:
+            self.seen.popitem(last=False)
+        return True
+
+    def flush(self, key: Tuple[int, bool]) -> None:
+        destination, attachments = self.pending.pop(key)
+        # Each batch is probed in its own task, so a slow CDN only holds up its own previews.
+        # Probes of all batches share the prober's concurrency limit.
+        task = asyncio.create_task(self.probe_batch(destination, attachments, self._last_probe.get(key)))
+        self._probes.add(task)
+        self._last_probe[key] = task
+        task.add_done_callback(lambda task: self._probed(key, task))
+
+    def _probed(self, key: Tuple[int, bool], task: asyncio.Task) -> None:
+        self._probes.discard(task)
+        if self._last_probe.get(key) is task:
+            del self._last_probe[key]
+
+    async def probe_batch(
+        self,
+        destination: discord.abc.Messageable,
+        attachments: List[discord.Attachment],
+        previous: Optional[asyncio.Task],
+    ) -> None:
+        """
+        Probes a batch and queues it for sending, after the batch `previous`
+        of the same thread, if that one is still being probed.
+        """
+        try:
+            infos = await self.prober.probe_all(attachments)
+        except Exception:
+            logger.error("Failed to probe videos.", exc_info=True)
+            infos = [None] * len(attachments)
+        if previous is not None:
+            await asyncio.wait([previous])
+        self.queue.put_nowait((destination, attachments, infos))
+
+    async def send_previews(self):
+        while True:
+            destination, attachments, infos = await self.queue.get()
+            # Anything escaping here would end the sender and every preview after it.
+            try:
+                await self.send_preview(destination, attachments, infos)
+            except Exception:
+                logger.error("Failed to send video previews.", exc_info=True)
+
+    async def send_preview(
+        self,
+        destination: discord.abc.Messageable,
+        attachments: List[discord.Attachment],
+        infos: List[Optional[VideoInfo]],
+    ):
+        for content, indexes in build_messages([a.url for a in attachments]):
+            embeds = [build_embed(attachments[i], infos[i], self.bot.main_color) for i in indexes if infos[i]]
+            try:
+                await destination.send(content, embeds=embeds)
+            except discord.HTTPException:
+                logger.error("Failed to send video preview.", exc_info=True)
+
     @commands.Cog.listener()
     async def on_thread_reply(
         self, thread: Thread, from_mod: bool, message: discord.Message, anon: bool, plain: bool
     ) -> None:
-        if not message.attachments:
+        attachments = [a for a in message.attachments if is_video(a) and self.mark_seen(a)]
+        if not attachments:
             return
 
-        msg = ""
-        for i, attachment in enumerate(message.attachments):
-            if attachment.filename.endswith((".mp4", ".mov", ".avi", ".mkv", ".webm")):
-                msg += f"Video Preview ({i+1})\n{attachment.url}\n"
-
-        if from_mod:
-            await thread.recipient.send(msg)
-        else:
-            await thread.channel.send(msg)
+        key = (thread.channel.id, from_mod)
+        if key in self.pending:
+            self.pending[key][1].extend(attachments)
+            return
+        destination = thread.recipient if from_mod else thread.channel
+        self.pending[key] = (destination, attachments)
+        asyncio.get_running_loop().call_later(COALESCE_WINDOW, self.flush, key)
 
 
 async def setup(bot: ModmailBot) -> None: